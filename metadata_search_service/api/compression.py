@@ -0,0 +1,314 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Negotiated compression of responses"""
+
+import abc
+import asyncio
+import zlib
+from typing import Callable, Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from metadata_search_service.config import Config
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+# media types of responses that are worth compressing
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/msgpack",
+    "text/",
+)
+
+# status codes of responses that never carry a body
+NO_BODY_STATUS_CODES = {204, 304}
+
+
+class Compressor(abc.ABC):
+    """Incremental compressor with a common interface for all encodings."""
+
+    @abc.abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        """Compress a chunk of data, possibly buffering some of it."""
+
+    @abc.abstractmethod
+    def flush(self) -> bytes:
+        """Return all buffered data, so that it can be decompressed already."""
+
+    @abc.abstractmethod
+    def finish(self) -> bytes:
+        """Return all remaining data and end the compressed stream."""
+
+
+class GzipCompressor(Compressor):
+    """Compressor for the 'gzip' encoding."""
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor(Compressor):
+    """Compressor for the 'br' encoding (needs the brotli package)."""
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor(Compressor):
+    """Compressor for the 'zstd' encoding (needs the zstandard package)."""
+
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def get_compressor_factories(config: Config) -> Dict[str, Callable[[], Compressor]]:
+    """
+    Get factories for the compressors of all configured encodings, in order
+    of preference, omitting encodings for which no library is installed.
+
+    Args:
+        config: Config object
+
+    Returns:
+        A dict mapping encodings to compressor factories
+    """
+    available: Dict[str, Callable[[], Compressor]] = {
+        "gzip": lambda: GzipCompressor(config.gzip_level)
+    }
+    if brotli is not None:
+        available["br"] = lambda: BrotliCompressor(config.brotli_quality)
+    if zstandard is not None:
+        available["zstd"] = lambda: ZstdCompressor(config.zstd_level)
+    return {
+        encoding: available[encoding]
+        for encoding in config.compression_encodings
+        if encoding in available
+    }
+
+
+def negotiate_encoding(
+    accept_encoding: Optional[str], supported: List[str]
+) -> Optional[str]:
+    """
+    Choose a content encoding based on the Accept-Encoding header of a request.
+
+    Args:
+        accept_encoding: The value of the Accept-Encoding header
+        supported: The supported encodings, in order of preference
+
+    Returns:
+        The encoding with the highest quality value for the client, preferring
+        encodings listed first on ties, or None if the response should not be
+        encoded
+    """
+    if not accept_encoding:
+        return None
+    qualities: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, parameters = item.partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        parameter, _, value = parameters.partition("=")
+        if parameter.strip().lower() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        if coding:
+            qualities[coding] = quality
+    default = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for encoding in supported:
+        quality = qualities.get(encoding, default)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def is_compressible(headers: Headers) -> bool:
+    """Check whether a response with the given headers may be compressed."""
+    return "content-encoding" not in headers and headers.get(
+        "content-type", ""
+    ).startswith(COMPRESSIBLE_TYPES)
+
+
+def weaken_etag(headers: MutableHeaders) -> None:
+    """
+    Turn a strong entity tag into a weak one, since the encoded representation
+    is only semantically equivalent to the unencoded one.
+    """
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = "W/" + etag
+
+
+def compress_chunk(compressor: Compressor, data: bytes, last: bool) -> bytes:
+    """Compress a chunk of a body and return all compressed data so far."""
+    compressed = compressor.compress(data)
+    if last:
+        return compressed + compressor.finish()
+    return compressed + compressor.flush()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with the best encoding the client
+    accepts. Complete bodies are only compressed above a minimum size, and
+    large ones are compressed in a worker thread to not block the event loop.
+    Streamed bodies are compressed and flushed chunk by chunk.
+    """
+
+    def __init__(self, app: ASGIApp, config: Config):
+        self.app = app
+        self.config = config
+        self.compressor_factories = get_compressor_factories(config)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.compressor_factories:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(
+            Headers(scope=scope).get("accept-encoding"),
+            list(self.compressor_factories),
+        )
+        responder = CompressingResponder(
+            send,
+            encoding=encoding,
+            compressor_factory=(
+                self.compressor_factories[encoding] if encoding else None
+            ),
+            config=self.config,
+        )
+        await self.app(scope, receive, responder.send)
+
+
+class CompressingResponder:
+    """Wraps the send callable of a single response to compress its body."""
+
+    def __init__(
+        self,
+        send: Send,
+        encoding: Optional[str],
+        compressor_factory: Optional[Callable[[], Compressor]],
+        config: Config,
+    ):
+        self._send = send
+        self._encoding = encoding
+        self._compressor_factory = compressor_factory
+        self._config = config
+        self._start: Optional[Message] = None
+        self._compressor: Optional[Compressor] = None
+        self._passthrough = False
+
+    async def send(self, message: Message) -> None:
+        """Send a message of the response, compressing its body if needed."""
+        if message["type"] == "http.response.start":
+            self._start = message
+            return
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+        if self._start is not None:
+            start, self._start = self._start, None
+            await self._start_response(start, message)
+            return
+        compressor = self._compressor
+        if self._passthrough or compressor is None:
+            await self._send(message)
+            return
+        more_body = message.get("more_body", False)
+        body = await self._compress(compressor, message.get("body", b""), not more_body)
+        await self._send({**message, "body": body})
+
+    async def _start_response(self, start: Message, message: Message) -> None:
+        """Decide on the encoding with the first chunk and start the response."""
+        headers = MutableHeaders(raw=start["headers"])
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if start["status"] == 304 and self._encoding is not None:
+            # the client may revalidate a representation that was compressed
+            headers.add_vary_header("Accept-Encoding")
+            weaken_etag(headers)
+        if start["status"] in NO_BODY_STATUS_CODES or not is_compressible(headers):
+            self._passthrough = True
+            await self._send(start)
+            await self._send(message)
+            return
+        headers.add_vary_header("Accept-Encoding")
+        if (
+            self._encoding is None
+            or self._compressor_factory is None
+            or not more_body
+            and len(body) < self._config.compression_min_size
+        ):
+            self._passthrough = True
+            await self._send(start)
+            await self._send(message)
+            return
+
+        compressor = self._compressor = self._compressor_factory()
+        headers["Content-Encoding"] = self._encoding
+        weaken_etag(headers)
+        body = await self._compress(compressor, body, not more_body)
+        if more_body:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(len(body))
+        await self._send(start)
+        await self._send({**message, "body": body})
+
+    async def _compress(self, compressor: Compressor, data: bytes, last: bool) -> bytes:
+        """Compress a chunk of the body, in a worker thread for large data."""
+        if len(data) >= self._config.compression_offload_min_size:
+            return await asyncio.to_thread(compress_chunk, compressor, data, last)
+        return compress_chunk(compressor, data, last)
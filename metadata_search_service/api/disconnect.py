@@ -0,0 +1,67 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cancellation of request handling when the client disconnects"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable
+
+from fastapi import Request
+
+log = logging.getLogger(__name__)
+
+
+class ClientDisconnectedError(Exception):
+    """Raised when the client disconnected before the response was ready."""
+
+
+async def cancel_on_disconnect(
+    request: Request, awaitable: Awaitable, poll_interval: float = 0.1
+) -> Any:
+    """
+    Await the given awaitable, while checking whether the client is still
+    connected. If the client disconnects, the awaitable is cancelled, so that
+    any work on the database is stopped as well.
+
+    Args:
+        request: The request of the client
+        awaitable: The awaitable that computes the response
+        poll_interval: The interval (in seconds) in which to check the connection
+
+    Returns:
+        The result of the awaitable
+
+    Raises:
+        ClientDisconnectedError: If the client disconnected
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                await asyncio.wait({task})
+                log.info(
+                    "Client disconnected, cancelled handling of %s %s",
+                    request.method,
+                    request.url.path,
+                )
+                raise ClientDisconnectedError()
+    finally:
+        if not task.done():
+            task.cancel()
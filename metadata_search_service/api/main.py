@@ -19,18 +19,124 @@ Additional endpoints might be structured in dedicated modules
 (each of them having a sub-router).
 """
 
-from fastapi import Depends, FastAPI, HTTPException
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from ghga_service_chassis_lib.api import configure_app
 
+from metadata_search_service.api.compression import CompressionMiddleware
 from metadata_search_service.api.deps import get_config
+from metadata_search_service.api.disconnect import (
+    ClientDisconnectedError,
+    cancel_on_disconnect,
+)
+from metadata_search_service.api.responses import (
+    ARROW_STREAM_MEDIA_TYPE,
+    JSON_MEDIA_TYPE,
+    MSGPACK_MEDIA_TYPE,
+    TrustedJSONResponse,
+    get_supported_media_types,
+    negotiate_media_type,
+    render_search_result,
+    stream_json_result,
+)
 from metadata_search_service.config import CONFIG, Config
-from metadata_search_service.core.search import perform_search
-from metadata_search_service.models import DocumentType, SearchQuery, SearchResult
+from metadata_search_service.core.admission import SEARCH_ADMISSION, OverloadedError
+from metadata_search_service.core.facet_values import search_facet_values
+from metadata_search_service.core.query import (
+    InvalidFilterError,
+    InvalidParameterError,
+    encode_search_parameters,
+    get_query_fingerprint,
+    get_search_etag,
+    normalize_fields,
+    normalize_search_query,
+    parse_fields_parameter,
+    parse_filter_parameter,
+)
+from metadata_search_service.core.search import (
+    create_search_session,
+    get_session_page,
+    perform_batch_search,
+    perform_federated_search,
+    perform_search,
+    stream_search,
+    stream_session_page,
+)
+from metadata_search_service.core.sessions import SessionNotFoundError
+from metadata_search_service.core.suggest import suggest_terms
+from metadata_search_service.core.synonyms import load_synonyms
+from metadata_search_service.dao.circuit_breaker import DatabaseUnavailableError
+from metadata_search_service.dao.document import QueryTimeoutError
+from metadata_search_service.dao.version import get_data_version
+from metadata_search_service.models import (
+    BatchSearchResult,
+    ContentView,
+    CountMode,
+    DocumentType,
+    Facet,
+    FacetValueMatch,
+    FederatedSearchResult,
+    SearchQuery,
+    SearchResult,
+    SuggestResult,
+)
+
+# pylint: disable=too-many-arguments, too-many-locals
+
+
+async def _admit_search(
+    search_function: Callable[[], Awaitable], expensive: bool, config: Config
+) -> Any:
+    """Run the given search once it has been admitted."""
+    async with SEARCH_ADMISSION.admit(expensive=expensive, config=config):
+        return await search_function()
+
+
+async def _stream_search(
+    search_function: Callable[[], Awaitable], expensive: bool, config: Config
+) -> AsyncIterator[bytes]:
+    """
+    Run the given streamed search once it has been admitted and serialize its
+    result. The admission is held until all hits have been retrieved.
+    """
+    async with SEARCH_ADMISSION.admit(expensive=expensive, config=config):
+        result, hit_batches = await search_function()
+        async for chunk in stream_json_result(result, hit_batches):
+            yield chunk
+
+
+async def _start_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Produce the first chunk of a stream, so that the search runs (and may fail)
+    before the response is started. Returns an iterator over all chunks.
+    """
+    # the anext built-in needs Python 3.10
+    first_chunk = await chunks.__anext__()  # pylint: disable=unnecessary-dunder-call
+
+    async def all_chunks() -> AsyncIterator[bytes]:
+        yield first_chunk
+        async for chunk in chunks:
+            yield chunk
+
+    return all_chunks()
 
-# pylint: disable=too-many-arguments
 
 app = FastAPI()
 configure_app(app, config=CONFIG)
+app.add_middleware(
+    CompressionMiddleware, config=CONFIG  # type: ignore[arg-type, call-arg]
+)
+
+
+@app.on_event("startup")
+def load_search_data() -> None:
+    """Load the data used to process searches, using the effective config."""
+    config = app.dependency_overrides.get(get_config, get_config)()
+    load_synonyms(config)
 
 
 @app.get("/", summary="Index for Metadata Search Service")
@@ -39,39 +145,589 @@ async def index():
     return "Index for Metadata Search Service."
 
 
+def _check_pagination(skip: int, limit: int) -> None:
+    """Check the pagination parameters of a search."""
+    if skip < 0:
+        raise HTTPException(
+            status_code=400,
+            detail="'skip' parameter must be greater than or equal to 0",
+        )
+    if limit < 0:
+        raise HTTPException(
+            status_code=400,
+            detail="'limit' parameter must be greater than or equal to 0",
+        )
+
+
+def _check_limit(limit: int) -> None:
+    """Check the limit of endpoints returning a short list of values."""
+    if not 0 < limit <= 100:
+        raise HTTPException(
+            status_code=400, detail="'limit' parameter must be between 1 and 100"
+        )
+
+
+async def _run_search(
+    request: Request,
+    query: SearchQuery,
+    document_type: DocumentType,
+    return_facets: bool,
+    skip: int,
+    limit: int,
+    count_mode: CountMode,
+    view: ContentView,
+    fields: Optional[List[str]],
+    config: Config,
+    stream: bool = False,
+    session: bool = False,
+    fuzzy: bool = False,
+    highlight: bool = False,
+) -> Any:
+    """
+    Run a search (optionally creating a search session) and translate errors
+    to HTTP errors. If the search is streamed, an iterator over the chunks of
+    the JSON result is returned, and errors while retrieving the hits abort it.
+    """
+    return await _handle_search(
+        request,
+        partial(
+            stream_search
+            if stream
+            else create_search_session
+            if session
+            else perform_search,
+            document_type=document_type,
+            search_query=query.query,
+            filters=query.filters,
+            return_facets=return_facets,
+            skip=skip,
+            limit=limit,
+            count_mode=count_mode,
+            max_time_ms=config.search_max_time_ms,
+            view=view,
+            fields=fields,
+            fuzzy=fuzzy,
+            highlight=highlight,
+            config=config,
+        ),
+        expensive=SEARCH_ADMISSION.is_expensive(return_facets, limit, config),
+        config=config,
+        stream=stream,
+    )
+
+
+async def _handle_search(
+    request: Request,
+    search_function: Callable[[], Awaitable],
+    expensive: bool,
+    config: Config,
+    stream: bool = False,
+) -> Any:
+    """
+    Run a search function, once admitted, until the client disconnects,
+    and translate errors to HTTP errors. A streamed search is run until its
+    first chunk is available and keeps its admission until it is exhausted.
+    """
+    if stream:
+        awaitable = _start_stream(
+            _stream_search(search_function, expensive=expensive, config=config)
+        )
+    else:
+        awaitable = _admit_search(search_function, expensive=expensive, config=config)
+    try:
+        return await cancel_on_disconnect(
+            request, awaitable, poll_interval=config.disconnect_poll_interval_ms / 1000
+        )
+    except ClientDisconnectedError:
+        # nobody is listening anymore (499: client closed request)
+        return Response(status_code=499)
+    except InvalidFilterError as error:
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "message": str(error),
+                "invalid_keys": error.invalid_keys,
+                "allowed_keys": error.allowed_keys,
+            },
+        ) from error
+    except InvalidParameterError as error:
+        raise HTTPException(status_code=400, detail=str(error)) from error
+    except SessionNotFoundError as error:
+        raise HTTPException(status_code=404, detail=str(error)) from error
+    except QueryTimeoutError as error:
+        raise HTTPException(status_code=504, detail=str(error)) from error
+    except DatabaseUnavailableError as error:
+        raise HTTPException(status_code=503, detail=str(error)) from error
+    except OverloadedError as error:
+        raise HTTPException(
+            status_code=503,
+            detail=str(error),
+            headers={"Retry-After": str(error.retry_after)},
+        ) from error
+
+
+FIELDS_DESCRIPTION = (
+    "Comma-separated fields (in dot notation) to include in the content of the"
+    + " hits, taking precedence over the view"
+)
+
+FUZZY_DESCRIPTION = (
+    "Whether to match the words of the query string with typos (in titles,"
+    + " descriptions, names, aliases, types and facet values) instead of"
+    + " running a text search"
+)
+
+HIGHLIGHT_DESCRIPTION = (
+    "Whether to set the context of the hits to snippets of their title, name,"
+    + " alias, type and description, as HTML with the terms of the query"
+    + " string marked as <em> elements"
+)
+
+
 @app.post(
     "/rpc/search",
     summary="Search metadata by keywords and facets",
     response_model=SearchResult,
+    responses={
+        200: {
+            "content": {
+                MSGPACK_MEDIA_TYPE: {},
+                ARROW_STREAM_MEDIA_TYPE: {
+                    "schema": {
+                        "description": (
+                            "One row per hit with flattened columns for the"
+                            + " fields of the content; the other properties of"
+                            + " the result are stored as JSON in the metadata"
+                            + " of the schema"
+                        )
+                    }
+                },
+            }
+        }
+    },
 )
 async def search(
+    request: Request,
     query: SearchQuery,
     document_type: DocumentType,
     return_facets: bool = False,
     skip: int = 0,
     limit: int = 10,
+    count_mode: CountMode = CountMode.EXACT,
+    view: ContentView = ContentView.FULL,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    session: bool = Query(
+        False,
+        description=(
+            "Whether to create a search session, from which further pages"
+            + " can be retrieved without running the search again"
+        ),
+    ),
+    fuzzy: bool = Query(False, description=FUZZY_DESCRIPTION),
+    highlight: bool = Query(False, description=HIGHLIGHT_DESCRIPTION),
     config: Config = Depends(get_config),
 ):
-    """Search metadata based on a given query string and filters."""
-    if skip < 0:
-        raise HTTPException(
-            status_code=400,
-            detail="'skip' parameter must be greater than or equal to 0",
+    """
+    Search metadata based on a given query string and filters.
+
+    The result is returned as JSON, as MessagePack or as Arrow IPC stream,
+    depending on the Accept header (the binary formats need optional packages).
+    Unless fields are given, the Arrow stream holds the fields of the summary view.
+    Large JSON results are streamed, with the hits following all other properties.
+    """
+    _check_pagination(skip, limit)
+    media_type = negotiate_media_type(
+        request.headers.get("accept"), get_supported_media_types()
+    )
+    content_fields = parse_fields_parameter(fields)
+    if media_type == ARROW_STREAM_MEDIA_TYPE and not content_fields:
+        view = ContentView.SUMMARY
+    stream = (
+        config.trusted_output
+        and not session
+        and media_type == JSON_MEDIA_TYPE
+        and (limit == 0 or limit >= config.stream_min_limit)
+    )
+    result = await _run_search(
+        request,
+        query=query,
+        document_type=document_type,
+        return_facets=return_facets,
+        skip=skip,
+        limit=limit,
+        count_mode=count_mode,
+        view=view,
+        fields=content_fields,
+        config=config,
+        stream=stream,
+        session=session,
+        fuzzy=fuzzy,
+        highlight=highlight,
+    )
+    if isinstance(result, Response):
+        return result
+    if stream:
+        return StreamingResponse(result, media_type=JSON_MEDIA_TYPE)
+    if config.trusted_output or media_type != JSON_MEDIA_TYPE:
+        return render_search_result(result, media_type)
+    return result
+
+
+@app.post(
+    "/rpc/search/all",
+    summary="Search metadata of all types by keywords and facets",
+    response_model=FederatedSearchResult,
+)
+async def search_all(
+    request: Request,
+    query: SearchQuery,
+    return_facets: bool = False,
+    limit: int = 5,
+    count_mode: CountMode = CountMode.EXACT,
+    view: ContentView = ContentView.SUMMARY,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    config: Config = Depends(get_config),
+):
+    """
+    Search metadata of all types of documents concurrently, based on a given
+    query string and filters, returning the count, the top hits and optionally
+    the facets per type. Types of documents to which not all filters apply are
+    skipped. All searches share one time budget.
+    """
+    _check_pagination(0, limit)
+    result = await _handle_search(
+        request,
+        partial(
+            perform_federated_search,
+            search_query=query.query,
+            filters=query.filters,
+            return_facets=return_facets,
+            limit=limit,
+            count_mode=count_mode,
+            max_time_ms=config.search_max_time_ms,
+            view=view,
+            fields=parse_fields_parameter(fields),
+            config=config,
+        ),
+        expensive=True,
+        config=config,
+    )
+    if config.trusted_output and not isinstance(result, Response):
+        return TrustedJSONResponse(result)
+    return result
+
+
+@app.post(
+    "/rpc/search/batch",
+    summary="Search metadata by keywords and facets for a batch of queries",
+    response_model=BatchSearchResult,
+)
+async def search_batch(
+    request: Request,
+    queries: List[SearchQuery],
+    document_type: DocumentType,
+    return_facets: bool = False,
+    skip: int = 0,
+    limit: int = 10,
+    count_mode: CountMode = CountMode.EXACT,
+    view: ContentView = ContentView.FULL,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    config: Config = Depends(get_config),
+):
+    """
+    Search metadata based on a batch of query strings and filters, returning
+    the results in the order of the queries. Queries with the same query string
+    share the text search, unless facets or estimated counts are requested.
+    """
+    _check_pagination(skip, limit)
+    result = await _handle_search(
+        request,
+        partial(
+            perform_batch_search,
+            document_type=document_type,
+            queries=queries,
+            return_facets=return_facets,
+            skip=skip,
+            limit=limit,
+            count_mode=count_mode,
+            max_time_ms=config.search_max_time_ms,
+            view=view,
+            fields=parse_fields_parameter(fields),
+            config=config,
+        ),
+        expensive=True,
+        config=config,
+    )
+    if config.trusted_output and not isinstance(result, Response):
+        return TrustedJSONResponse(result)
+    return result
+
+
+@app.post(
+    "/rpc/search/facet_values",
+    summary="Search within the values of a facet",
+    response_model=Facet,
+)
+async def facet_values(
+    request: Request,
+    query: SearchQuery,
+    document_type: DocumentType,
+    facet: str,
+    text: str = "",
+    match: FacetValueMatch = FacetValueMatch.PREFIX,
+    limit: int = 10,
+    config: Config = Depends(get_config),
+):
+    """
+    Search within the values of one facet by prefix or substring, e.g. for
+    facets with too many values to return them all with the search results.
+    The values are counted under the query string and filters of the current
+    search, ignoring filters on the facet itself.
+    """
+    _check_limit(limit)
+    result = await _handle_search(
+        request,
+        partial(
+            search_facet_values,
+            document_type=document_type,
+            facet=facet,
+            text=text,
+            match=match,
+            search_query=query.query,
+            filters=query.filters,
+            limit=limit,
+            max_time_ms=config.facet_values_max_time_ms,
+            config=config,
+        ),
+        expensive=False,
+        config=config,
+    )
+    if config.trusted_output and not isinstance(result, Response):
+        return TrustedJSONResponse(result)
+    return result
+
+
+@app.get(
+    "/search/sessions/{session_id}",
+    summary="Get a page of the hits of a search session",
+    response_model=SearchResult,
+)
+async def search_session_page(
+    request: Request,
+    session_id: str,
+    skip: int = 0,
+    limit: int = 10,
+    config: Config = Depends(get_config),
+):
+    """
+    Get a page of the hits of a search session, as created by
+    ``POST /rpc/search?session=true``. The hits are consistent across pages
+    while the session lives, and facets and count are those of the search
+    that created the session. Large pages are streamed, like large results
+    of ``POST /rpc/search``.
+    """
+    _check_pagination(skip, limit)
+    stream = config.trusted_output and (limit == 0 or limit >= config.stream_min_limit)
+    result = await _handle_search(
+        request,
+        partial(
+            stream_session_page if stream else get_session_page,
+            session_id=session_id,
+            skip=skip,
+            limit=limit,
+            config=config,
+        ),
+        expensive=SEARCH_ADMISSION.is_expensive(False, limit, config),
+        config=config,
+        stream=stream,
+    )
+    if isinstance(result, Response):
+        return result
+    if stream:
+        return StreamingResponse(result, media_type=JSON_MEDIA_TYPE)
+    if config.trusted_output:
+        return TrustedJSONResponse(result)
+    return result
+
+
+@app.get(
+    "/rpc/suggest",
+    summary="Suggest search terms for a prefix",
+    response_model=SuggestResult,
+)
+async def suggest(
+    prefix: str,
+    limit: int = 10,
+    document_type: Optional[DocumentType] = None,
+    config: Config = Depends(get_config),
+):
+    """
+    Suggest search terms starting with the given prefix (or with a word
+    starting with it), taken from titles, accessions, aliases and facet values.
+    Suggestions are served from an in-memory index that is rebuilt when the
+    data in the metadata store changes, so they do not query the store.
+    """
+    _check_limit(limit)
+    try:
+        result = await suggest_terms(
+            prefix,
+            limit=limit,
+            document_type=document_type.value if document_type else None,
+            max_time_ms=config.suggest_max_time_ms,
+            config=config,
         )
-    if limit < 0:
-        raise HTTPException(
-            status_code=400,
-            detail="'limit' parameter must be greater than or equal to 0",
+    except QueryTimeoutError as error:
+        raise HTTPException(status_code=504, detail=str(error)) from error
+    except DatabaseUnavailableError as error:
+        raise HTTPException(status_code=503, detail=str(error)) from error
+    if config.trusted_output:
+        return TrustedJSONResponse(result)
+    return result
+
+
+def _etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """Check whether an entity tag matches an If-None-Match header."""
+    if not if_none_match:
+        return False
+    candidates = [x.strip() for x in if_none_match.split(",")]
+    return "*" in candidates or etag in (
+        x[2:] if x.startswith("W/") else x for x in candidates
+    )
+
+
+def _parse_query_parameters(
+    query: str, filters: List[str], fields: Optional[str]
+) -> Tuple[SearchQuery, Optional[List[str]]]:
+    """Parse and normalize a search query and fields given as query parameters."""
+    try:
+        search_query = normalize_search_query(
+            SearchQuery(
+                query=query, filters=[parse_filter_parameter(x) for x in filters]
+            )
         )
+        content_fields = parse_fields_parameter(fields)
+        if content_fields:
+            content_fields = normalize_fields(content_fields)
+    except InvalidParameterError as error:
+        raise HTTPException(status_code=400, detail=str(error)) from error
+    return search_query, content_fields
 
-    hits, facets, count = await perform_search(
+
+def _get_search_parameters(
+    return_facets: bool,
+    skip: int,
+    limit: int,
+    count_mode: CountMode,
+    view: ContentView,
+    content_fields: Optional[List[str]],
+    fuzzy: bool,
+    highlight: bool,
+) -> Dict[str, Any]:
+    """
+    Get the parameters of a search besides query and document type, as used
+    for the canonical URL and the entity tag. Options that are off are left
+    out, so that adding options does not change the URLs of existing searches.
+    """
+    parameters: Dict[str, Any] = {
+        "return_facets": return_facets,
+        "skip": skip,
+        "limit": limit,
+        "count_mode": count_mode,
+    }
+    if content_fields:
+        parameters["fields"] = ",".join(content_fields)
+    else:
+        parameters["view"] = view
+    if fuzzy:
+        parameters["fuzzy"] = fuzzy
+    if highlight:
+        parameters["highlight"] = highlight
+    return parameters
+
+
+@app.get(
+    "/search",
+    summary="Search metadata by keywords and facets (cacheable)",
+    response_model=SearchResult,
+)
+async def search_cacheable(
+    request: Request,
+    document_type: DocumentType,
+    query: str = "*",
+    filters: List[str] = Query(
+        [], alias="filter", description="Filters in the form 'key:value'"
+    ),
+    return_facets: bool = False,
+    skip: int = 0,
+    limit: int = 10,
+    count_mode: CountMode = CountMode.EXACT,
+    view: ContentView = ContentView.FULL,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    fuzzy: bool = Query(False, description=FUZZY_DESCRIPTION),
+    highlight: bool = Query(False, description=HIGHLIGHT_DESCRIPTION),
+    if_none_match: Optional[str] = Header(None),
+    config: Config = Depends(get_config),
+):
+    """
+    Search metadata based on a given query string and filters, with the same
+    semantics as ``POST /rpc/search``. Responses carry an entity tag derived
+    from the data version and the query, so they can be cached and revalidated.
+    """
+    _check_pagination(skip, limit)
+    search_query, content_fields = _parse_query_parameters(query, filters, fields)
+    parameters = _get_search_parameters(
+        return_facets=return_facets,
+        skip=skip,
+        limit=limit,
+        count_mode=count_mode,
+        view=view,
+        content_fields=content_fields,
+        fuzzy=fuzzy,
+        highlight=highlight,
+    )
+    headers = {
+        "Content-Location": request.url.path
+        + "?"
+        + encode_search_parameters(
+            search_query, document_type=document_type, **parameters
+        ),
+        "Cache-Control": config.search_cache_control,
+    }
+    try:
+        data_version = await get_data_version(config)
+    except DatabaseUnavailableError:
+        data_version = None
+    if data_version is not None:
+        fingerprint = get_query_fingerprint(document_type, search_query, **parameters)
+        headers["ETag"] = get_search_etag(fingerprint, data_version)
+        if _etag_matches(headers["ETag"], if_none_match):
+            return Response(status_code=304, headers=headers)
+
+    result = await _run_search(
+        request,
+        query=search_query,
         document_type=document_type,
-        search_query=query.query,
-        filters=query.filters,
         return_facets=return_facets,
         skip=skip,
         limit=limit,
+        count_mode=count_mode,
+        view=view,
+        fields=content_fields,
         config=config,
+        fuzzy=fuzzy,
+        highlight=highlight,
+    )
+    if isinstance(result, Response):
+        return result
+    if (
+        result["stale"]
+        or data_version is None
+        or not (result["facets_complete"] and result["count_complete"])
+    ):
+        # incomplete results must not be cached or revalidated
+        headers = {"Cache-Control": "no-cache"}
+    if config.trusted_output:
+        return TrustedJSONResponse(result, headers=headers)
+    return JSONResponse(
+        jsonable_encoder(SearchResult.parse_obj(result)), headers=headers
     )
-    response = {"facets": facets, "count": count, "hits": hits}
-    return response
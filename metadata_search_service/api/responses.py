@@ -0,0 +1,267 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fast serialization of trusted responses in JSON and binary formats"""
+
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import orjson
+from fastapi import Response
+
+from metadata_search_service.core.utils import encode_bson
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import pyarrow
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+# pylint: disable=no-member
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def dump_json(content: Any) -> bytes:
+    """
+    Serialize content to JSON using orjson.
+
+    Args:
+        content: The content to serialize
+
+    Returns:
+        The JSON document
+    """
+    return orjson.dumps(content, default=encode_bson, option=orjson.OPT_NON_STR_KEYS)
+
+
+class TrustedJSONResponse(Response):
+    """
+    A JSON response for content that is trusted to match the response model,
+    so that it is serialized directly without validation by pydantic.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dump_json(content)
+
+
+async def stream_json_result(
+    result: Dict, hit_batches: AsyncIterator[List[Dict]]
+) -> AsyncIterator[bytes]:
+    """
+    Serialize a search result to JSON incrementally, emitting all properties
+    of the result first and then the hits, batch by batch.
+
+    Args:
+        result: The search result without hits
+        hit_batches: An async iterator over batches of hits
+
+    Yields:
+        The chunks of the JSON document
+    """
+    prefix = dump_json(result)[:-1]
+    yield prefix + (b',"hits":[' if result else b'"hits":[')
+    separator = b""
+    async for hits in hit_batches:
+        if hits:
+            yield separator + b",".join(dump_json(hit) for hit in hits)
+            separator = b","
+    yield b"]}"
+
+
+class MessagePackResponse(Response):
+    """A MessagePack response (needs the msgpack package)."""
+
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content, default=encode_bson)
+
+
+def flatten_document(document: Dict, prefix: str = "") -> Dict[str, Any]:
+    """
+    Flatten nested documents into a single level, using dot notation for
+    the keys of nested fields. Lists are kept as they are.
+
+    Args:
+        document: The document to flatten
+        prefix: The prefix of the keys
+
+    Returns:
+        The flattened document
+    """
+    flattened: Dict[str, Any] = {}
+    for key, value in document.items():
+        if isinstance(value, dict):
+            flattened.update(flatten_document(value, prefix=f"{prefix}{key}."))
+        else:
+            flattened[f"{prefix}{key}"] = value
+    return flattened
+
+
+def _build_arrow_column(values: List[Any]) -> Any:
+    """Build an Arrow array, falling back to strings for mixed types."""
+    try:
+        return pyarrow.array(values)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        return pyarrow.array(
+            [
+                None
+                if value is None
+                else value
+                if isinstance(value, str)
+                else dump_json(value).decode("utf8")
+                for value in values
+            ],
+            type=pyarrow.string(),
+        )
+
+
+def build_arrow_table(result: Dict) -> Any:
+    """
+    Build an Arrow table from a search result, with one row per hit and one
+    flattened column per field of the content, plus a column for the context
+    if any hit has one. Facets and count are stored in the metadata of the
+    schema.
+
+    Args:
+        result: The search result
+
+    Returns:
+        The Arrow table
+    """
+    rows = [
+        {
+            "document_type": hit["document_type"],
+            "id": hit["id"],
+            **({"context": hit["context"]} if hit.get("context") else {}),
+            **{
+                key: value
+                for key, value in flatten_document(hit["content"] or {}).items()
+                if key not in {"document_type", "id", "context"}
+            },
+        }
+        for hit in result["hits"]
+    ]
+    names: Dict[str, None] = dict.fromkeys(["document_type", "id"])
+    for row in rows:
+        names.update(dict.fromkeys(row))
+    columns = [_build_arrow_column([row.get(name) for row in rows]) for name in names]
+    metadata = {key: dump_json(value) for key, value in result.items() if key != "hits"}
+    return pyarrow.Table.from_arrays(columns, names=list(names), metadata=metadata)
+
+
+class ArrowStreamResponse(Response):
+    """
+    A search result in the Arrow IPC streaming format
+    (needs the pyarrow package).
+    """
+
+    media_type = ARROW_STREAM_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        table = build_arrow_table(content)
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+
+def get_supported_media_types() -> List[str]:
+    """
+    Get the media types in which search results can be returned, in order of
+    preference, omitting formats for which no library is installed.
+    """
+    media_types = [JSON_MEDIA_TYPE]
+    if msgpack is not None:
+        media_types.append(MSGPACK_MEDIA_TYPE)
+    if pyarrow is not None:
+        media_types.append(ARROW_STREAM_MEDIA_TYPE)
+    return media_types
+
+
+def _parse_accept(accept: str) -> List[Tuple[str, float]]:
+    """Parse the media ranges and their quality values of an Accept header."""
+    ranges = []
+    for item in accept.split(","):
+        media_range, *parameters = item.split(";")
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_range.strip():
+            ranges.append((media_range.strip().lower(), quality))
+    return ranges
+
+
+def negotiate_media_type(accept: Optional[str], supported: List[str]) -> str:
+    """
+    Choose the media type of a response based on the Accept header of a request.
+
+    Args:
+        accept: The value of the Accept header
+        supported: The supported media types, in order of preference
+
+    Returns:
+        The supported media type with the highest quality value, as given by
+        the most specific matching media range, preferring media types listed
+        first on ties. The first media type is used if none is acceptable.
+    """
+    if not accept:
+        return supported[0]
+    ranges = _parse_accept(accept)
+    best, best_quality = supported[0], 0.0
+    for media_type in supported:
+        main_type = media_type.split("/")[0]
+        matches = {
+            media_range: quality
+            for media_range, quality in ranges
+            if media_range in {media_type, f"{main_type}/*", "*/*"}
+        }
+        for media_range in (media_type, f"{main_type}/*", "*/*"):
+            if media_range in matches:
+                if matches[media_range] > best_quality:
+                    best, best_quality = media_type, matches[media_range]
+                break
+    return best
+
+
+def render_search_result(result: Dict, media_type: str) -> Response:
+    """
+    Render a trusted search result in the given media type.
+
+    Args:
+        result: The search result
+        media_type: One of the supported media types
+
+    Returns:
+        The response
+    """
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return MessagePackResponse(result)
+    if media_type == ARROW_STREAM_MEDIA_TYPE:
+        return ArrowStreamResponse(result)
+    return TrustedJSONResponse(result)
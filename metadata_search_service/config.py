@@ -15,6 +15,8 @@
 
 """Config Parameter Modeling and Parsing"""
 
+from typing import List, Optional
+
 from ghga_service_chassis_lib.api import ApiConfigBase
 from ghga_service_chassis_lib.config import config_from_yaml
 
@@ -29,6 +31,109 @@ class Config(ApiConfigBase):
     # are inherited from PubSubConfigBase;
     db_url: str = "mongodb://localhost:27017"
     db_name: str = "metadata-store"
+    # time (in milliseconds) to wait for a suitable MongoDB server
+    db_server_selection_timeout_ms: int = 5000
+    # the data version (used to invalidate caches) is re-checked at most
+    # once per interval (in seconds)
+    data_version_refresh_interval: int = 30
+    # field holding the time of the last change of a document, set by the
+    # ingestion on every write (should be indexed), so that documents updated
+    # in place change the data version; without it, in-place updates are only
+    # picked up if the data version is invalidated
+    data_version_update_field: Optional[str] = None
+    # maximum number of referenced documents (e.g. studies or projects)
+    # that are cached in memory to resolve nested filters
+    reference_cache_max_entries: int = 50000
+    # JSON file with a list of groups of synonymous terms (e.g. alternative
+    # names of a disease), loaded at startup to expand query strings and
+    # filters on phenotypic feature concept names
+    synonyms_file: Optional[str] = None
+    # number of hits after which counting stops if the count mode is 'capped'
+    count_cap: int = 10000
+    # time budget (in milliseconds) for the queries of a search via
+    # /rpc/search; facets and count are dropped if they exceed it (0 = no limit)
+    search_max_time_ms: int = 10000
+    # time budgets (in milliseconds) of /rpc/search/facet_values and /rpc/suggest,
+    # which answer while the user is typing; they include waiting for the first
+    # build of the in-memory indexes these endpoints use (0 = no limit)
+    facet_values_max_time_ms: int = 2000
+    suggest_max_time_ms: int = 500
+    # interval (in milliseconds) in which to check whether the client of a
+    # running search disconnected, in which case the search is cancelled
+    disconnect_poll_interval_ms: int = 100
+    # admission control: maximum number of concurrently running and of queued
+    # searches, separately for cheap searches (no facets and a limit of at
+    # most cheap_search_max_limit) and expensive ones; searches are rejected
+    # with 503 if the queue is full or if they waited too long (in milliseconds)
+    search_max_concurrent: int = 32
+    search_max_queued: int = 64
+    expensive_search_max_concurrent: int = 8
+    expensive_search_max_queued: int = 16
+    cheap_search_max_limit: int = 20
+    search_max_queue_wait_ms: int = 5000
+    # value of the Retry-After header (in seconds) when rejecting searches
+    overload_retry_after: int = 1
+    # the circuit breaker opens after this many consecutive failures of the
+    # metadata store and lets a trial request through after the reset timeout
+    # (in seconds); while it is not closed, cached results are served as stale
+    circuit_breaker_failure_threshold: int = 5
+    circuit_breaker_reset_timeout: int = 30
+    # maximum number of search results kept to be served while the
+    # metadata store is unavailable
+    result_cache_max_entries: int = 1000
+    # results with more hits than this (e.g. unpaginated searches) are not
+    # cached, which bounds the memory used by the result cache
+    result_cache_max_hits: int = 100
+    # maximum number of queries remembered to have no hits, which are then
+    # answered without querying the metadata store (until the data changes)
+    negative_cache_max_entries: int = 100000
+    # Cache-Control header of responses of the cacheable GET /search endpoint
+    search_cache_control: str = "public, max-age=60, must-revalidate"
+    # serialize search results directly (using orjson) instead of validating
+    # them against the response model first
+    trusted_output: bool = True
+    # JSON search results and pages of search sessions with at least this many
+    # hits per page (or all hits, i.e. limit=0) are streamed, retrieving the hits
+    # in batches of the given size
+    stream_min_limit: int = 100
+    hydration_batch_size: int = 100
+    # search sessions hold the ordered ids of all hits of a search for cheap
+    # paging: time to live (in seconds) since the last access, maximum number
+    # of hits of a search to create a session for, and maximum number of ids
+    # held by all sessions
+    search_session_ttl: int = 300
+    search_session_max_hits: int = 100000
+    search_session_max_ids: int = 1000000
+    # maximum number of queries in a batch search and how many
+    # (groups of) them are run concurrently
+    batch_search_max_queries: int = 50
+    batch_search_max_concurrency: int = 4
+    # number of entries of the suggest index matching a prefix, above which
+    # the top suggestions for the prefix are ranked once and kept, bounding
+    # the time spent on very short prefixes
+    suggest_max_scan: int = 1000
+    # maximum number of values of a facet matching a text that are counted
+    # under the filters of a search (the most frequent ones overall)
+    facet_value_max_candidates: int = 1000
+    # fuzzy searches: maximum number of indexed words matched per query term,
+    # and maximum number of documents a fuzzy query may match
+    fuzzy_max_expansions: int = 50
+    fuzzy_max_ids: int = 10000
+    # context of search hits (if requested): maximum number of snippets per
+    # hit and maximum length of each snippet (in characters)
+    highlight_max_snippets: int = 3
+    highlight_snippet_length: int = 160
+    # response compression: encodings offered in order of preference if the
+    # client accepts them ('br' needs the brotli and 'zstd' the zstandard
+    # package), minimum body size (in bytes) to compress, and body size from
+    # which compression runs in a worker thread instead of the event loop
+    compression_encodings: List[str] = ["zstd", "br", "gzip"]
+    compression_min_size: int = 1024
+    compression_offload_min_size: int = 65536
+    # compression levels of the individual encodings
+    gzip_level: int = 6
+    brotli_quality: int = 4
+    zstd_level: int = 3
 
 
 CONFIG = Config()
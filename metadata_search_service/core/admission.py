@@ -0,0 +1,152 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Admission control and load shedding for searches"""
+
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Optional
+
+from metadata_search_service.config import CONFIG, Config
+
+
+class OverloadedError(Exception):
+    """Raised when a search is rejected because the service is overloaded."""
+
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__("Too many concurrent searches, please retry later")
+
+
+class ConcurrencyLimiter:
+    """
+    Limits the number of concurrently running operations, with a bounded
+    queue of operations waiting for a slot. Slots are handed over to
+    waiting operations in FIFO order.
+    """
+
+    def __init__(self):
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        """The number of operations waiting for a slot."""
+        return len(self._waiters)
+
+    async def acquire(
+        self, max_concurrent: int, max_queued: int, timeout: Optional[float] = None
+    ) -> bool:
+        """
+        Acquire a slot, waiting for one to become available if necessary.
+
+        Args:
+            max_concurrent: The maximum number of concurrent operations
+            max_queued: The maximum number of waiting operations
+            timeout: The maximum time (in seconds) to wait for a slot
+
+        Returns:
+            Whether or not a slot was acquired
+        """
+        if self.active < max_concurrent and not self._waiters:
+            self.active += 1
+            return True
+        if len(self._waiters) >= max_queued:
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as error:
+            if waiter.done():
+                # the slot was handed over in the meantime
+                self.release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(error, asyncio.CancelledError):
+                raise
+            return False
+        return True
+
+    def release(self) -> None:
+        """Release a slot, handing it over to the next waiting operation."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class AdmissionController:
+    """
+    Admission control for searches, with separate limits for cheap
+    and for expensive searches.
+    """
+
+    def __init__(self):
+        self.cheap = ConcurrencyLimiter()
+        self.expensive = ConcurrencyLimiter()
+
+    @staticmethod
+    def is_expensive(return_facets: bool, limit: int, config: Config = CONFIG) -> bool:
+        """
+        Check whether a search is expensive, i.e. it computes facets
+        or retrieves a large page of hits.
+
+        Args:
+            return_facets: Whether or not to facet
+            limit: The total number of documents to retrieve
+            config: The config
+
+        Returns:
+            Whether or not the search is expensive
+        """
+        return return_facets or limit == 0 or limit > config.cheap_search_max_limit
+
+    @asynccontextmanager
+    async def admit(self, expensive: bool, config: Config = CONFIG) -> AsyncIterator:
+        """
+        Admit a search, waiting in the queue if all slots are taken.
+
+        Args:
+            expensive: Whether or not the search is expensive
+            config: The config
+
+        Raises:
+            OverloadedError: If the queue is full or the search waited too long
+        """
+        if expensive:
+            limiter = self.expensive
+            max_concurrent = config.expensive_search_max_concurrent
+            max_queued = config.expensive_search_max_queued
+        else:
+            limiter = self.cheap
+            max_concurrent = config.search_max_concurrent
+            max_queued = config.search_max_queued
+        admitted = await limiter.acquire(
+            max_concurrent, max_queued, timeout=config.search_max_queue_wait_ms / 1000
+        )
+        if not admitted:
+            raise OverloadedError(retry_after=config.overload_retry_after)
+        try:
+            yield
+        finally:
+            limiter.release()
+
+
+SEARCH_ADMISSION = AdmissionController()
@@ -0,0 +1,220 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Search within the values of a facet, backed by per-facet value dictionaries"""
+
+from bisect import bisect_left
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from metadata_search_service.config import CONFIG, Config
+from metadata_search_service.core.query import (
+    InvalidParameterError,
+    normalize_search_query,
+    validate_filters,
+)
+from metadata_search_service.core.utils import DEFAULT_FACET_FIELDS, format_facet_key
+from metadata_search_service.core.versioned import VersionedIndex
+from metadata_search_service.dao.document import count_facet_values
+from metadata_search_service.dao.terms import get_field_value_counts
+from metadata_search_service.models import FacetValueMatch, SearchQuery
+
+# pylint: disable=too-many-arguments
+
+
+class FacetValueDictionary:
+    """
+    The values of a facet with the number of documents having them, sorted
+    case-insensitively, so that values with a given prefix are found by
+    bisection and values containing a given text by a scan over the keys.
+    """
+
+    def __init__(self, counts: Dict[str, int]):
+        entries = sorted((value.casefold(), value) for value in counts)
+        self._keys = [key for key, _ in entries]
+        self._values = [value for _, value in entries]
+        self._counts = [counts[value] for value in self._values]
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def find(
+        self, text: str, match: FacetValueMatch, limit: int
+    ) -> List[Tuple[str, int]]:
+        """
+        Find the values of the facet matching a text, the most frequent ones first.
+
+        Args:
+            text: The text to match case-insensitively (all values match
+                an empty text)
+            match: Whether values have to start with or only contain the text
+            limit: The maximum number of values
+
+        Returns:
+            The matching values with the number of documents having them
+        """
+        key = text.casefold()
+        positions: Iterable[int]
+        if match == FacetValueMatch.PREFIX:
+            start = bisect_left(self._keys, key)
+            end = bisect_left(self._keys, key + "\U0010ffff", lo=start)
+            positions = range(start, end)
+        else:
+            positions = [x for x, other in enumerate(self._keys) if key in other]
+        ranked = sorted(positions, key=lambda x: (-self._counts[x], self._keys[x]))
+        return [(self._values[x], self._counts[x]) for x in ranked[:limit]]
+
+
+async def build_facet_value_dictionary(
+    document_type: str, field: str, config: Config = CONFIG
+) -> FacetValueDictionary:
+    """
+    Build the value dictionary of a facet from the metadata store.
+
+    Args:
+        document_type: The type of document
+        field: The facet field
+        config: The config
+
+    Returns:
+        The value dictionary
+
+    Raises:
+        DatabaseUnavailableError: If the metadata store is not available
+    """
+    counts = await get_field_value_counts(document_type, [field], config=config)
+    return FacetValueDictionary({value: count for (_, value), count in counts.items()})
+
+
+class FacetValueStore:
+    """The value dictionaries of all facets, each built on first use."""
+
+    def __init__(self):
+        self._dictionaries: Dict[Tuple[str, str], VersionedIndex] = {}
+
+    async def get(
+        self,
+        document_type: str,
+        field: str,
+        config: Config = CONFIG,
+        max_time_ms: Optional[int] = None,
+    ) -> FacetValueDictionary:
+        """
+        Get the current value dictionary of a facet.
+
+        Args:
+            document_type: The type of document
+            field: The facet field
+            config: The config
+            max_time_ms: The time in milliseconds to wait for the dictionary
+                if it has not been built yet
+
+        Returns:
+            The value dictionary
+
+        Raises:
+            QueryTimeoutError: If the dictionary has not been built yet
+                and could not be built within ``max_time_ms``
+            DatabaseUnavailableError: If the metadata store is not available
+                and the dictionary has not been built yet
+        """
+        key = (document_type, field)
+        if key not in self._dictionaries:
+            self._dictionaries[key] = VersionedIndex(
+                partial(build_facet_value_dictionary, document_type, field),
+                name=f"value dictionary of facet '{field}' of {document_type}",
+            )
+        return await self._dictionaries[key].get(config, max_time_ms=max_time_ms)
+
+
+FACET_VALUES = FacetValueStore()
+
+
+async def search_facet_values(
+    document_type: str,
+    facet: str,
+    text: str = "",
+    match: FacetValueMatch = FacetValueMatch.PREFIX,
+    search_query: str = "*",
+    filters: Optional[List] = None,
+    limit: int = 10,
+    max_time_ms: Optional[int] = None,
+    config: Config = CONFIG,
+) -> Dict:
+    """
+    Search within the values of a facet, with the number of hits of a search
+    per value. Candidate values are taken from the value dictionary of the
+    facet, so only they are counted under the query and the filters of the
+    search, and without any, the counts of the dictionary are used directly.
+    Filters on the facet itself are ignored, since filters on the same field
+    are combined with OR, so that their values can be chosen among all values
+    matching the rest of the search.
+
+    Args:
+        document_type: The type of document
+        facet: The facet field
+        text: The text to match the values against
+        match: Whether values have to start with or only contain the text
+        search_query: The search query string of the search
+        filters: The filters of the search
+        limit: The maximum number of values
+        max_time_ms: The time budget in milliseconds, for building the value
+            dictionary (if there is none yet) and for counting
+        config: The config
+
+    Returns:
+        The facet with the matching values that occur in any hit,
+        the most frequent ones first
+
+    Raises:
+        InvalidParameterError: If the field is not a facet of the given type
+            of document
+        InvalidFilterError: If any filter refers to a field that cannot be filtered on
+        QueryTimeoutError: If the value dictionary could not be built or the values
+            could not be counted within max_time_ms
+        DatabaseUnavailableError: If the metadata store is not available
+    """
+    if facet not in DEFAULT_FACET_FIELDS[document_type]:
+        raise InvalidParameterError(
+            f"'{facet}' is not a facet of document type '{document_type}'"
+        )
+    normalized_query = normalize_search_query(
+        SearchQuery(query=search_query, filters=filters)
+    )
+    validate_filters(document_type, normalized_query.filters)
+    other_filters = [x for x in normalized_query.filters or [] if x.key != facet]
+    dictionary = await FACET_VALUES.get(
+        document_type, facet, config, max_time_ms=max_time_ms
+    )
+    if normalized_query.query == "*" and not other_filters:
+        options = dictionary.find(text, match, limit)
+    else:
+        candidates = dictionary.find(text, match, config.facet_value_max_candidates)
+        counts = await count_facet_values(
+            document_type,
+            facet,
+            [value for value, _ in candidates],
+            search_query=normalized_query.query,
+            filters=other_filters,
+            max_time_ms=max_time_ms,
+            config=config,
+        )
+        options = sorted(counts.items(), key=lambda x: (-x[1], x[0].casefold()))
+        options = options[:limit]
+    return {
+        "key": facet,
+        "name": format_facet_key(facet),
+        "options": [{"option": value, "count": count} for value, count in options],
+    }
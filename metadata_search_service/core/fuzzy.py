@@ -0,0 +1,245 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Typo-tolerant matching of query terms backed by a character trigram index"""
+
+import asyncio
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Mapping, Optional, Set
+
+from metadata_search_service.config import CONFIG, Config
+from metadata_search_service.core.query import (
+    InvalidParameterError,
+    normalize_search_query,
+)
+from metadata_search_service.core.utils import DEFAULT_FACET_FIELDS, TEXT_FIELDS
+from metadata_search_service.core.versioned import VersionedIndex
+from metadata_search_service.dao.terms import get_document_texts
+from metadata_search_service.models import FilterOption, SearchQuery
+
+# Fields matched by fuzzy searches, per document type
+FUZZY_FIELDS: Dict[str, Set[str]] = {
+    document_type: TEXT_FIELDS | facet_fields
+    for document_type, facet_fields in DEFAULT_FACET_FIELDS.items()
+}
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class FuzzyQueryError(InvalidParameterError):
+    """Raised when a fuzzy query matches too many documents."""
+
+
+def tokenize(text: str) -> List[str]:
+    """Split a text into case-folded words."""
+    return WORD_PATTERN.findall(text.casefold())
+
+
+def get_trigrams(word: str) -> Set[str]:
+    """Get the character trigrams of a word, padded to mark its start and end."""
+    padded = f"\x00{word}\x00"
+    return {padded[x : x + 3] for x in range(len(padded) - 2)}
+
+
+def get_max_typos(word: str) -> int:
+    """Get the number of typos tolerated in a query term of the given length."""
+    if len(word) < 3:
+        return 0
+    if len(word) < 6:
+        return 1
+    return 2
+
+
+def edit_distance(first: str, second: str, max_distance: int) -> int:
+    """
+    Compute the edit distance between two words, counting insertions,
+    deletions, substitutions and transpositions of adjacent characters.
+
+    Args:
+        first: A word
+        second: Another word
+        max_distance: The distance from which on the exact distance is irrelevant
+
+    Returns:
+        The edit distance, or max_distance + 1 if it exceeds max_distance
+    """
+    if abs(len(first) - len(second)) > max_distance:
+        return max_distance + 1
+    previous: List[int] = []
+    current = list(range(len(second) + 1))
+    for i, char in enumerate(first, 1):
+        before, previous, current = previous, current, [i] + [0] * len(second)
+        for j, other in enumerate(second, 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char != other),
+            )
+            if i > 1 and j > 1 and char == second[j - 2] and first[i - 2] == other:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+    return min(current[-1], max_distance + 1)
+
+
+class FuzzyIndex:
+    """
+    An index of the words in the texts of a set of documents. Words similar
+    to a query term are found by counting the trigrams they share with it
+    (merging the posting lists of the trigrams of the term), and verifying
+    the candidates sharing enough trigrams by their edit distance.
+    """
+
+    def __init__(self, texts: Mapping[str, Iterable[str]]):
+        documents: Dict[str, Set[str]] = {}
+        for document_id, document_texts in texts.items():
+            for text in document_texts:
+                for word in tokenize(text):
+                    documents.setdefault(word, set()).add(document_id)
+        self._words = sorted(documents)
+        self._documents = [documents[word] for word in self._words]
+        self._postings: Dict[str, List[int]] = {}
+        for number, word in enumerate(self._words):
+            for trigram in get_trigrams(word):
+                self._postings.setdefault(trigram, []).append(number)
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def match_word(self, term: str, max_expansions: int) -> List[str]:
+        """
+        Find the indexed words matching a query term with few enough typos.
+
+        Args:
+            term: The (case-folded) query term
+            max_expansions: The maximum number of words to match
+
+        Returns:
+            The matching words, the most similar and frequent ones first
+        """
+        return [self._words[x] for x in self._match(term, max_expansions)]
+
+    def _match(self, term: str, max_expansions: int) -> List[int]:
+        """Find the numbers of the indexed words matching a query term."""
+        max_typos = get_max_typos(term)
+        trigrams = get_trigrams(term)
+        # each typo changes at most three of the trigrams of the term
+        min_shared = max(1, len(trigrams) - 3 * max_typos)
+        shared = Counter(
+            number for trigram in trigrams for number in self._postings.get(trigram, ())
+        )
+        matches = []
+        for number, count in shared.items():
+            if count < min_shared:
+                continue
+            distance = edit_distance(term, self._words[number], max_typos)
+            if distance <= max_typos:
+                matches.append((distance, -len(self._documents[number]), number))
+        matches.sort()
+        return [number for _, _, number in matches[:max_expansions]]
+
+    def search(self, query: str, max_expansions: int) -> Set[str]:
+        """
+        Find the documents containing any term of a query, tolerating typos.
+
+        Args:
+            query: The query string
+            max_expansions: The maximum number of words matched per term
+
+        Returns:
+            The ids of the matching documents
+        """
+        document_ids: Set[str] = set()
+        for term in set(tokenize(query)):
+            for number in self._match(term, max_expansions):
+                document_ids.update(self._documents[number])
+        return document_ids
+
+
+async def build_fuzzy_indexes(config: Config = CONFIG) -> Dict[str, FuzzyIndex]:
+    """
+    Build the fuzzy indexes of all types of documents from the metadata store.
+
+    Args:
+        config: The config
+
+    Returns:
+        A dict mapping the types of documents to their fuzzy index
+
+    Raises:
+        DatabaseUnavailableError: If the metadata store is not available
+    """
+    document_types = sorted(FUZZY_FIELDS)
+    texts = await asyncio.gather(
+        *(
+            get_document_texts(document_type, FUZZY_FIELDS[document_type], config)
+            for document_type in document_types
+        )
+    )
+    return {
+        document_type: FuzzyIndex(document_texts)
+        for document_type, document_texts in zip(document_types, texts)
+    }
+
+
+FUZZY_INDEXES = VersionedIndex(build_fuzzy_indexes, name="fuzzy indexes")
+
+
+async def resolve_fuzzy_query(
+    document_type: str, search_query: SearchQuery, config: Config = CONFIG
+) -> Optional[SearchQuery]:
+    """
+    Resolve the query string of a normalized search query to the set of ids
+    of the documents matching it with typos, so that the search runs with
+    filters on these ids instead of a text search.
+
+    Args:
+        document_type: The type of document
+        search_query: The normalized search query
+        config: The config
+
+    Returns:
+        The normalized search query with the ids as filters, or None if
+        no document matches
+
+    Raises:
+        FuzzyQueryError: If more than config.fuzzy_max_ids documents match
+        DatabaseUnavailableError: If the metadata store is not available
+            and the fuzzy indexes have not been built yet
+    """
+    indexes = await FUZZY_INDEXES.get(config)
+    document_ids = indexes[document_type].search(
+        search_query.query, max_expansions=config.fuzzy_max_expansions
+    )
+    filters = search_query.filters or []
+    id_filters = {x.value for x in filters if x.key == "id"}
+    if id_filters:
+        # filters on the same field are combined with OR, so intersect here
+        document_ids &= id_filters
+    if not document_ids:
+        return None
+    if len(document_ids) > config.fuzzy_max_ids:
+        raise FuzzyQueryError(
+            f"The fuzzy query matches more than {config.fuzzy_max_ids} documents,"
+            + " please use more specific terms"
+        )
+    return normalize_search_query(
+        SearchQuery(
+            query="*",
+            filters=[x for x in filters if x.key != "id"]
+            + [FilterOption(key="id", value=x) for x in document_ids],
+        )
+    )
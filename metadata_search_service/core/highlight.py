@@ -0,0 +1,191 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Context of search hits, i.e. snippets highlighting the terms of the query"""
+
+import html
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Pattern, Tuple
+
+from metadata_search_service.config import CONFIG, Config
+from metadata_search_service.core.utils import TEXT_FIELDS
+from metadata_search_service.dao.references import get_field_values
+
+MATCHER_CACHE_SIZE = 1024
+
+# Fields from which the context is taken, titles first and descriptions last
+CONTEXT_FIELDS = sorted(
+    TEXT_FIELDS, key=lambda field: (field == "description", field != "title", field)
+)
+
+TERM_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def get_query_terms(query: str) -> Tuple[str, ...]:
+    """
+    Get the terms of a query string in the syntax of the text search,
+    i.e. words and phrases in double quotes, leaving out negated words.
+
+    Args:
+        query: The normalized query string
+
+    Returns:
+        The distinct case-folded terms
+    """
+    terms: Dict[str, None] = {}
+    for phrase, word in TERM_PATTERN.findall(query.casefold()):
+        term = " ".join(phrase.split()) if phrase else word.strip("*")
+        if term and not term.startswith("-"):
+            terms[term] = None
+    return tuple(terms)
+
+
+@lru_cache(maxsize=MATCHER_CACHE_SIZE)
+def compile_matcher(terms: Tuple[str, ...]) -> Optional[Pattern]:
+    """
+    Compile a regular expression matching the given terms case-insensitively
+    at the start of words, so that e.g. "tumour" also matches "tumours".
+    Matchers are cached per tuple of terms.
+
+    Args:
+        terms: The case-folded query terms
+
+    Returns:
+        The compiled regular expression, or None if there are no terms
+    """
+    if not terms:
+        return None
+    alternatives = sorted(
+        (r"\s+".join(re.escape(word) for word in term.split()) for term in terms),
+        key=len,
+        reverse=True,
+    )
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")\w*", re.IGNORECASE)
+
+
+def _mark(text: str, matcher: Pattern) -> str:
+    """Escape a text as HTML and mark all matches as <em> elements."""
+    parts = []
+    position = 0
+    for match in matcher.finditer(text):
+        parts.append(html.escape(text[position : match.start()]))
+        parts.append(f"<em>{html.escape(match.group())}</em>")
+        position = match.end()
+    parts.append(html.escape(text[position:]))
+    return "".join(parts)
+
+
+def make_snippets(
+    text: str, matcher: Pattern, max_snippets: int, length: int
+) -> List[str]:
+    """
+    Make snippets of a text around the matches of a matcher, cut at
+    whitespace and marked with an ellipsis where the text was cut.
+
+    Args:
+        text: The text
+        matcher: The compiled matcher of the query terms
+        max_snippets: The maximum number of snippets
+        length: The maximum length of each snippet (in characters of the text)
+
+    Returns:
+        The snippets, as HTML with the matches marked as <em> elements
+    """
+    snippets: List[str] = []
+    covered = 0
+    for match in matcher.finditer(text):
+        if len(snippets) >= max_snippets:
+            break
+        if match.start() < covered:
+            continue
+        start = max(0, match.start() - max(0, length - len(match.group())) // 2)
+        end = min(len(text), start + length)
+        start = max(0, min(start, end - length))
+        if start > 0:
+            boundary = text.find(" ", start, match.start())
+            start = boundary + 1 if boundary >= 0 else start
+        if end < len(text):
+            boundary = text.rfind(" ", match.end(), end)
+            end = boundary if boundary >= 0 else end
+        snippets.append(
+            ("… " if start > 0 else "")
+            + _mark(text[start:end].strip(), matcher)
+            + (" …" if end < len(text) else "")
+        )
+        covered = end
+    return snippets
+
+
+class Highlighter:
+    """
+    Computes the context of search hits from the values of TEXT_FIELDS,
+    as snippets highlighting the terms of the query string. If the content
+    of the hits is restricted to some fields, the text fields are retrieved
+    as well and removed from the content after highlighting.
+    """
+
+    def __init__(
+        self, query: str, fields: Optional[List[str]], config: Config = CONFIG
+    ):
+        self._matcher = compile_matcher(get_query_terms(query))
+        self._extra_fields: List[str] = []
+        if fields is not None:
+            self._extra_fields = sorted(
+                field
+                for field in TEXT_FIELDS
+                if not any(x == field or x.startswith(f"{field}.") for x in fields)
+            )
+        self._fields = fields
+        self._max_snippets = config.highlight_max_snippets
+        self._snippet_length = config.highlight_snippet_length
+
+    @property
+    def fetch_fields(self) -> Optional[List[str]]:
+        """The fields of the documents to retrieve (None for all fields)"""
+        if self._fields is None:
+            return None
+        return sorted(set(self._fields) | set(self._extra_fields))
+
+    def highlight(self, document: Dict) -> Optional[str]:
+        """
+        Compute the context of a hit and remove the fields that were only
+        retrieved for that from the document.
+
+        Args:
+            document: The document of the hit
+
+        Returns:
+            The snippets of the document as HTML, with the matching terms
+            marked as <em> elements, or None if no term matches
+        """
+        snippets: List[str] = []
+        if self._matcher is not None:
+            for field in CONTEXT_FIELDS:
+                for value in get_field_values(document, field):
+                    if len(snippets) >= self._max_snippets:
+                        break
+                    if isinstance(value, str):
+                        snippets.extend(
+                            make_snippets(
+                                value,
+                                self._matcher,
+                                max_snippets=self._max_snippets - len(snippets),
+                                length=self._snippet_length,
+                            )
+                        )
+        for field in self._extra_fields:
+            document.pop(field, None)
+        return " ".join(snippets) or None
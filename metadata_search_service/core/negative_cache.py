@@ -0,0 +1,83 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cache of queries known to have no hits"""
+
+from collections import OrderedDict
+from typing import Optional
+
+
+class NegativeResultCache:
+    """
+    A bounded set of the fingerprints of queries without hits, evicting the
+    least recently used fingerprints first. Only a 64 bit prefix of each
+    fingerprint is kept, to keep the set compact. The set is cleared whenever
+    the version of the data in the metadata store changes.
+    """
+
+    def __init__(self):
+        self._keys: "OrderedDict[int, None]" = OrderedDict()
+        self._version: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _check_version(self, version: str) -> None:
+        """Clear the cache if the data version changed."""
+        if version != self._version:
+            self._keys.clear()
+            self._version = version
+
+    def contains(self, key: str, version: str) -> bool:
+        """
+        Check whether a query is known to have no hits.
+
+        Args:
+            key: The fingerprint of the query (as hex digest)
+            version: The current version of the data in the metadata store
+
+        Returns:
+            Whether or not the query is known to have no hits
+        """
+        self._check_version(version)
+        compact_key = int(key[:16], 16)
+        if compact_key not in self._keys:
+            return False
+        self._keys.move_to_end(compact_key)
+        return True
+
+    def add(self, key: str, version: str, max_entries: int) -> None:
+        """
+        Remember that a query has no hits. This is ignored if the data
+        version changed in the meantime.
+
+        Args:
+            key: The fingerprint of the query (as hex digest)
+            version: The version of the data in the metadata store
+                when the query was run
+            max_entries: The maximum number of remembered queries
+        """
+        if self._version is None:
+            self._version = version
+        if version != self._version:
+            return
+        compact_key = int(key[:16], 16)
+        self._keys[compact_key] = None
+        self._keys.move_to_end(compact_key)
+        while len(self._keys) > max_entries:
+            self._keys.popitem(last=False)
+
+
+NEGATIVE_CACHE = NegativeResultCache()
@@ -0,0 +1,287 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Normalization and fingerprinting of search queries"""
+
+import hashlib
+import json
+from enum import Enum
+from functools import lru_cache
+from typing import Any, List, Optional
+from urllib.parse import urlencode
+
+from metadata_search_service.core.synonyms import SYNONYMS
+from metadata_search_service.core.utils import DEFAULT_FILTER_FIELDS, SUMMARY_FIELDS
+from metadata_search_service.models import ContentView, FilterOption, SearchQuery
+
+FILTER_VALIDATION_CACHE_SIZE = 4096
+
+
+class InvalidParameterError(ValueError):
+    """Raised when a parameter of a search is malformed or out of range."""
+
+
+class InvalidFieldError(InvalidParameterError):
+    """Raised when a field to include in the hits is not a valid field path."""
+
+
+class InvalidFilterError(ValueError):
+    """Raised when filters refer to fields that cannot be filtered on."""
+
+    def __init__(self, document_type: str, invalid_keys: List[str]):
+        self.document_type = document_type
+        self.invalid_keys = invalid_keys
+        self.allowed_keys = sorted(DEFAULT_FILTER_FIELDS.get(document_type, ()))
+        message = (
+            f"Invalid filter key(s) for document type '{document_type}': "
+            + ", ".join(invalid_keys)
+        )
+        super().__init__(message)
+
+
+def normalize_query_string(query: str) -> str:
+    """
+    Normalize a query string by trimming and collapsing whitespace.
+    An empty query string is equivalent to a wildcard query.
+
+    Args:
+        query: The query string
+
+    Returns:
+        The normalized query string
+    """
+    normalized = " ".join(query.split())
+    return normalized if normalized else "*"
+
+
+def normalize_search_query(search_query: SearchQuery) -> SearchQuery:
+    """
+    Canonicalize a search query, so that logically equal queries are
+    represented in the same way, i.e. the query string is trimmed and
+    filters are sorted and deduplicated. Terms of the query string and values
+    of filters on concept names are expanded with their synonyms, so that a
+    single query also finds documents using synonymous terms.
+
+    Args:
+        search_query: The search query
+
+    Returns:
+        The normalized search query
+    """
+    filters = None
+    if search_query.filters:
+        unique_filters = {
+            (x.key.strip(), x.value)
+            for x in SYNONYMS.expand_filters(search_query.filters)
+        }
+        filters = [
+            FilterOption(key=key, value=value) for key, value in sorted(unique_filters)
+        ]
+    return SearchQuery(
+        query=SYNONYMS.expand_query(normalize_query_string(search_query.query)),
+        filters=filters,
+    )
+
+
+def parse_filter_parameter(parameter: str) -> FilterOption:
+    """
+    Parse a filter encoded as query parameter in the form ``key:value``.
+
+    Args:
+        parameter: The encoded filter
+
+    Returns:
+        The filter
+
+    Raises:
+        InvalidParameterError: If the filter is not in the form ``key:value``
+    """
+    key, separator, value = parameter.partition(":")
+    if not separator or not key:
+        raise InvalidParameterError(
+            f"Filter '{parameter}' is not in the form 'key:value'"
+        )
+    return FilterOption(key=key, value=value)
+
+
+def parse_fields_parameter(parameter: Optional[str]) -> Optional[List[str]]:
+    """
+    Parse a list of fields encoded as comma-separated query parameter.
+
+    Args:
+        parameter: The encoded list of fields
+
+    Returns:
+        The list of fields, or None if no fields were given
+    """
+    if parameter is None:
+        return None
+    return [x for x in parameter.split(",") if x.strip()]
+
+
+def normalize_fields(fields: List[str]) -> List[str]:
+    """
+    Canonicalize the fields to include in the content of search hits, i.e.
+    sort and deduplicate them, drop fields that are already included with a
+    parent field and always include the ``id`` of the documents.
+
+    Args:
+        fields: The fields, possibly in dot notation (e.g. ``has_study.title``)
+
+    Returns:
+        The normalized fields
+
+    Raises:
+        InvalidFieldError: If a field is not a valid field path
+    """
+    paths = {"id"}
+    for field in fields:
+        path = field.strip()
+        if any(not part or part.startswith("$") for part in path.split(".")):
+            raise InvalidFieldError(f"Field '{field}' is not a valid field path")
+        paths.add(path)
+    return [
+        path
+        for path in sorted(paths)
+        if not any(path.startswith(other + ".") for other in paths)
+    ]
+
+
+def resolve_content_fields(
+    document_type: str, view: ContentView, fields: Optional[List[str]] = None
+) -> Optional[List[str]]:
+    """
+    Resolve the fields to include in the content of search hits.
+    Explicitly requested fields take precedence over the view.
+
+    Args:
+        document_type: The type of document
+        view: The named set of fields to include
+        fields: The fields to include
+
+    Returns:
+        The normalized fields, or None if the whole documents are included
+
+    Raises:
+        InvalidFieldError: If a field is not a valid field path
+    """
+    if fields:
+        return normalize_fields(fields)
+    if view == ContentView.SUMMARY:
+        return normalize_fields(list(SUMMARY_FIELDS.get(document_type, ())))
+    return None
+
+
+def _encode_value(value: Any) -> str:
+    """Encode a single query parameter value."""
+    if isinstance(value, Enum):
+        value = value.value
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def encode_search_parameters(search_query: SearchQuery, **parameters: Any) -> str:
+    """
+    Encode a normalized search query and additional parameters as canonical
+    query string, i.e. logically equal queries are encoded identically.
+
+    Args:
+        search_query: The normalized search query
+        parameters: Any additional parameters (e.g. ``skip`` or ``limit``)
+
+    Returns:
+        The query string
+    """
+    items = sorted((key, _encode_value(value)) for key, value in parameters.items())
+    items.append(("query", search_query.query))
+    items.extend(("filter", f"{x.key}:{x.value}") for x in search_query.filters or [])
+    return urlencode(items)
+
+
+def get_query_fingerprint(
+    document_type: str, search_query: SearchQuery, **parameters: Any
+) -> str:
+    """
+    Get a stable fingerprint of a normalized search query,
+    that can be used as a key for caching.
+
+    Args:
+        document_type: The type of document
+        search_query: The normalized search query
+        parameters: Any additional parameters affecting the result
+            (e.g. skip or limit)
+
+    Returns:
+        The fingerprint of the search query
+    """
+    canonical = json.dumps(
+        [document_type, search_query.dict(), parameters],
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf8")).hexdigest()
+
+
+def get_search_etag(fingerprint: str, data_version: str) -> str:
+    """
+    Get a strong entity tag for the result of a search, which changes
+    whenever the query or the data in the metadata store changes.
+
+    Args:
+        fingerprint: The fingerprint of the search query
+        data_version: The version of the data in the metadata store
+
+    Returns:
+        The entity tag (including quotes)
+    """
+    digest = hashlib.sha256(f"{data_version}:{fingerprint}".encode("utf8"))
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+@lru_cache(maxsize=FILTER_VALIDATION_CACHE_SIZE)
+def is_valid_filter_key(document_type: str, key: str) -> bool:
+    """
+    Check whether a given filter key refers to an allowed and indexed field
+    of the given document type. Results are cached per type and key.
+
+    Args:
+        document_type: The type of document
+        key: The filter key
+
+    Returns:
+        Whether or not the filter key is valid
+    """
+    return key in DEFAULT_FILTER_FIELDS.get(document_type, ())
+
+
+def validate_filters(document_type: str, filters: Optional[List]) -> None:
+    """
+    Validate the keys of the given filters against the fields
+    that can be filtered on for the given document type.
+
+    Args:
+        document_type: The type of document
+        filters: A list of filters
+
+    Raises:
+        InvalidFilterError: If any filter key is not allowed
+    """
+    invalid_keys = sorted(
+        {x.key for x in filters or [] if not is_valid_filter_key(document_type, x.key)}
+    )
+    if invalid_keys:
+        raise InvalidFilterError(document_type, invalid_keys)
@@ -0,0 +1,76 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cache of recent search results, served while the metadata store is unavailable"""
+
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import orjson
+
+from metadata_search_service.core.utils import encode_bson
+
+# pylint: disable=no-member
+
+
+class ResultCache:
+    """
+    A bounded cache of search results keyed by query fingerprint,
+    evicting the least recently used results first. Results are kept
+    serialized, so that they are not affected by changes of the callers,
+    and are only decoded when they are served. BSON types are served
+    in their JSON representation.
+    """
+
+    def __init__(self):
+        self._results: "OrderedDict[str, bytes]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Get the cached result for a query.
+
+        Args:
+            key: The fingerprint of the query
+
+        Returns:
+            A decoded copy of the cached result or None
+        """
+        result = self._results.get(key)
+        if result is None:
+            return None
+        self._results.move_to_end(key)
+        return orjson.loads(result)
+
+    def put(self, key: str, result: Dict, max_entries: int) -> None:
+        """
+        Cache the result for a query.
+
+        Args:
+            key: The fingerprint of the query
+            result: The search result
+            max_entries: The maximum number of cached results
+        """
+        self._results[key] = orjson.dumps(
+            result, default=encode_bson, option=orjson.OPT_NON_STR_KEYS
+        )
+        self._results.move_to_end(key)
+        while len(self._results) > max_entries:
+            self._results.popitem(last=False)
+
+
+RESULT_CACHE = ResultCache()
@@ -15,13 +15,226 @@
 # limitations under the License.
 """Business logic for performing search on the metadata store"""
 
-from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+from functools import partial
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from metadata_search_service.config import CONFIG, Config
+from metadata_search_service.core.fuzzy import resolve_fuzzy_query
+from metadata_search_service.core.highlight import Highlighter
+from metadata_search_service.core.negative_cache import NEGATIVE_CACHE
+from metadata_search_service.core.query import (
+    InvalidParameterError,
+    get_query_fingerprint,
+    is_valid_filter_key,
+    normalize_search_query,
+    resolve_content_fields,
+    validate_filters,
+)
+from metadata_search_service.core.result_cache import RESULT_CACHE
+from metadata_search_service.core.sessions import SEARCH_SESSIONS, SearchSession
 from metadata_search_service.core.utils import DEFAULT_FACET_FIELDS, format_facet_key
-from metadata_search_service.dao.document import get_documents
+from metadata_search_service.dao.circuit_breaker import (
+    DATABASE_BREAKER,
+    CircuitState,
+    DatabaseUnavailableError,
+)
+from metadata_search_service.dao.document import (
+    QueryTimeoutError,
+    get_document_ids,
+    get_documents,
+    get_documents_by_ids,
+    get_documents_for_filters,
+    iter_documents_by_id,
+)
+from metadata_search_service.dao.version import get_data_version
+from metadata_search_service.models import (
+    ContentView,
+    CountMode,
+    DocumentType,
+    SearchQuery,
+)
 
 # pylint: disable=too-many-locals, too-many-nested-blocks, too-many-arguments
+# pylint: disable=too-many-lines
+
+log = logging.getLogger(__name__)
+
+# Keeps references to background tasks, so that they are not garbage collected
+_background_tasks: Set[asyncio.Task] = set()
+
+
+class BatchTooLargeError(InvalidParameterError):
+    """Raised when a batch search contains too many queries."""
+
+
+def format_facets(facet_results: List[Dict]) -> List[Dict]:
+    """
+    Format the facets as reported by MongoDB.
+
+    Args:
+        facet_results: A list of facets, each mapping the facet key
+            to its values and their counts
+
+    Returns:
+        A list of facets
+    """
+    facets = []
+    for facet_result in facet_results:
+        for key, value in facet_result.items():
+            key = key.replace("__", ".")
+            facet = {
+                "key": key,
+                "name": format_facet_key(key),
+                "options": [],
+            }
+            for val in value:
+                if val["_id"]:
+                    if isinstance(val["_id"], list):
+                        if len(val["_id"]) == 1:
+                            facet_key = val["_id"][0]
+                        else:
+                            facet_key = ", ".join(val["_id"])
+                    elif isinstance(val["_id"], str):
+                        facet_key = val["_id"]
+                else:
+                    facet_key = str(val["_id"])
+                facet_option = {
+                    "option": facet_key,
+                    "count": val["count"],
+                }
+                facet["options"].append(facet_option)
+            facets.append(facet)
+    return facets
+
+
+async def _search_documents(
+    document_type: str,
+    search_query: SearchQuery,
+    return_facets: bool,
+    skip: int,
+    limit: int,
+    count_mode: CountMode,
+    max_time_ms: Optional[int],
+    fields: Optional[List[str]],
+    config: Config,
+    hydrate: bool = True,
+    fuzzy: bool = False,
+    highlight: bool = False,
+) -> Dict:
+    """
+    Search the metadata store for a normalized search query.
+    If the documents are not hydrated, the content of the hits only has an id.
+    Queries that are known to have no hits are answered without a search.
+    Fuzzy queries are resolved to the ids of the matching documents first.
+    """
+    highlighter = Highlighter(search_query.query, fields, config) if highlight else None
+    if fuzzy and search_query.query != "*":
+        fuzzy_query = await resolve_fuzzy_query(document_type, search_query, config)
+        if fuzzy_query is None:
+            return _make_empty_result(document_type, return_facets)
+        search_query = fuzzy_query
+    negative_key = get_query_fingerprint(document_type, search_query)
+    try:
+        version: Optional[str] = await get_data_version(config)
+    except DatabaseUnavailableError:
+        version = None
+    if version is not None and NEGATIVE_CACHE.contains(negative_key, version):
+        return _make_empty_result(document_type, return_facets)
+
+    results = await get_documents(
+        collection_name=document_type,
+        search_query=search_query.query,
+        filters=search_query.filters,
+        facet_fields=DEFAULT_FACET_FIELDS[document_type] if return_facets else None,
+        skip=skip,
+        limit=limit,
+        count_mode=count_mode,
+        max_time_ms=max_time_ms,
+        fields=highlighter.fetch_fields if highlighter else fields,
+        hydrate=hydrate,
+        config=config,
+    )
+    if (
+        version is not None
+        and results.count == 0
+        and results.count_mode == CountMode.EXACT
+        and results.count_complete
+    ):
+        NEGATIVE_CACHE.add(
+            negative_key, version, max_entries=config.negative_cache_max_entries
+        )
+    return {
+        "facets": format_facets(results.facets) if return_facets else [],
+        "facets_complete": results.facets_complete,
+        "count": results.count,
+        "count_mode": results.count_mode,
+        "count_complete": results.count_complete,
+        "stale": False,
+        "hits": _make_hits(document_type, results.docs, highlighter),
+    }
+
+
+def _make_empty_result(document_type: str, return_facets: bool) -> Dict:
+    """Make the result of a search without hits."""
+    facet_results: List[Dict] = [
+        {field.replace(".", "__"): []} for field in DEFAULT_FACET_FIELDS[document_type]
+    ]
+    return {
+        "facets": format_facets(facet_results) if return_facets else [],
+        "facets_complete": True,
+        "count": 0,
+        "count_mode": CountMode.EXACT,
+        "count_complete": True,
+        "stale": False,
+        "hits": [],
+    }
+
+
+def _make_hits(
+    document_type: str,
+    documents: List[Dict],
+    highlighter: Optional[Highlighter] = None,
+) -> List[Dict]:
+    """Make search hits from the given documents, with context if requested."""
+    return [
+        {
+            "document_type": document_type,
+            "id": x["id"],
+            "context": highlighter.highlight(x) if highlighter else None,
+            "content": x,
+        }
+        for x in documents
+    ]
+
+
+def _cache_result(key: str, result: Dict, config: Config) -> None:
+    """Cache a search result, if it is complete and not too large."""
+    if (
+        result["facets_complete"]
+        and result["count_complete"]
+        and len(result["hits"]) <= config.result_cache_max_hits
+    ):
+        RESULT_CACHE.put(key, result, max_entries=config.result_cache_max_entries)
+
+
+async def _revalidate(key: str, search: Callable[[], Awaitable[Dict]], config: Config):
+    """Re-run a search to refresh its cached result."""
+    try:
+        _cache_result(key, await search(), config)
+    except (DatabaseUnavailableError, QueryTimeoutError) as error:
+        log.info("Revalidation of a cached search result failed: %s", error)
 
 
 async def perform_search(
@@ -31,60 +244,768 @@ async def perform_search(
     return_facets: bool = False,
     skip: int = 0,
     limit: int = 10,
+    count_mode: CountMode = CountMode.EXACT,
+    max_time_ms: Optional[int] = None,
+    view: ContentView = ContentView.FULL,
+    fields: Optional[List[str]] = None,
+    fuzzy: bool = False,
+    highlight: bool = False,
     config: Config = CONFIG,
-) -> Tuple[List[Dict], List[Dict], int]:
+) -> Dict:
     """
     Perform a search on the metadata store and get all
     documents that match a given search query.
 
+    While the circuit breaker of the metadata store is not closed, the last
+    result of a query is served (marked as stale) if it is cached. Once the
+    circuit breaker is half-open, the result is revalidated in the background.
+
     Args:
         document_type: The type of document
         search_query: The search query string to use for text serach
         return_facets: Whether or not to facet. Defaults to False
         skip: The number of documents to skip
         limit: The total number of documents to retrieve
+        count_mode: How to determine the total number of hits
+        max_time_ms: The time budget for each query in milliseconds
+        view: The named set of fields to include in the content of the hits
+        fields: The fields to include in the content of the hits,
+            taking precedence over the view
+        fuzzy: Whether to match the terms of the query string with typos
+            (in the fields of ``FUZZY_FIELDS``) instead of a text search
+        highlight: Whether to set the context of the hits to snippets
+            highlighting the terms of the query string
         config: The config
 
     Returns:
-        A list of documents, a list of facets (if ``return_facets=True``),
-        and a count representing total number of hits
+        The search result, containing a list of hits, a list of facets
+        (if ``return_facets=True``), a count representing total number of hits,
+        the count mode used and whether or not facets and count are complete
+
+    Raises:
+        InvalidFilterError: If any filter refers to a field that cannot be filtered on
+        InvalidFieldError: If any of the fields is not a valid field path
+        QueryTimeoutError: If the hits could not be retrieved within ``max_time_ms``
+        DatabaseUnavailableError: If the metadata store is not available
+            and no cached result exists
 
     """
-    docs, facet_results, count = await get_documents(
-        collection_name=document_type,
+    normalized_query, content_fields, key = _prepare_search(
+        document_type,
         search_query=search_query,
         filters=filters,
-        facet_fields=DEFAULT_FACET_FIELDS[document_type],
+        view=view,
+        fields=fields,
+        return_facets=return_facets,
         skip=skip,
         limit=limit,
+        count_mode=count_mode,
+        fuzzy=fuzzy,
+        highlight=highlight,
+    )
+    search = partial(
+        _search_documents,
+        document_type=document_type,
+        search_query=normalized_query,
+        return_facets=return_facets,
+        skip=skip,
+        limit=limit,
+        count_mode=count_mode,
+        max_time_ms=max_time_ms,
+        fields=content_fields,
         config=config,
+        fuzzy=fuzzy,
+        highlight=highlight,
     )
-    hits = [{"document_type": document_type, "id": x["id"], "content": x} for x in docs]
-    facets = []
-    if return_facets and facet_results:
-        for facet_result in facet_results:
-            for key, value in facet_result.items():
-                key = key.replace("__", ".")
-                facet = {
-                    "key": key,
-                    "name": format_facet_key(key),
-                    "options": [],
-                }
-                for val in value:
-                    if val["_id"]:
-                        if isinstance(val["_id"], list):
-                            if len(val["_id"]) == 1:
-                                facet_key = val["_id"][0]
-                            else:
-                                facet_key = ", ".join(val["_id"])
-                        elif isinstance(val["_id"], str):
-                            facet_key = val["_id"]
-                    else:
-                        facet_key = str(val["_id"])
-                    facet_option = {
-                        "option": facet_key,
-                        "count": val["count"],
-                    }
-                    facet["options"].append(facet_option)
-                facets.append(facet)
-    return hits, facets, count
+    cached_result = _get_stale_result(key, search, config)
+    if cached_result is not None:
+        return cached_result
+
+    result = await search()
+    _cache_result(key, result, config)
+    return result
+
+
+async def stream_search(
+    document_type: str,
+    search_query: str = "*",
+    filters: Optional[List] = None,
+    return_facets: bool = False,
+    skip: int = 0,
+    limit: int = 10,
+    count_mode: CountMode = CountMode.EXACT,
+    max_time_ms: Optional[int] = None,
+    view: ContentView = ContentView.FULL,
+    fields: Optional[List[str]] = None,
+    fuzzy: bool = False,
+    highlight: bool = False,
+    config: Config = CONFIG,
+) -> Tuple[Dict, AsyncIterator[List[Dict]]]:
+    """
+    Perform a search like ``perform_search``, but return the hits as batches
+    that are only retrieved from the metadata store while they are iterated,
+    so that large result pages need not be held in memory at once.
+    Streamed results are not cached, but cached results are served
+    (as a single batch) while the metadata store is unavailable.
+
+    Args:
+        document_type: The type of document
+        search_query: The search query string to use for text serach
+        return_facets: Whether or not to facet. Defaults to False
+        skip: The number of documents to skip
+        limit: The total number of documents to retrieve
+        count_mode: How to determine the total number of hits
+        max_time_ms: The time budget for each query in milliseconds
+        view: The named set of fields to include in the content of the hits
+        fields: The fields to include in the content of the hits,
+            taking precedence over the view
+        fuzzy: Whether to match the terms of the query string with typos
+            (in the fields of ``FUZZY_FIELDS``) instead of a text search
+        highlight: Whether to set the context of the hits to snippets
+            highlighting the terms of the query string
+        config: The config
+
+    Returns:
+        The search result without hits, and an async iterator over batches
+        of hits, with at most ``config.hydration_batch_size`` hits each
+
+    Raises:
+        InvalidFilterError: If any filter refers to a field that cannot be filtered on
+        InvalidFieldError: If any of the fields is not a valid field path
+        QueryTimeoutError: If the hits could not be retrieved within ``max_time_ms``
+        DatabaseUnavailableError: If the metadata store is not available
+            and no cached result exists
+    """
+    normalized_query, content_fields, key = _prepare_search(
+        document_type,
+        search_query=search_query,
+        filters=filters,
+        view=view,
+        fields=fields,
+        return_facets=return_facets,
+        skip=skip,
+        limit=limit,
+        count_mode=count_mode,
+        fuzzy=fuzzy,
+        highlight=highlight,
+    )
+    search = partial(
+        _search_documents,
+        document_type=document_type,
+        search_query=normalized_query,
+        return_facets=return_facets,
+        skip=skip,
+        limit=limit,
+        count_mode=count_mode,
+        max_time_ms=max_time_ms,
+        fields=content_fields,
+        config=config,
+        fuzzy=fuzzy,
+        highlight=highlight,
+    )
+    cached_result = _get_stale_result(key, search, config)
+    if cached_result is not None:
+        hits = cached_result.pop("hits")
+        return cached_result, _iter_batches([hits])
+
+    result = await search(hydrate=False)
+    document_ids = [x["id"] for x in result.pop("hits")]
+    highlighter = (
+        Highlighter(normalized_query.query, content_fields, config)
+        if highlight
+        else None
+    )
+    return result, _iter_hits(
+        document_type, document_ids, content_fields, config, highlighter
+    )
+
+
+async def create_search_session(
+    document_type: str,
+    search_query: str = "*",
+    filters: Optional[List] = None,
+    return_facets: bool = False,
+    skip: int = 0,
+    limit: int = 10,
+    count_mode: CountMode = CountMode.EXACT,
+    max_time_ms: Optional[int] = None,
+    view: ContentView = ContentView.FULL,
+    fields: Optional[List[str]] = None,
+    fuzzy: bool = False,
+    highlight: bool = False,
+    config: Config = CONFIG,
+) -> Dict:
+    """
+    Perform a search like ``perform_search`` and create a search session,
+    which holds the ordered ids of all hits, so that further pages can be
+    retrieved with ``get_session_page`` without running the search again.
+
+    No session is created for stale results, for searches with more than
+    ``config.search_session_max_hits`` hits or if the ids could not be
+    retrieved in time.
+
+    Args:
+        document_type: The type of document
+        search_query: The search query string to use for text serach
+        return_facets: Whether or not to facet. Defaults to False
+        skip: The number of documents to skip
+        limit: The total number of documents to retrieve
+        count_mode: How to determine the total number of hits
+        max_time_ms: The time budget for each query in milliseconds
+        view: The named set of fields to include in the content of the hits
+        fields: The fields to include in the content of the hits,
+            taking precedence over the view
+        fuzzy: Whether to match the terms of the query string with typos
+            (in the fields of ``FUZZY_FIELDS``) instead of a text search
+        highlight: Whether to set the context of the hits to snippets
+            highlighting the terms of the query string
+        config: The config
+
+    Returns:
+        The search result, including the id of the session (if created)
+
+    Raises:
+        InvalidFilterError: If any filter refers to a field that cannot be filtered on
+        InvalidFieldError: If any of the fields is not a valid field path
+        QueryTimeoutError: If the hits could not be retrieved within ``max_time_ms``
+        DatabaseUnavailableError: If the metadata store is not available
+            and no cached result exists
+    """
+    normalized_query, content_fields, _ = _prepare_search(
+        document_type,
+        search_query=search_query,
+        filters=filters,
+        view=view,
+        fields=fields,
+    )
+    ids_query: Optional[SearchQuery] = normalized_query
+    if fuzzy and normalized_query.query != "*":
+        ids_query = await resolve_fuzzy_query(document_type, normalized_query, config)
+    ids_task = asyncio.ensure_future(
+        get_document_ids(
+            document_type,
+            search_query=ids_query.query,
+            filters=ids_query.filters,
+            max_ids=config.search_session_max_hits,
+            max_time_ms=max_time_ms,
+            config=config,
+        )
+        if ids_query is not None
+        else _no_document_ids()
+    )
+    try:
+        result = await perform_search(
+            document_type,
+            search_query=normalized_query.query,
+            filters=normalized_query.filters,
+            return_facets=return_facets,
+            skip=skip,
+            limit=limit,
+            count_mode=count_mode,
+            max_time_ms=max_time_ms,
+            fields=content_fields,
+            fuzzy=fuzzy,
+            highlight=highlight,
+            config=config,
+        )
+    except BaseException:
+        ids_task.cancel()
+        raise
+    try:
+        document_ids = await ids_task
+    except (QueryTimeoutError, DatabaseUnavailableError) as error:
+        log.info("Could not create a search session: %s", error)
+        document_ids = None
+
+    session_id = None
+    if document_ids is not None and not result["stale"]:
+        summary = {key: value for key, value in result.items() if key != "hits"}
+        summary.update(
+            count=len(document_ids),
+            count_mode=CountMode.EXACT,
+            count_complete=True,
+        )
+        session_id = SEARCH_SESSIONS.create(
+            document_type,
+            document_ids=document_ids,
+            summary=summary,
+            fields=content_fields,
+            ttl=config.search_session_ttl,
+            max_ids=config.search_session_max_ids,
+            highlight_query=normalized_query.query if highlight else None,
+        )
+    return {**result, "session_id": session_id}
+
+
+async def _no_document_ids() -> List[str]:
+    """Get the ids of the hits of a search known to have no hits."""
+    return []
+
+
+def _open_session_page(
+    session_id: str, skip: int, limit: int, config: Config
+) -> Tuple[SearchSession, List[str], Optional[Highlighter]]:
+    """Get a search session, the ids on a page and the highlighter of the hits."""
+    session = SEARCH_SESSIONS.get(session_id, ttl=config.search_session_ttl)
+    page_ids = session.document_ids[skip : skip + limit if limit else None]
+    highlighter = (
+        Highlighter(session.highlight_query, session.fields, config)
+        if session.highlight_query is not None
+        else None
+    )
+    return session, page_ids, highlighter
+
+
+async def get_session_page(
+    session_id: str, skip: int = 0, limit: int = 10, config: Config = CONFIG
+) -> Dict:
+    """
+    Get a page of the hits of a search session. Only the documents on the page
+    are retrieved from the metadata store. Documents that have been removed
+    since the session was created are omitted. The hits are highlighted
+    if they were highlighted when the session was created.
+
+    Args:
+        session_id: The id of the search session
+        skip: The number of documents to skip
+        limit: The total number of documents to retrieve
+        config: The config
+
+    Returns:
+        The search result, with facets and count as of the creation of the session
+
+    Raises:
+        SessionNotFoundError: If the session does not exist or expired
+        DatabaseUnavailableError: If the metadata store is not available
+    """
+    session, page_ids, highlighter = _open_session_page(
+        session_id, skip=skip, limit=limit, config=config
+    )
+    documents = await get_documents_by_ids(
+        session.document_type,
+        page_ids,
+        fields=highlighter.fetch_fields if highlighter else session.fields,
+        config=config,
+    )
+    return {
+        **session.summary,
+        "hits": _make_hits(session.document_type, documents, highlighter),
+        "session_id": session_id,
+    }
+
+
+async def stream_session_page(
+    session_id: str, skip: int = 0, limit: int = 0, config: Config = CONFIG
+) -> Tuple[Dict, AsyncIterator[List[Dict]]]:
+    """
+    Get a page of the hits of a search session like ``get_session_page``,
+    but return the hits as batches that are only retrieved from the metadata
+    store while they are iterated, so that large pages need not be held
+    in memory at once.
+
+    Args:
+        session_id: The id of the search session
+        skip: The number of documents to skip
+        limit: The total number of documents to retrieve
+        config: The config
+
+    Returns:
+        The search result without hits, and an async iterator over batches
+        of hits, with at most ``config.hydration_batch_size`` hits each
+
+    Raises:
+        SessionNotFoundError: If the session does not exist or expired
+    """
+    session, page_ids, highlighter = _open_session_page(
+        session_id, skip=skip, limit=limit, config=config
+    )
+    return {**session.summary, "session_id": session_id}, _iter_hits(
+        session.document_type, page_ids, session.fields, config, highlighter
+    )
+
+
+def _make_failed_result(
+    document_type: str, count_mode: CountMode, error: Exception
+) -> Dict:
+    """Make the result of a search for one type of document that failed."""
+    return {
+        "document_type": document_type,
+        "facets": [],
+        "facets_complete": False,
+        "count": 0,
+        "count_mode": count_mode,
+        "count_complete": False,
+        "stale": False,
+        "hits": [],
+        "error": str(error) or type(error).__name__,
+    }
+
+
+def _get_error(task: asyncio.Future, max_time_ms: Optional[int]) -> Optional[Exception]:
+    """
+    Get the error of a finished search, if it ran out of time or the metadata
+    store was unavailable. Any other error is raised.
+    """
+    if task.cancelled():
+        return QueryTimeoutError(f"Search exceeded the time budget of {max_time_ms} ms")
+    error = task.exception()
+    if isinstance(error, (QueryTimeoutError, DatabaseUnavailableError)):
+        return error
+    if error is not None:
+        raise error
+    return None
+
+
+async def perform_federated_search(
+    search_query: str = "*",
+    filters: Optional[List] = None,
+    return_facets: bool = False,
+    limit: int = 5,
+    count_mode: CountMode = CountMode.EXACT,
+    max_time_ms: Optional[int] = None,
+    view: ContentView = ContentView.SUMMARY,
+    fields: Optional[List[str]] = None,
+    config: Config = CONFIG,
+) -> Dict:
+    """
+    Perform a search on all types of documents concurrently, sharing one time
+    budget. Types of documents to which not all filters apply are skipped.
+
+    A search that fails for one type of document because it ran out of time
+    or because the metadata store is unavailable does not fail the others,
+    but is reported in the result for that type.
+
+    Args:
+        search_query: The search query string to use for text serach
+        filters: The filters, which must apply to a type of document
+            for it to be searched
+        return_facets: Whether or not to facet. Defaults to False
+        limit: The number of top hits to retrieve per type of document
+        count_mode: How to determine the total number of hits
+        max_time_ms: The time budget for the whole search in milliseconds
+        view: The named set of fields to include in the content of the hits
+        fields: The fields to include in the content of the hits,
+            taking precedence over the view
+        config: The config
+
+    Returns:
+        The search results, one per type of document
+
+    Raises:
+        InvalidFieldError: If any of the fields is not a valid field path
+        QueryTimeoutError: If the search timed out for all types of documents
+        DatabaseUnavailableError: If the metadata store is not available
+            and no cached results exist
+    """
+    document_types = [
+        document_type.value
+        for document_type in DocumentType
+        if all(is_valid_filter_key(document_type.value, x.key) for x in filters or [])
+    ]
+    tasks = [
+        asyncio.ensure_future(
+            perform_search(
+                document_type,
+                search_query=search_query,
+                filters=filters,
+                return_facets=return_facets,
+                limit=limit,
+                count_mode=count_mode,
+                max_time_ms=max_time_ms,
+                view=view,
+                fields=fields,
+                config=config,
+            )
+        )
+        for document_type in document_types
+    ]
+    if not tasks:
+        return {"results": []}
+    try:
+        _, pending = await asyncio.wait(
+            tasks, timeout=max_time_ms / 1000 if max_time_ms else None
+        )
+    finally:
+        for task in tasks:
+            task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+
+    results = []
+    errors = []
+    for document_type, task in zip(document_types, tasks):
+        error = _get_error(task, max_time_ms)
+        if error is None:
+            results.append(
+                {"document_type": document_type, **task.result(), "error": None}
+            )
+        else:
+            errors.append(error)
+            results.append(_make_failed_result(document_type, count_mode, error))
+    if len(errors) == len(tasks):
+        raise errors[0]
+    return {"results": results}
+
+
+async def _search_shared_query(
+    document_type: str,
+    search_query: str,
+    filter_sets: List[Optional[List]],
+    skip: int,
+    limit: int,
+    count_mode: CountMode,
+    max_time_ms: Optional[int],
+    fields: Optional[List[str]],
+    config: Config,
+) -> List[Dict]:
+    """Run searches that share the same search query string at once."""
+    results = await get_documents_for_filters(
+        collection_name=document_type,
+        search_query=search_query,
+        filter_sets=filter_sets,
+        skip=skip,
+        limit=limit,
+        count_mode=count_mode,
+        max_time_ms=max_time_ms,
+        fields=fields,
+        config=config,
+    )
+    return [
+        {
+            "facets": [],
+            "facets_complete": True,
+            "count": x.count,
+            "count_mode": x.count_mode,
+            "count_complete": True,
+            "stale": False,
+            "hits": _make_hits(document_type, x.docs),
+        }
+        for x in results
+    ]
+
+
+def _group_queries(
+    normalized_queries: Dict[str, SearchQuery], shared: bool
+) -> Dict[str, List[str]]:
+    """
+    Group the keys of normalized queries that can be run together, i.e. that
+    have the same search query string, if the queries are to be shared.
+    """
+    groups: Dict[str, List[str]] = {}
+    for key, normalized_query in normalized_queries.items():
+        if shared:
+            groups.setdefault(normalized_query.query, []).append(key)
+        else:
+            groups[key] = [key]
+    return groups
+
+
+def _normalize_batch(
+    document_type: str, queries: List[SearchQuery], config: Config
+) -> Dict[str, SearchQuery]:
+    """Normalize and validate the queries of a batch, keyed by their JSON."""
+    if len(queries) > config.batch_search_max_queries:
+        raise BatchTooLargeError(
+            f"A batch must not contain more than {config.batch_search_max_queries}"
+            + " queries"
+        )
+    normalized_queries = {}
+    for query in queries:
+        normalized_query = normalize_search_query(query)
+        validate_filters(document_type, normalized_query.filters)
+        normalized_queries[normalized_query.json()] = normalized_query
+    return normalized_queries
+
+
+async def perform_batch_search(
+    document_type: str,
+    queries: List[SearchQuery],
+    return_facets: bool = False,
+    skip: int = 0,
+    limit: int = 10,
+    count_mode: CountMode = CountMode.EXACT,
+    max_time_ms: Optional[int] = None,
+    view: ContentView = ContentView.FULL,
+    fields: Optional[List[str]] = None,
+    config: Config = CONFIG,
+) -> Dict:
+    """
+    Perform several searches on the same type of document at once,
+    with at most ``config.batch_search_max_concurrency`` running concurrently.
+
+    Identical queries are only run once. Unless facets or estimated counts
+    are requested, queries with the same search query string are run as a
+    single aggregation, which performs the text search only once and applies
+    the filters of the individual queries in separate branches.
+
+    A query that times out or finds the metadata store unavailable does not
+    fail the others, but is reported in its result.
+
+    Args:
+        document_type: The type of document
+        queries: The search queries
+        return_facets: Whether or not to facet. Defaults to False
+        skip: The number of documents to skip
+        limit: The total number of documents to retrieve
+        count_mode: How to determine the total number of hits
+        max_time_ms: The time budget for each query in milliseconds
+        view: The named set of fields to include in the content of the hits
+        fields: The fields to include in the content of the hits,
+            taking precedence over the view
+        config: The config
+
+    Returns:
+        The search results, in the order of the queries
+
+    Raises:
+        BatchTooLargeError: If there are too many queries
+        InvalidFieldError: If any of the fields is not a valid field path
+        InvalidFilterError: If any filter refers to a field that cannot be filtered on
+        QueryTimeoutError: If all queries timed out
+        DatabaseUnavailableError: If the metadata store is not available
+            and no cached results exist
+    """
+    normalized_queries = _normalize_batch(document_type, queries, config)
+    if not normalized_queries:
+        return {"results": []}
+    content_fields = resolve_content_fields(document_type, view, fields)
+    shared = not (
+        return_facets
+        or count_mode == CountMode.ESTIMATED
+        or DATABASE_BREAKER.get_state(config) != CircuitState.CLOSED
+    )
+    groups = _group_queries(normalized_queries, shared=shared)
+    semaphore = asyncio.Semaphore(config.batch_search_max_concurrency)
+
+    async def run(keys: List[str]) -> List[Dict]:
+        async with semaphore:
+            if len(keys) == 1:
+                [normalized_query] = [normalized_queries[x] for x in keys]
+                return [
+                    await perform_search(
+                        document_type,
+                        search_query=normalized_query.query,
+                        filters=normalized_query.filters,
+                        return_facets=return_facets,
+                        skip=skip,
+                        limit=limit,
+                        count_mode=count_mode,
+                        max_time_ms=max_time_ms,
+                        fields=content_fields,
+                        config=config,
+                    )
+                ]
+            return await _search_shared_query(
+                document_type,
+                search_query=normalized_queries[keys[0]].query,
+                filter_sets=[normalized_queries[x].filters for x in keys],
+                skip=skip,
+                limit=limit,
+                count_mode=count_mode,
+                max_time_ms=max_time_ms,
+                fields=content_fields,
+                config=config,
+            )
+
+    tasks = {group: asyncio.ensure_future(run(keys)) for group, keys in groups.items()}
+    try:
+        await asyncio.wait(tasks.values())
+    finally:
+        for task in tasks.values():
+            task.cancel()
+
+    results_by_key: Dict[str, Dict] = {}
+    errors = []
+    for group, keys in groups.items():
+        error = _get_error(tasks[group], max_time_ms)
+        if error is not None:
+            errors.append(error)
+        group_results = (
+            [_make_failed_result(document_type, count_mode, error)] * len(keys)
+            if error is not None
+            else tasks[group].result()
+        )
+        for key, result in zip(keys, group_results):
+            results_by_key[key] = {
+                "document_type": document_type,
+                "error": None,
+                **result,
+            }
+    if errors and len(errors) == len(groups):
+        raise errors[0]
+    return {
+        "results": [
+            results_by_key[normalize_search_query(query).json()] for query in queries
+        ]
+    }
+
+
+def _prepare_search(
+    document_type: str,
+    search_query: str,
+    filters: Optional[List],
+    view: ContentView,
+    fields: Optional[List[str]],
+    **parameters: Any,
+) -> Tuple[SearchQuery, Optional[List[str]], str]:
+    """
+    Normalize and validate a search and compute the key of its result.
+
+    Returns:
+        The normalized query, the fields to include in the content of the hits
+        and the key of the result in the result cache
+    """
+    normalized_query = normalize_search_query(
+        SearchQuery(query=search_query, filters=filters)
+    )
+    validate_filters(document_type, normalized_query.filters)
+    content_fields = resolve_content_fields(document_type, view, fields)
+    key = get_query_fingerprint(
+        document_type, normalized_query, fields=content_fields, **parameters
+    )
+    return normalized_query, content_fields, key
+
+
+def _get_stale_result(
+    key: str, search: Callable[[], Awaitable[Dict]], config: Config
+) -> Optional[Dict]:
+    """
+    Get the cached result of a search, if the circuit breaker is not closed.
+    Once it is half-open, the result is revalidated in the background.
+    """
+    state = DATABASE_BREAKER.get_state(config)
+    if state == CircuitState.CLOSED:
+        return None
+    cached_result = RESULT_CACHE.get(key)
+    if cached_result is None:
+        return None
+    if state == CircuitState.HALF_OPEN:
+        task = asyncio.ensure_future(_revalidate(key, search, config))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    cached_result["stale"] = True
+    return cached_result
+
+
+async def _iter_batches(batches: List[List[Dict]]) -> AsyncIterator[List[Dict]]:
+    """Iterate asynchronously over batches that are already available."""
+    for batch in batches:
+        yield batch
+
+
+async def _iter_hits(
+    document_type: str,
+    document_ids: List[str],
+    fields: Optional[List[str]],
+    config: Config,
+    highlighter: Optional[Highlighter] = None,
+) -> AsyncIterator[List[Dict]]:
+    """Retrieve the hits for the given document ids in batches."""
+    async for documents in iter_documents_by_id(
+        document_type,
+        document_ids,
+        fields=highlighter.fetch_fields if highlighter else fields,
+        batch_size=config.hydration_batch_size,
+        config=config,
+    ):
+        yield _make_hits(document_type, documents, highlighter)
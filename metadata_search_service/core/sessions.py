@@ -0,0 +1,151 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Search sessions holding a snapshot of the ordered hits of a search"""
+
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+# pylint: disable=too-many-arguments
+
+
+class SessionNotFoundError(LookupError):
+    """Raised when a search session does not exist (anymore)."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        super().__init__(f"Search session '{session_id}' does not exist or expired")
+
+
+@dataclass
+class SearchSession:
+    """
+    A snapshot of the ordered ids of all hits of a search, together with the
+    summary (facets and count), the fields to include in the hits and the
+    query string to highlight in the hits (if requested).
+    """
+
+    document_type: str
+    document_ids: List[str]
+    summary: Dict
+    fields: Optional[List[str]]
+    expires: float
+    highlight_query: Optional[str] = None
+
+
+class SessionStore:
+    """
+    A store of search sessions that expire after a time to live and are
+    bounded by the total number of ids they hold, evicting the least
+    recently used sessions first.
+    """
+
+    def __init__(self):
+        self._sessions: "OrderedDict[str, SearchSession]" = OrderedDict()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def size(self) -> int:
+        """The total number of ids held by all sessions"""
+        return self._size
+
+    def _remove(self, session_id: str) -> None:
+        """Remove a session."""
+        session = self._sessions.pop(session_id)
+        self._size -= len(session.document_ids)
+
+    def _remove_expired(self, now: float) -> None:
+        """Remove all expired sessions."""
+        for session_id in [
+            key for key, session in self._sessions.items() if session.expires <= now
+        ]:
+            self._remove(session_id)
+
+    def create(
+        self,
+        document_type: str,
+        document_ids: List[str],
+        summary: Dict,
+        fields: Optional[List[str]],
+        ttl: float,
+        max_ids: int,
+        highlight_query: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        Create a search session.
+
+        Args:
+            document_type: The type of document
+            document_ids: The ordered ids of all hits
+            summary: The search result without hits
+            fields: The fields to include in the content of the hits
+            ttl: The time to live of the session in seconds
+            max_ids: The maximum number of ids held by all sessions
+            highlight_query: The query string to highlight in the hits,
+                or None to not highlight them
+
+        Returns:
+            The id of the session, or None if it holds too many ids
+        """
+        if len(document_ids) > max_ids:
+            return None
+        now = time.monotonic()
+        self._remove_expired(now)
+        while self._sessions and self._size + len(document_ids) > max_ids:
+            self._remove(next(iter(self._sessions)))
+        session_id = uuid.uuid4().hex
+        self._sessions[session_id] = SearchSession(
+            document_type=document_type,
+            document_ids=document_ids,
+            summary=summary,
+            fields=fields,
+            expires=now + ttl,
+            highlight_query=highlight_query,
+        )
+        self._size += len(document_ids)
+        return session_id
+
+    def get(self, session_id: str, ttl: float) -> SearchSession:
+        """
+        Get a search session and extend its lifetime.
+
+        Args:
+            session_id: The id of the session
+            ttl: The time to live of the session in seconds from now
+
+        Returns:
+            The search session
+
+        Raises:
+            SessionNotFoundError: If the session does not exist or expired
+        """
+        now = time.monotonic()
+        session = self._sessions.get(session_id)
+        if session is None or session.expires <= now:
+            if session is not None:
+                self._remove(session_id)
+            raise SessionNotFoundError(session_id)
+        session.expires = now + ttl
+        self._sessions.move_to_end(session_id)
+        return session
+
+
+SEARCH_SESSIONS = SessionStore()
@@ -0,0 +1,227 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Suggestions for search terms served from an in-memory prefix index"""
+
+import asyncio
+import sys
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from metadata_search_service.config import CONFIG, Config
+from metadata_search_service.core.utils import DEFAULT_FACET_FIELDS, IDENTIFIER_FIELDS
+from metadata_search_service.core.versioned import VersionedIndex
+from metadata_search_service.dao.terms import get_field_value_counts
+
+# Fields whose values are suggested, per document type
+SUGGEST_FIELDS: Dict[str, Set[str]] = {
+    document_type: (IDENTIFIER_FIELDS - {"id"}) | {"title"} | facet_fields
+    for document_type, facet_fields in DEFAULT_FACET_FIELDS.items()
+}
+
+# Number of top terms kept per frequent prefix, and number of such prefixes
+TOP_TERMS_SIZE = 100
+TOP_TERMS_CACHE_SIZE = 1024
+
+
+def normalize_term(text: str) -> str:
+    """Normalize a term for prefix matching (case-insensitive, single spaces)."""
+    return " ".join(text.casefold().split())
+
+
+@dataclass(frozen=True)
+class Term:
+    """A suggestible value of a field, with the number of documents having it."""
+
+    text: str
+    field: str
+    document_type: str
+    count: int
+
+
+class SuggestIndex:
+    """
+    An immutable index of terms, kept as a sorted list of normalized keys,
+    so that all terms with a given prefix are found by bisection. Terms that
+    are not identifiers are also indexed from the start of each of their
+    words, so that e.g. "cancer" suggests "Head and neck cancer".
+
+    The top terms of prefixes matching many entries are ranked once and
+    kept, so that short prefixes are answered without scanning all entries.
+    """
+
+    def __init__(self, terms: Iterable[Term]):
+        entries: List[Tuple[str, int]] = []
+        self._terms: List[Term] = []
+        for term in terms:
+            key = normalize_term(term.text)
+            if not key:
+                continue
+            number = len(self._terms)
+            self._terms.append(term)
+            entries.append((key, number))
+            if term.field.rsplit(".", 1)[-1] not in IDENTIFIER_FIELDS:
+                words = key.split(" ")
+                entries.extend(
+                    (" ".join(words[start:]), number) for start in range(1, len(words))
+                )
+        entries.sort()
+        self._keys = [key for key, _ in entries]
+        self._numbers = [number for _, number in entries]
+        self._top_terms: "OrderedDict[Tuple[str, Optional[str]], List[Term]]" = (
+            OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def suggest(
+        self,
+        prefix: str,
+        limit: int,
+        document_type: Optional[str] = None,
+        max_scan: int = 1000,
+    ) -> List[Term]:
+        """
+        Suggest the terms starting with a prefix (or with a word starting with
+        it), the most frequent ones first.
+
+        Args:
+            prefix: The prefix typed so far
+            limit: The maximum number of suggestions
+            document_type: Only suggest terms of this type of document
+            max_scan: The number of index entries for a prefix, above which
+                its top terms are ranked once and kept
+
+        Returns:
+            The suggested terms
+        """
+        key = normalize_term(prefix)
+        if not key:
+            return []
+        start = bisect_left(self._keys, key)
+        end = self._find_prefix_end(key, start)
+        if end - start <= max_scan or limit > TOP_TERMS_SIZE:
+            return self._rank(start, end, document_type)[:limit]
+        cache_key = (key, document_type)
+        top_terms = self._top_terms.get(cache_key)
+        if top_terms is None:
+            top_terms = self._rank(start, end, document_type)[:TOP_TERMS_SIZE]
+            self._top_terms[cache_key] = top_terms
+            while len(self._top_terms) > TOP_TERMS_CACHE_SIZE:
+                self._top_terms.popitem(last=False)
+        else:
+            self._top_terms.move_to_end(cache_key)
+        return top_terms[:limit]
+
+    def _find_prefix_end(self, key: str, start: int) -> int:
+        """Find the end of the range of entries starting with a prefix."""
+        stem = key.rstrip(chr(sys.maxunicode))
+        if not stem:
+            return len(self._keys)
+        upper_bound = stem[:-1] + chr(ord(stem[-1]) + 1)
+        return bisect_left(self._keys, upper_bound, lo=start)
+
+    def _rank(self, start: int, end: int, document_type: Optional[str]) -> List[Term]:
+        """Rank the terms of a range of entries, the most frequent ones first."""
+        found = {
+            number: self._terms[number]
+            for number in self._numbers[start:end]
+            if document_type is None
+            or self._terms[number].document_type == document_type
+        }
+        return sorted(
+            found.values(), key=lambda term: (-term.count, len(term.text), term.text)
+        )
+
+
+async def build_suggest_index(config: Config = CONFIG) -> SuggestIndex:
+    """
+    Build a suggest index from the values of the suggested fields
+    in the metadata store.
+
+    Args:
+        config: The config
+
+    Returns:
+        The suggest index
+
+    Raises:
+        DatabaseUnavailableError: If the metadata store is not available
+    """
+    document_types = sorted(SUGGEST_FIELDS)
+    counts = await asyncio.gather(
+        *(
+            get_field_value_counts(
+                document_type, SUGGEST_FIELDS[document_type], config=config
+            )
+            for document_type in document_types
+        )
+    )
+    return SuggestIndex(
+        Term(text=value, field=field, document_type=document_type, count=count)
+        for document_type, type_counts in zip(document_types, counts)
+        for (field, value), count in type_counts.items()
+    )
+
+
+SUGGEST_INDEX = VersionedIndex(build_suggest_index, name="suggest index")
+
+
+async def suggest_terms(
+    prefix: str,
+    limit: int = 10,
+    document_type: Optional[str] = None,
+    max_time_ms: Optional[int] = None,
+    config: Config = CONFIG,
+) -> Dict:
+    """
+    Suggest search terms for a prefix, from titles, accessions,
+    aliases and facet values.
+
+    Args:
+        prefix: The prefix typed so far
+        limit: The maximum number of suggestions
+        document_type: Only suggest terms of this type of document
+        max_time_ms: The time budget in milliseconds, only used to wait
+            for the index if it has not been built yet
+        config: The config
+
+    Returns:
+        A dict with the suggestions
+
+    Raises:
+        QueryTimeoutError: If no index has been built yet and it could not
+            be built within ``max_time_ms``
+        DatabaseUnavailableError: If the metadata store is not available
+            and no index has been built yet
+    """
+    index = await SUGGEST_INDEX.get(config, max_time_ms=max_time_ms)
+    terms = index.suggest(
+        prefix, limit, document_type=document_type, max_scan=config.suggest_max_scan
+    )
+    return {
+        "suggestions": [
+            {
+                "text": term.text,
+                "field": term.field,
+                "document_type": term.document_type,
+                "count": term.count,
+            }
+            for term in terms
+        ]
+    }
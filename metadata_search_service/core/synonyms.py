@@ -0,0 +1,187 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Expansion of query strings and filter values with synonymous terms"""
+
+import json
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from metadata_search_service.config import CONFIG, Config
+from metadata_search_service.models import FilterOption
+
+# Fields whose filter values are expanded with their synonyms
+SYNONYM_FILTER_FIELDS = {"has_phenotypic_feature.concept_name"}
+
+EXPANSION_CACHE_SIZE = 1024
+
+
+def normalize_term(term: str) -> str:
+    """Normalize a term for lookups (case-insensitive, single spaces)."""
+    return " ".join(term.casefold().split())
+
+
+class SynonymTable:
+    """
+    Groups of synonymous terms, stored as a tuple per group and a dict
+    mapping each normalized term to the number of its group. Expansions of
+    query strings are cached, since finding the terms in a query string
+    needs one lookup per word and phrase length.
+    """
+
+    def __init__(self, groups: Iterable[Sequence[str]] = ()):
+        self._groups: List[Tuple[str, ...]] = []
+        self._lookup: Dict[str, int] = {}
+        self._max_words = 0
+        self._expansions: "OrderedDict[str, str]" = OrderedDict()
+        self.load(groups)
+
+    def load(self, groups: Iterable[Sequence[str]]) -> None:
+        """
+        Replace the content of the table.
+
+        Args:
+            groups: The groups of synonymous terms
+        """
+        self._groups.clear()
+        self._lookup.clear()
+        self._max_words = 0
+        self._expansions.clear()
+        for group in groups:
+            terms = tuple(dict.fromkeys(term for term in group if term.strip()))
+            if len(terms) < 2:
+                continue
+            for term in terms:
+                key = normalize_term(term)
+                # a term in several groups is expanded with its first group only
+                self._lookup.setdefault(key, len(self._groups))
+                self._max_words = max(self._max_words, key.count(" ") + 1)
+            self._groups.append(terms)
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+    def get_synonyms(self, term: str) -> Tuple[str, ...]:
+        """
+        Get the synonyms of a term.
+
+        Args:
+            term: The term
+
+        Returns:
+            All terms of the group of the term (including the term itself),
+            or only the term if it has no synonyms
+        """
+        number = self._lookup.get(normalize_term(term))
+        return (term,) if number is None else self._groups[number]
+
+    def expand_query(self, query: str) -> str:
+        """
+        Expand a normalized query string with the synonyms of the terms it
+        contains, preferring the longest terms. Since the words of a text
+        search are combined with OR, the synonyms are simply appended.
+        Query strings with phrases (which have to match) are not expanded.
+        Expanding an expanded query string does not change it.
+
+        Args:
+            query: The normalized query string
+
+        Returns:
+            The expanded query string
+        """
+        if not self._groups or query == "*" or '"' in query:
+            return query
+        if query in self._expansions:
+            self._expansions.move_to_end(query)
+            return self._expansions[query]
+        words = normalize_term(query).split(" ")
+        padded_query = f" {' '.join(words)} "
+        additions: List[str] = []
+        position = 0
+        while position < len(words):
+            length = min(self._max_words, len(words) - position)
+            while length:
+                key = " ".join(words[position : position + length])
+                if key in self._lookup:
+                    break
+                length -= 1
+            if not length:
+                position += 1
+                continue
+            additions.extend(
+                term
+                for term in self._groups[self._lookup[key]]
+                if f" {normalize_term(term)} " not in padded_query
+            )
+            position += length
+        expanded = " ".join([query, *dict.fromkeys(additions)])
+        self._expansions[query] = expanded
+        while len(self._expansions) > EXPANSION_CACHE_SIZE:
+            self._expansions.popitem(last=False)
+        return expanded
+
+    def expand_filters(self, filters: List[FilterOption]) -> List[FilterOption]:
+        """
+        Expand the values of filters on fields in SYNONYM_FILTER_FIELDS
+        with their synonyms. Since filters on the same field are combined
+        with OR, each synonym is added as a filter.
+
+        Args:
+            filters: The filters
+
+        Returns:
+            The filters including the added ones
+        """
+        if not self._groups:
+            return filters
+        expanded: List[FilterOption] = []
+        for query_filter in filters:
+            expanded.append(query_filter)
+            if query_filter.key.strip() in SYNONYM_FILTER_FIELDS:
+                expanded.extend(
+                    FilterOption(key=query_filter.key, value=value)
+                    for value in self.get_synonyms(query_filter.value)
+                    if value != query_filter.value
+                )
+        return expanded
+
+
+SYNONYMS = SynonymTable()
+
+
+def load_synonyms(config: Config = CONFIG) -> None:
+    """
+    Load the synonym table from the file given in the config,
+    replacing the current one.
+
+    Args:
+        config: The config
+
+    Raises:
+        ValueError: If the file does not hold a list of groups of terms
+    """
+    groups: Any = []
+    if config.synonyms_file:
+        with open(config.synonyms_file, "r", encoding="utf8") as file:
+            groups = json.load(file)
+    if not isinstance(groups, list) or not all(
+        isinstance(group, list) and all(isinstance(term, str) for term in group)
+        for group in groups
+    ):
+        raise ValueError(
+            f"The synonyms file {config.synonyms_file} must hold a list of lists"
+            + " of synonymous terms"
+        )
+    SYNONYMS.load(groups)
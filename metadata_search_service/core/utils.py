@@ -17,6 +17,8 @@
 import time
 from typing import Any, Dict, Set
 
+from bson import Decimal128, ObjectId
+
 DEFAULT_FACET_FIELDS: Dict[str, Set[Any]] = {
     "Dataset": {
         "type",
@@ -34,6 +36,35 @@ DEFAULT_FACET_FIELDS: Dict[str, Set[Any]] = {
     "Individual": {"sex", "has_phenotypic_feature.concept_name"},
 }
 
+IDENTIFIER_FIELDS: Set[str] = {"id", "alias", "accession", "ega_accession"}
+
+# Top-level fields with free text, used for typo-tolerant matching
+# and for the context of search hits
+TEXT_FIELDS: Set[str] = {"title", "description", "name", "alias", "type"}
+
+# Fields that can be used in filters; all of them are expected to be indexed
+DEFAULT_FILTER_FIELDS: Dict[str, Set[str]] = {
+    document_type: IDENTIFIER_FIELDS | facet_fields
+    for document_type, facet_fields in DEFAULT_FACET_FIELDS.items()
+}
+
+# Fields included in the content of search hits with the 'summary' view,
+# i.e. the fields shown in result lists
+SUMMARY_FIELDS: Dict[str, Set[str]] = {
+    document_type: IDENTIFIER_FIELDS | fields
+    for document_type, fields in {
+        "Dataset": {"title", "type"},
+        "Project": {"title"},
+        "Study": {"title", "type"},
+        "Experiment": {"title", "type"},
+        "Biospecimen": {"name", "type"},
+        "Sample": {"name", "type"},
+        "Publication": {"title"},
+        "File": {"name", "format", "size"},
+        "Individual": {"sex"},
+    }.items()
+}
+
 
 def get_time_in_millis() -> int:
     """
@@ -62,4 +93,28 @@ def format_facet_key(key: str):
         "has_study.has_project.alias": "Project",
     }
 
-    return formatted_fields[key]
+    if key in formatted_fields:
+        return formatted_fields[key]
+    return key.rsplit(".", 1)[-1].replace("_", " ").title()
+
+
+def encode_bson(obj: Any) -> Any:
+    """
+    Encode BSON types that are not natively supported by orjson.
+
+    Args:
+        obj: The object to encode
+
+    Returns:
+        A JSON-compatible representation of the object
+
+    Raises:
+        TypeError: If the object cannot be encoded
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
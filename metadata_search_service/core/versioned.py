@@ -0,0 +1,99 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-memory indexes derived from the data in the metadata store"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Generic, Optional, TypeVar
+
+from metadata_search_service.config import CONFIG, Config
+from metadata_search_service.dao.document import QueryTimeoutError
+from metadata_search_service.dao.version import get_data_version
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class VersionedIndex(Generic[T]):
+    """
+    Keeps an in-memory index in line with the data version. When the data
+    changed, the index is rebuilt in the background while the previous
+    index continues to be used, and only one build runs at a time.
+    """
+
+    def __init__(self, build: Callable[[Config], Awaitable[T]], name: str):
+        self._build_index = build
+        self._name = name
+        self._index: Optional[T] = None
+        self._version: Optional[str] = None
+        self._build: Optional["asyncio.Task[T]"] = None
+
+    async def _rebuild(self, version: str, config: Config) -> T:
+        """Build the index for the given data version and swap it in."""
+        index = await self._build_index(config)
+        self._index, self._version = index, version
+        return index
+
+    def _start_build(self, version: str, config: Config) -> "asyncio.Task[T]":
+        """Start a build for the given data version, unless one is running."""
+        if self._build is None:
+            self._build = asyncio.ensure_future(self._rebuild(version, config))
+            self._build.add_done_callback(self._on_build_done)
+        return self._build
+
+    def _on_build_done(self, task: "asyncio.Task[T]") -> None:
+        """Forget a finished build, logging its failure if any."""
+        self._build = None
+        if not task.cancelled() and task.exception() is not None:
+            log.warning("Building the %s failed: %s", self._name, task.exception())
+
+    async def get(
+        self, config: Config = CONFIG, max_time_ms: Optional[int] = None
+    ) -> T:
+        """
+        Get the index, building it if there is none yet.
+
+        Args:
+            config: The config
+            max_time_ms: The time in milliseconds to wait for the index if
+                there is none yet; the build continues in the background
+
+        Returns:
+            The current index
+
+        Raises:
+            QueryTimeoutError: If there is no index yet and it could not be
+                built within ``max_time_ms``
+            DatabaseUnavailableError: If the metadata store is not available
+                and no index has been built yet
+        """
+        version = await get_data_version(config)
+        if version != self._version:
+            self._start_build(version, config)
+        index = self._index
+        if index is None:
+            # there is no index yet, so wait for the running build
+            try:
+                return await asyncio.wait_for(
+                    asyncio.shield(self._start_build(version, config)),
+                    timeout=max_time_ms / 1000 if max_time_ms else None,
+                )
+            except asyncio.TimeoutError as error:
+                raise QueryTimeoutError(
+                    f"The {self._name} could not be built within {max_time_ms} ms"
+                ) from error
+        return index
@@ -0,0 +1,168 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Circuit breaker protecting the metadata store from requests while it is failing"""
+
+import functools
+import time
+from enum import Enum
+from typing import Any, Awaitable, Callable, Tuple, Type, TypeVar
+
+from pymongo.errors import ConnectionFailure
+
+from metadata_search_service.config import CONFIG, Config
+
+T = TypeVar("T")
+
+
+class CircuitState(str, Enum):
+    """
+    Enum for the state of a circuit breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class DatabaseUnavailableError(RuntimeError):
+    """Raised when the metadata store is not available."""
+
+
+class CircuitBreaker:
+    """
+    A circuit breaker that opens after a number of consecutive failures.
+    While it is open, requests are rejected immediately. After a reset
+    timeout it becomes half-open and lets a single trial request through,
+    which either closes it again or re-opens it.
+    """
+
+    def __init__(self):
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    def get_state(self, config: Config = CONFIG) -> CircuitState:
+        """
+        Get the current state of the circuit breaker.
+
+        Args:
+            config: The config
+
+        Returns:
+            The state of the circuit breaker
+        """
+        if self._opened_at is None:
+            return CircuitState.CLOSED
+        if time.monotonic() - self._opened_at < config.circuit_breaker_reset_timeout:
+            return CircuitState.OPEN
+        return CircuitState.HALF_OPEN
+
+    def allow_request(self, config: Config = CONFIG) -> bool:
+        """
+        Check whether a request may be sent to the metadata store. In the
+        half-open state, only one trial request is allowed at a time.
+
+        Args:
+            config: The config
+
+        Returns:
+            Whether or not the request is allowed
+        """
+        state = self.get_state(config)
+        if state == CircuitState.CLOSED:
+            return True
+        if state == CircuitState.HALF_OPEN and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        """Record a successful request, which closes the circuit."""
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    def record_failure(self, config: Config = CONFIG) -> None:
+        """
+        Record a failed request, which opens the circuit if the trial
+        request failed or if the failure threshold is reached.
+
+        Args:
+            config: The config
+        """
+        self._failures += 1
+        if (
+            self._trial_running
+            or self._failures >= config.circuit_breaker_failure_threshold
+        ):
+            self._opened_at = time.monotonic()
+        self._trial_running = False
+
+    def record_abort(self) -> None:
+        """Record a request that ended for reasons unrelated to the database."""
+        self._trial_running = False
+
+    def protect(
+        self, *failure_types: Type[BaseException]
+    ) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+        """
+        Decorate a coroutine function accessing the metadata store, so that
+        it is guarded by this circuit breaker. Connection failures (including
+        server selection timeouts), ``DatabaseUnavailableError`` and the given
+        failure types count as failures.
+        The config is taken from the ``config`` keyword argument.
+
+        Args:
+            failure_types: Additional exception types that count as failures
+
+        Returns:
+            The decorator
+        """
+        counted_failures: Tuple[Type[BaseException], ...] = (
+            DatabaseUnavailableError,
+            *failure_types,
+        )
+
+        def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+            @functools.wraps(func)
+            async def wrapper(*args: Any, **kwargs: Any) -> T:
+                config = kwargs.get("config", CONFIG)
+                if not self.allow_request(config):
+                    raise DatabaseUnavailableError(
+                        "The metadata store is currently unavailable"
+                    )
+                try:
+                    result = await func(*args, **kwargs)
+                except ConnectionFailure as error:
+                    self.record_failure(config)
+                    raise DatabaseUnavailableError(
+                        f"The metadata store is currently unavailable: {error}"
+                    ) from error
+                except counted_failures:
+                    self.record_failure(config)
+                    raise
+                except BaseException:
+                    self.record_abort()
+                    raise
+                self.record_success()
+                return result
+
+            return wrapper
+
+        return decorator
+
+
+DATABASE_BREAKER = CircuitBreaker()
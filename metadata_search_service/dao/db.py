@@ -15,15 +15,62 @@
 
 """Connects to database."""
 
+import asyncio
+import logging
+from typing import Dict, Tuple
+
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
 
 from metadata_search_service.config import CONFIG, Config
 
+log = logging.getLogger(__name__)
+
+# Clients per database URL and server selection timeout,
+# together with the event loop they are bound to
+_db_clients: Dict[
+    Tuple[str, int], Tuple[asyncio.AbstractEventLoop, AsyncIOMotorClient]
+] = {}
+
 
 async def get_db_client(config: Config = CONFIG) -> AsyncIOMotorClient:
     """
     Get database client.
+
+    The client is shared by all callers on the same event loop,
+    so that they share its connection pool.
     """
-    db_url = config.db_url
-    db_client = AsyncIOMotorClient(db_url)
+    key = (config.db_url, config.db_server_selection_timeout_ms)
+    loop = asyncio.get_running_loop()
+    cached = _db_clients.get(key)
+    if cached is not None and cached[0] is loop:
+        return cached[1]
+    db_client = AsyncIOMotorClient(
+        config.db_url, serverSelectionTimeoutMS=config.db_server_selection_timeout_ms
+    )
+    _db_clients[key] = (loop, db_client)
     return db_client
+
+
+async def kill_operations(client: AsyncIOMotorClient, comment: str) -> int:
+    """
+    Kill all operations on the server that have been tagged with a given comment.
+
+    Args:
+        client: The database client
+        comment: The comment the operations have been tagged with
+
+    Returns:
+        The number of operations that have been killed
+    """
+    killed = 0
+    try:
+        operations = await client.admin.aggregate(
+            [{"$currentOp": {}}, {"$match": {"command.comment": comment}}]
+        ).to_list(None)
+        for operation in operations:
+            await client.admin.command("killOp", op=operation["opid"])
+            killed += 1
+    except PyMongoError as error:
+        log.warning("Could not kill operations tagged '%s': %s", comment, error)
+    return killed
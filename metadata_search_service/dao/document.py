@@ -15,16 +15,198 @@
 """DAO for retrieving a document from the metadata store"""
 
 
-from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+from pymongo.errors import ExecutionTimeout
 
 from metadata_search_service.config import CONFIG, Config
-from metadata_search_service.dao.db import get_db_client
-from metadata_search_service.dao.utils import build_aggregation_query
-from metadata_search_service.models import DocumentType
+from metadata_search_service.dao.circuit_breaker import DATABASE_BREAKER
+from metadata_search_service.dao.db import get_db_client, kill_operations
+from metadata_search_service.dao.references import resolve_reference_filters
+from metadata_search_service.dao.utils import (
+    EMBEDDED_COLLECTIONS,
+    build_batch_aggregation_query,
+    build_capped_count_query,
+    build_facet_value_query,
+    build_ids_query,
+    build_projection,
+    compile_aggregation_query,
+)
+from metadata_search_service.dao.version import get_data_version
+from metadata_search_service.models import CountMode
 
 # pylint: disable=too-many-locals, too-many-nested-blocks, too-many-arguments
 
+log = logging.getLogger(__name__)
+
+# Keeps references to background tasks, so that they are not garbage collected
+_background_tasks: Set[asyncio.Task] = set()
+
+
+class QueryTimeoutError(RuntimeError):
+    """Raised when the hits of a search could not be retrieved in time."""
+
+
+@dataclass
+class DocumentResults:
+    """The documents, facets and count retrieved for a search"""
+
+    docs: List[Dict]
+    facets: List[Dict]
+    count: int
+    count_mode: CountMode
+    facets_complete: bool = True
+    count_complete: bool = True
+
+
+async def _aggregate_all(
+    collection: Any, query: List, max_time_ms: Optional[int]
+) -> List[Dict]:
+    """
+    Run an aggregation and return all resulting documents. If the aggregation
+    is cancelled, the corresponding operation on the server is killed.
+    """
+    comment = uuid.uuid4().hex
+    options: Dict[str, Any] = {"comment": comment}
+    if max_time_ms:
+        options["maxTimeMS"] = max_time_ms
+    try:
+        return await collection.aggregate(query, **options).to_list(None)
+    except asyncio.CancelledError:
+        _kill_in_background(collection, comment)
+        raise
+
+
+async def _aggregate(collection: Any, query: List, max_time_ms: Optional[int]) -> Dict:
+    """Run an aggregation that yields exactly one document."""
+    [results] = await _aggregate_all(collection, query, max_time_ms)
+    return results
+
+
+async def _get_capped_count(
+    collection: Any, query: List, max_time_ms: Optional[int]
+) -> Optional[int]:
+    """
+    Run an aggregation built by ``build_capped_count_query``.
+
+    Returns:
+        The (capped) number of hits, or None if it could not be counted in time
+    """
+    try:
+        results = await _aggregate_all(collection, query, max_time_ms)
+    except ExecutionTimeout:
+        return None
+    return results[0]["total"] if results else 0
+
+
+def _kill_in_background(collection: Any, comment: str) -> None:
+    """Kill the operations tagged with a given comment in the background."""
+    log.info("Aggregation '%s' was cancelled, killing the operation", comment)
+    task = asyncio.ensure_future(kill_operations(collection.database.client, comment))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _aggregate_hits_and_summary(
+    collection: Any,
+    query: List,
+    hits_query: Optional[List],
+    max_time_ms: Optional[int],
+) -> Tuple[Dict, bool]:
+    """
+    Run the aggregation for the hits and the summary (facets and count).
+    If it exceeds the time budget, the hits are retrieved on their own,
+    dropping the summary.
+
+    Args:
+        collection: The MongoDB collection
+        query: The aggregation pipeline yielding the hits and the summary
+        hits_query: The aggregation pipeline yielding only the hits, or None
+            if there is no summary to drop
+        max_time_ms: The time budget for each query in milliseconds
+
+    Returns:
+        The results of the aggregation and whether or not they include
+        the summary
+
+    Raises:
+        QueryTimeoutError: If the hits could not be retrieved in time
+    """
+    if hits_query is not None:
+        try:
+            return await _aggregate(collection, query, max_time_ms), True
+        except ExecutionTimeout:
+            log.info("Search exceeded the time budget, retrying without summary")
+            query = hits_query
+    try:
+        return await _aggregate(collection, query, max_time_ms), hits_query is None
+    except ExecutionTimeout as error:
+        raise QueryTimeoutError(
+            f"Search exceeded the time budget of {max_time_ms} ms"
+        ) from error
+
+
+async def _count_hits(
+    collection: Any,
+    count_mode: CountMode,
+    summary: Optional[Dict],
+    skip: int,
+    limit: int,
+    hits: int,
+    count_query: Callable[[], List],
+    max_time_ms: Optional[int],
+    count_cap: int,
+) -> Tuple[int, CountMode, bool]:
+    """
+    Determine the total number of hits of a search.
+
+    Args:
+        collection: The queried MongoDB collection
+        count_mode: The requested count mode
+        summary: The result of the summary aggregation, None if it timed out
+        skip: The number of documents skipped
+        limit: The number of documents retrieved at most
+        hits: The number of documents retrieved
+        count_query: A function building the capped count query
+        max_time_ms: The time budget for the count in milliseconds
+        count_cap: The number of hits at which a capped count stops
+
+    Returns:
+        The count, the count mode used and whether or not the count is complete
+    """
+    count: Optional[int] = None
+    if count_mode == CountMode.ESTIMATED:
+        count = await collection.estimated_document_count()
+    elif count_mode == CountMode.EXACT and summary is not None:
+        count = await _get_count(summary)
+    elif limit != 0 and hits < limit and (hits or skip == 0):
+        # The current page is the last one
+        count, count_mode = skip + hits, CountMode.EXACT
+    elif count_mode == CountMode.CAPPED:
+        count = await _get_capped_count(collection, count_query(), max_time_ms)
+        if count is not None and count < count_cap:
+            count_mode = CountMode.EXACT
+    if count is None:
+        # At least the hits up to the current page exist
+        return skip + hits, CountMode.CAPPED, False
+    return count, count_mode, True
+
 
+def _get_facets(summary: Dict) -> List[Dict]:
+    """Extract the facets from the summary, sorted by count."""
+    facets = []
+    for key in summary.keys():
+        if key not in {"data", "metadata"}:
+            facet = {key: sorted(summary[key], key=lambda x: x["count"], reverse=True)}
+            facets.append(facet)
+    return facets
+
+
+@DATABASE_BREAKER.protect(QueryTimeoutError)
 async def get_documents(
     collection_name: str,
     search_query: str = "*",
@@ -32,58 +214,378 @@ async def get_documents(
     facet_fields: Optional[Set] = None,
     skip: int = 0,
     limit: int = 10,
+    count_mode: CountMode = CountMode.EXACT,
+    max_time_ms: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+    hydrate: bool = True,
     config: Config = CONFIG,
-) -> Tuple[List[Dict], List[Dict], int]:
+) -> DocumentResults:
     """
     Get documents from a given ``collection_name``.
 
+    The hits, the facets and the count are retrieved with a single
+    aggregation. If it exceeds the time budget, only the hits are retrieved
+    with a second one, so the search may take up to twice the budget.
+
     Args:
         collection_name: The name of the collection from which to fetch the documents
         search_query: The search query string to use for text serach
         skip: The number of documents to skip
         facet_fields: A set of fields to facet on
         limit: The total number of documents to retrieve
+        count_mode: How to determine the total number of hits. An estimated
+            count is only available for unfiltered queries, otherwise the
+            count is capped.
+        max_time_ms: The time budget for each query in milliseconds
+        fields: The fields of the documents to retrieve, or None to
+            retrieve the whole documents
+        hydrate: Whether or not to retrieve the documents; if not, only their
+            ids are returned, e.g. to retrieve them with ``iter_documents_by_id``
         config: The config
 
     Returns:
         A list of documents from the collection, a list of facets,
-        and a count that represents total number of hits
+        a count that represents total number of hits, the count mode used,
+        and whether or not the facets and the count are complete
+
+    Raises:
+        QueryTimeoutError: If the hits could not be retrieved in time
+        DatabaseUnavailableError: If the metadata store is not available
 
     """
     client = await get_db_client(config)
     collection = client[config.db_name][collection_name]
-    if facet_fields:
-        query = build_aggregation_query(
+    embedded_collection_name = EMBEDDED_COLLECTIONS.get(collection_name)
+    query_collection = client[config.db_name][
+        embedded_collection_name or collection_name
+    ]
+    if count_mode == CountMode.ESTIMATED and (filters or search_query != "*"):
+        count_mode = CountMode.CAPPED
+    reference_match: Dict = {}
+    if filters and not embedded_collection_name:
+        version = await get_data_version(config)
+        filters, reference_match = await resolve_reference_filters(
+            client, filters=filters, version=version, config=config
+        )
+
+    template = compile_aggregation_query(
+        search_query=search_query,
+        filters=filters,
+        facet_fields=facet_fields,
+        paginate=limit != 0,
+        embedded=embedded_collection_name is not None,
+        reference_match=reference_match,
+        count=count_mode == CountMode.EXACT,
+    )
+    hits_query = None
+    if facet_fields or count_mode == CountMode.EXACT:
+        hits_query = compile_aggregation_query(
+            search_query=search_query,
+            filters=filters,
+            paginate=limit != 0,
+            embedded=embedded_collection_name is not None,
+            reference_match=reference_match,
+            count=False,
+        ).render(skip=skip, limit=limit)
+    results, complete = await _aggregate_hits_and_summary(
+        query_collection,
+        query=template.render(skip=skip, limit=limit),
+        hits_query=hits_query,
+        max_time_ms=max_time_ms,
+    )
+    summary = results if complete else None
+
+    docs = results["data"]
+    count, count_mode, count_complete = await _count_hits(
+        query_collection,
+        count_mode=count_mode,
+        summary=summary,
+        skip=skip,
+        limit=limit,
+        hits=len(docs),
+        count_query=lambda: build_capped_count_query(
+            count_limit=config.count_cap,
             search_query=search_query,
             filters=filters,
-            facet_fields=facet_fields,
-            skip=skip,
-            limit=limit,
+            embedded=embedded_collection_name is not None,
+            reference_match=reference_match,
+        ),
+        max_time_ms=max_time_ms,
+        count_cap=config.count_cap,
+    )
+    document_ids = [x["id"] for x in docs]
+    if hydrate:
+        documents = await get_documents_by_id(
+            collection=collection,
+            document_ids=document_ids,
+            projection=build_projection(fields),
         )
     else:
-        query = build_aggregation_query(
-            search_query=search_query, filters=filters, skip=skip, limit=limit
+        documents = [{"id": x} for x in document_ids]
+
+    return DocumentResults(
+        docs=documents,
+        facets=_get_facets(summary) if facet_fields and summary else [],
+        count=count,
+        count_mode=count_mode,
+        facets_complete=summary is not None or not facet_fields,
+        count_complete=count_complete,
+    )
+
+
+@DATABASE_BREAKER.protect(QueryTimeoutError)
+async def get_documents_for_filters(
+    collection_name: str,
+    search_query: str = "*",
+    filter_sets: Optional[List[Optional[List]]] = None,
+    skip: int = 0,
+    limit: int = 10,
+    count_mode: CountMode = CountMode.EXACT,
+    max_time_ms: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+    config: Config = CONFIG,
+) -> List[DocumentResults]:
+    """
+    Get documents from a given ``collection_name`` for several searches that
+    share the same search query string but differ in their filters.
+    The text search runs only once for all of them, in a single aggregation,
+    and documents that are hits of several searches are retrieved only once.
+    No facets are computed, and an estimated count is not supported.
+
+    Args:
+        collection_name: The name of the collection from which to fetch the documents
+        search_query: The search query string to use for text serach
+        filter_sets: The filters per search
+        skip: The number of documents to skip
+        limit: The total number of documents to retrieve
+        count_mode: How to determine the total number of hits
+            (either exact or capped)
+        max_time_ms: The time budget for the query in milliseconds
+        fields: The fields of the documents to retrieve, or None to
+            retrieve the whole documents
+        config: The config
+
+    Returns:
+        The documents and the count per search, in the order of the filters
+
+    Raises:
+        QueryTimeoutError: If the query could not be completed in time
+        DatabaseUnavailableError: If the metadata store is not available
+    """
+    client = await get_db_client(config)
+    collection = client[config.db_name][collection_name]
+    embedded_collection_name = EMBEDDED_COLLECTIONS.get(collection_name)
+    query_collection = client[config.db_name][
+        embedded_collection_name or collection_name
+    ]
+    branches: List[Tuple[Optional[List], Optional[Dict]]] = []
+    for filters in filter_sets or []:
+        reference_match: Dict = {}
+        if filters and not embedded_collection_name:
+            version = await get_data_version(config)
+            filters, reference_match = await resolve_reference_filters(
+                client, filters=filters, version=version, config=config
+            )
+        branches.append((filters, reference_match))
+    query = build_batch_aggregation_query(
+        search_query=search_query,
+        branches=branches,
+        skip=skip,
+        limit=limit,
+        embedded=embedded_collection_name is not None,
+        count_limit=config.count_cap if count_mode == CountMode.CAPPED else None,
+    )
+    try:
+        results = await _aggregate(query_collection, query, max_time_ms)
+    except ExecutionTimeout as error:
+        raise QueryTimeoutError(
+            f"Search exceeded the time budget of {max_time_ms} ms"
+        ) from error
+
+    document_ids = {
+        index: [x["id"] for x in results[f"data_{index}"]]
+        for index in range(len(branches))
+    }
+    unique_ids = list(dict.fromkeys(x for ids in document_ids.values() for x in ids))
+    documents = {
+        x["id"]: x
+        for x in await get_documents_by_id(
+            collection, unique_ids, projection=build_projection(fields)
         )
+    }
+    document_results = []
+    for index, ids in document_ids.items():
+        count = await _get_count({"metadata": results[f"metadata_{index}"]})
+        document_results.append(
+            DocumentResults(
+                docs=[documents[x] for x in ids if x in documents],
+                facets=[],
+                count=count,
+                count_mode=(
+                    CountMode.CAPPED
+                    if count_mode == CountMode.CAPPED and count >= config.count_cap
+                    else CountMode.EXACT
+                ),
+            )
+        )
+    return document_results
 
-    if collection_name == DocumentType.DATASET:
-        collection_embedded = client[config.db_name]["DatasetEmbedded"]
-        [results] = await collection_embedded.aggregate(query).to_list(None)
-    else:
-        [results] = await collection.aggregate(query).to_list(None)
 
-    docs = results["data"]
-    count = await _get_count(results)
-    dataset_list = await get_datasets_list(collection=collection, dataset_ids=docs)
+@DATABASE_BREAKER.protect(QueryTimeoutError)
+async def get_document_ids(
+    collection_name: str,
+    search_query: str = "*",
+    filters: Optional[List] = None,
+    max_ids: Optional[int] = None,
+    max_time_ms: Optional[int] = None,
+    config: Config = CONFIG,
+) -> Optional[List[str]]:
+    """
+    Get the ids of all documents from a given ``collection_name`` that match
+    a search, in the same order in which ``get_documents`` pages through them.
 
-    facets = []
-    if facet_fields:
-        for key in results.keys():
-            if key not in {"data", "metadata"}:
-                facet = {
-                    key: sorted(results[key], key=lambda x: x["count"], reverse=True)
-                }
-                facets.append(facet)
-    return dataset_list, facets, count
+    Args:
+        collection_name: The name of the collection from which to fetch the ids
+        search_query: The search query string to use for text serach
+        filters: A list of filters to use in the query
+        max_ids: The maximum number of ids to retrieve
+        max_time_ms: The time budget for the query in milliseconds
+        config: The config
+
+    Returns:
+        The ids of the documents, or None if there are more than ``max_ids``
+
+    Raises:
+        QueryTimeoutError: If the ids could not be retrieved in time
+        DatabaseUnavailableError: If the metadata store is not available
+    """
+    client = await get_db_client(config)
+    embedded_collection_name = EMBEDDED_COLLECTIONS.get(collection_name)
+    query_collection = client[config.db_name][
+        embedded_collection_name or collection_name
+    ]
+    reference_match: Dict = {}
+    if filters and not embedded_collection_name:
+        version = await get_data_version(config)
+        filters, reference_match = await resolve_reference_filters(
+            client, filters=filters, version=version, config=config
+        )
+    query = build_ids_query(
+        search_query=search_query,
+        filters=filters,
+        embedded=embedded_collection_name is not None,
+        reference_match=reference_match,
+        limit=max_ids + 1 if max_ids is not None else None,
+    )
+    comment = uuid.uuid4().hex
+    options: Dict[str, Any] = {"comment": comment}
+    if max_time_ms:
+        options["maxTimeMS"] = max_time_ms
+    try:
+        document_ids = [
+            x["id"] async for x in query_collection.aggregate(query, **options)
+        ]
+    except asyncio.CancelledError:
+        _kill_in_background(query_collection, comment)
+        raise
+    except ExecutionTimeout as error:
+        raise QueryTimeoutError(
+            f"Search exceeded the time budget of {max_time_ms} ms"
+        ) from error
+    if max_ids is not None and len(document_ids) > max_ids:
+        return None
+    return document_ids
+
+
+@DATABASE_BREAKER.protect(QueryTimeoutError)
+async def count_facet_values(
+    collection_name: str,
+    field: str,
+    values: List[str],
+    search_query: str = "*",
+    filters: Optional[List] = None,
+    max_time_ms: Optional[int] = None,
+    config: Config = CONFIG,
+) -> Dict[str, int]:
+    """
+    Count the documents from a given ``collection_name`` that match a search,
+    per value of a facet field, only considering the given values.
+
+    Args:
+        collection_name: The name of the collection to search in
+        field: The facet field
+        values: The values of the facet field to count
+        search_query: The search query string to use for text serach
+        filters: A list of filters to use in the query
+        max_time_ms: The time budget for the query in milliseconds
+        config: The config
+
+    Returns:
+        A dict mapping the values that occur in any hit to the number of hits
+
+    Raises:
+        QueryTimeoutError: If the values could not be counted in time
+        DatabaseUnavailableError: If the metadata store is not available
+    """
+    if not values:
+        return {}
+    client = await get_db_client(config)
+    embedded_collection_name = EMBEDDED_COLLECTIONS.get(collection_name)
+    query_collection = client[config.db_name][
+        embedded_collection_name or collection_name
+    ]
+    reference_match: Dict = {}
+    if filters and not embedded_collection_name:
+        version = await get_data_version(config)
+        filters, reference_match = await resolve_reference_filters(
+            client, filters=filters, version=version, config=config
+        )
+    query = build_facet_value_query(
+        field,
+        values,
+        search_query=search_query,
+        filters=filters,
+        embedded=embedded_collection_name is not None,
+        reference_match=reference_match,
+    )
+    try:
+        results = await _aggregate(query_collection, query, max_time_ms)
+    except ExecutionTimeout as error:
+        raise QueryTimeoutError(
+            f"Counting facet values exceeded the time budget of {max_time_ms} ms"
+        ) from error
+    return {x["_id"]: x["count"] for x in results["values"]}
+
+
+@DATABASE_BREAKER.protect()
+async def get_documents_by_ids(
+    collection_name: str,
+    document_ids: List[str],
+    fields: Optional[List[str]] = None,
+    config: Config = CONFIG,
+) -> List[Dict]:
+    """
+    Get documents from a given ``collection_name`` by their ids.
+
+    Args:
+        collection_name: The name of the collection from which to fetch the documents
+        document_ids: The ids of the documents
+        fields: The fields of the documents to retrieve, or None to
+            retrieve the whole documents
+        config: The config
+
+    Returns:
+        The documents, in the order of the ids
+
+    Raises:
+        DatabaseUnavailableError: If the metadata store is not available
+    """
+    client = await get_db_client(config)
+    return await get_documents_by_id(
+        client[config.db_name][collection_name],
+        document_ids,
+        projection=build_projection(fields),
+    )
 
 
 async def _get_count(results: Dict) -> int:
@@ -102,21 +604,63 @@ async def _get_count(results: Dict) -> int:
     return count
 
 
-async def get_datasets_list(collection: Any, dataset_ids: List[str]):
+async def get_documents_by_id(
+    collection: Any, document_ids: List[str], projection: Optional[Dict] = None
+) -> List[Dict]:
     """
-    Given a list of dataset ids in docs and a collection name, query the metadata store
-    and return the list of datasets.
-
+    Given a list of document ids and a collection, query the metadata store
+    with a single query and return the documents in the order of the ids.
 
     Args:
-        collection (Any): MongoDB collection name
-        dataset_ids (List[str]): list of dataset ids
+        collection: The MongoDB collection
+        document_ids: The ids of the documents
+        projection: The projection to apply to the documents
 
     Returns:
-        dataset_list: list of datasets
+        The list of documents, omitting ids for which no document exists
+    """
+    if not document_ids:
+        return []
+    if projection is None:
+        projection = {"_id": 0}
+    if "id" not in projection and len(projection) > 1:
+        projection = {**projection, "id": 1}
+    documents = {
+        document["id"]: document
+        async for document in collection.find({"id": {"$in": document_ids}}, projection)
+    }
+    return [documents[x] for x in document_ids if x in documents]
+
+
+async def iter_documents_by_id(
+    collection_name: str,
+    document_ids: List[str],
+    fields: Optional[List[str]] = None,
+    batch_size: int = 100,
+    config: Config = CONFIG,
+) -> AsyncIterator[List[Dict]]:
+    """
+    Retrieve documents by their ids in batches, so that they can be processed
+    before all of them have been retrieved.
+
+    Args:
+        collection_name: The name of the collection
+        document_ids: The ids of the documents
+        fields: The fields of the documents to retrieve, or None to
+            retrieve the whole documents
+        batch_size: The maximum number of documents per batch
+        config: The config
+
+    Yields:
+        The batches of documents, in the order of the ids
+
+    Raises:
+        DatabaseUnavailableError: If the metadata store is not available
     """
-    dataset_list = []
-    for item in dataset_ids:
-        dataset = await collection.find_one({"id": item["id"]}, {"_id": 0})  # type: ignore
-        dataset_list.append(dataset)
-    return dataset_list
+    for start in range(0, len(document_ids), batch_size):
+        yield await get_documents_by_ids(
+            collection_name,
+            document_ids[start : start + batch_size],
+            fields=fields,
+            config=config,
+        )
@@ -0,0 +1,216 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cache of referenced documents used to resolve nested filters without joins"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from metadata_search_service.config import CONFIG, Config
+from metadata_search_service.dao.utils import get_collection_name, split_join_path
+
+# pylint: disable=too-many-arguments
+
+
+def get_field_values(document: Dict, field: str) -> List[Any]:
+    """
+    Get all values of a (possibly nested) field from a document,
+    traversing arrays the same way as MongoDB does.
+
+    Args:
+        document: The document
+        field: Field name, e.g. has_attribute.value
+
+    Returns:
+        A flat list of values
+    """
+    values: List[Any] = [document]
+    for part in field.split("."):
+        nested_values = []
+        for value in values:
+            items = value if isinstance(value, list) else [value]
+            for item in items:
+                if isinstance(item, dict) and part in item:
+                    nested_values.append(item[part])
+        values = nested_values
+    flat_values: List[Any] = []
+    for value in values:
+        if isinstance(value, list):
+            flat_values.extend(value)
+        else:
+            flat_values.append(value)
+    return flat_values
+
+
+class ReferenceCache:
+    """
+    Process-level cache of referenced collections (e.g. Study or Project),
+    holding their documents keyed by id.
+
+    Collections are cached as a whole, so that filters can be evaluated against
+    them. The total number of cached documents is bounded, least recently used
+    collections are evicted first, and collections that would not fit are never
+    cached. The cache is cleared whenever the data version changes.
+    """
+
+    def __init__(self):
+        self._version: Optional[str] = None
+        self._tables: "OrderedDict[str, Dict[str, Dict]]" = OrderedDict()
+        self._uncacheable: Set[str] = set()
+
+    @property
+    def size(self) -> int:
+        """The number of cached documents."""
+        return sum(len(table) for table in self._tables.values())
+
+    def _set_version(self, version: str) -> None:
+        if version != self._version:
+            self._tables.clear()
+            self._uncacheable.clear()
+            self._version = version
+
+    def _evict(self, required: int, max_entries: int) -> None:
+        while self._tables and self.size + required > max_entries:
+            self._tables.popitem(last=False)
+
+    async def get_table(
+        self,
+        client: AsyncIOMotorClient,
+        collection_name: str,
+        version: str,
+        config: Config = CONFIG,
+    ) -> Optional[Dict[str, Dict]]:
+        """
+        Get all documents of a collection keyed by id.
+
+        Args:
+            client: The database client
+            collection_name: The name of the referenced collection
+            version: The current data version
+            config: The config
+
+        Returns:
+            The documents keyed by id, or None if the collection
+            is too large to be cached
+        """
+        self._set_version(version)
+        if collection_name in self._tables:
+            self._tables.move_to_end(collection_name)
+            return self._tables[collection_name]
+        if collection_name in self._uncacheable:
+            return None
+
+        max_entries = config.reference_cache_max_entries
+        collection = client[config.db_name][collection_name]
+        if await collection.estimated_document_count() > max_entries:
+            self._uncacheable.add(collection_name)
+            return None
+        documents = await collection.find({}, {"_id": 0}).to_list(None)
+        table = {document["id"]: document for document in documents}
+        self._evict(len(table), max_entries)
+        self._tables[collection_name] = table
+        return table
+
+
+REFERENCE_CACHE = ReferenceCache()
+
+
+async def resolve_reference_ids(
+    client: AsyncIOMotorClient,
+    hops: Tuple[str, ...],
+    field: str,
+    values: Iterable[str],
+    version: str,
+    config: Config = CONFIG,
+) -> Optional[Set[str]]:
+    """
+    Resolve a nested filter into the ids of the documents referenced by
+    the first hop, by evaluating it against the cached referenced collections.
+
+    Args:
+        client: The database client
+        hops: The chain of references, e.g. ("has_study", "has_project")
+        field: The field within the last referenced document, e.g. alias
+        values: The accepted values for field
+        version: The current data version
+        config: The config
+
+    Returns:
+        A set of ids or None if any of the referenced collections is not cached
+    """
+    accepted = set(values)
+    ids: Set[str] = set()
+    for position in reversed(range(len(hops))):
+        table = await REFERENCE_CACHE.get_table(
+            client, get_collection_name(hops[position]), version, config
+        )
+        if table is None:
+            return None
+        ids = {
+            id_
+            for id_, document in table.items()
+            if accepted.intersection(get_field_values(document, field))
+        }
+        accepted, field = ids, hops[position]
+    return ids
+
+
+async def resolve_reference_filters(
+    client: AsyncIOMotorClient,
+    filters: List,
+    version: str,
+    config: Config = CONFIG,
+) -> Tuple[List, Dict]:
+    """
+    Replace filters on referenced documents (e.g. has_study.type) by
+    a match on the ids of the referenced documents, so that no join is
+    needed to apply them.
+
+    Args:
+        client: The database client
+        filters: A list of filters
+        version: The current data version
+        config: The config
+
+    Returns:
+        The filters that could not be resolved and a dictionary that
+        represents the match query for the resolved filters
+    """
+    grouped: Dict[str, List] = {}
+    for query_filter in filters:
+        grouped.setdefault(query_filter.key, []).append(query_filter)
+
+    remaining_filters: List = []
+    conditions: List[Dict] = []
+    for key, key_filters in grouped.items():
+        hops, field = split_join_path(key)
+        ids = None
+        if hops:
+            ids = await resolve_reference_ids(
+                client, hops, field, [x.value for x in key_filters], version, config
+            )
+        if ids is None:
+            remaining_filters.extend(key_filters)
+        else:
+            conditions.append({hops[0]: {"$in": sorted(ids)}})
+
+    match_query: Dict = {}
+    if len(conditions) == 1:
+        match_query = conditions[0]
+    elif conditions:
+        match_query = {"$and": conditions}
+    return remaining_filters, match_query
@@ -0,0 +1,120 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""DAO for retrieving the values of fields from the metadata store"""
+
+from collections import Counter
+from typing import AsyncIterator, Dict, Iterable, List, Set, Tuple
+
+from metadata_search_service.config import CONFIG, Config
+from metadata_search_service.dao.circuit_breaker import DATABASE_BREAKER
+from metadata_search_service.dao.db import get_db_client
+from metadata_search_service.dao.references import get_field_values
+from metadata_search_service.dao.utils import (
+    EMBEDDED_COLLECTIONS,
+    build_match_stages,
+    build_projection,
+)
+
+
+async def _aggregate_fields(
+    collection_name: str, fields: List[str], config: Config
+) -> AsyncIterator[Dict]:
+    """
+    Iterate over all documents of a collection (or its pre-embedded variant),
+    projected to the given fields, resolving fields of referenced documents.
+    """
+    embedded_collection_name = EMBEDDED_COLLECTIONS.get(collection_name)
+    client = await get_db_client(config)
+    collection = client[config.db_name][embedded_collection_name or collection_name]
+    pipeline = build_match_stages(
+        facet_fields=set(fields), embedded=embedded_collection_name is not None
+    )
+    pipeline.append({"$project": build_projection(fields)})
+    async for document in collection.aggregate(pipeline):
+        yield document
+
+
+def _get_strings(document: Dict, field: str) -> Set[str]:
+    """Get the distinct non-empty strings among the values of a field."""
+    return {
+        value
+        for value in get_field_values(document, field)
+        if isinstance(value, str) and value.strip()
+    }
+
+
+@DATABASE_BREAKER.protect()
+async def get_field_value_counts(
+    collection_name: str, fields: Iterable[str], config: Config = CONFIG
+) -> Dict[Tuple[str, str], int]:
+    """
+    Count the documents of a given collection per value of the given fields,
+    which may be fields of referenced documents. The pre-embedded variant of
+    the collection is used if it exists.
+
+    Args:
+        collection_name: The name of the collection
+        fields: The fields to count the values of
+        config: The config
+
+    Returns:
+        A dict mapping pairs of field and (non-empty string) value
+        to the number of documents with that value
+
+    Raises:
+        DatabaseUnavailableError: If the metadata store is not available
+    """
+    fields = sorted(fields)
+    counts: Counter = Counter()
+    async for document in _aggregate_fields(collection_name, fields, config):
+        for field in fields:
+            counts.update((field, value) for value in _get_strings(document, field))
+    return dict(counts)
+
+
+@DATABASE_BREAKER.protect()
+async def get_document_texts(
+    collection_name: str, fields: Iterable[str], config: Config = CONFIG
+) -> Dict[str, List[str]]:
+    """
+    Get the texts of the given fields of all documents of a given collection,
+    which may be fields of referenced documents. The pre-embedded variant of
+    the collection is used if it exists.
+
+    Args:
+        collection_name: The name of the collection
+        fields: The fields to get the texts of
+        config: The config
+
+    Returns:
+        A dict mapping the ids of the documents to the (non-empty string)
+        values of the fields
+
+    Raises:
+        DatabaseUnavailableError: If the metadata store is not available
+    """
+    fields = sorted(set(fields) | {"id"})
+    texts: Dict[str, List[str]] = {}
+    async for document in _aggregate_fields(collection_name, fields, config):
+        texts[document["id"]] = sorted(
+            {
+                value
+                for field in fields
+                if field != "id"
+                for value in _get_strings(document, field)
+            }
+        )
+    return texts
@@ -14,12 +14,21 @@
 # limitations under the License.
 """DAO specific utilities for the Metadata Search Service"""
 
-from typing import Dict, List, Optional, Set
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
 
 import stringcase
 
 NON_NESTED_FIELDS: Set = {"has_attribute"}
 
+# Collections for which a pre-embedded variant exists, i.e. all ``has_*``
+# references are already resolved and no lookup is required
+EMBEDDED_COLLECTIONS: Dict[str, str] = {"Dataset": "DatasetEmbedded"}
+
+PLAN_CACHE_SIZE = 256
+PIPELINE_CACHE_SIZE = 1024
+
 
 # pylint: disable=too-many-locals, too-many-arguments
 
@@ -84,8 +93,183 @@ def build_match_query(filters: List) -> Dict:
     return subpipelines
 
 
-def build_lookup_query(
+@dataclass(frozen=True)
+class Join:
+    """
+    A single hop in a join plan.
+
+    Attributes:
+        field: The local field holding the reference(s), e.g. ``has_study``
+        collection: The collection the reference(s) point to, e.g. ``Study``
+        fields: The fields that are read from the joined documents
+        children: Joins that have to be performed within the joined documents
+    """
+
+    field: str
+    collection: str
+    fields: FrozenSet[str] = frozenset()
+    children: Tuple["Join", ...] = ()
+
+
+def split_join_path(field: str) -> Tuple[Tuple[str, ...], str]:
+    """
+    Split a field into the chain of ``has_*`` references that need to be
+    joined and the remaining field within the last joined document.
+
+    Args:
+        field: Field name, e.g. ``has_study.has_project.alias``
+
+    Returns:
+        A tuple of the join hops and the remaining field,
+        e.g. ``(("has_study", "has_project"), "alias")``
+
+    """
+    hops: List[str] = []
+    remaining = field
+    while check_filter_field(remaining):
+        hop, remaining = remaining.split(".", 1)
+        hops.append(hop)
+    return tuple(hops), remaining
+
+
+def get_collection_name(field: str) -> str:
+    """
+    Get the name of the collection a ``has_*`` field refers to.
+
+    Args:
+        field: Field name, e.g. ``has_phenotypic_feature``
+
+    Returns:
+        The collection name, e.g. ``PhenotypicFeature``
+
+    """
+    return stringcase.pascalcase(field.split("has_", 1)[1])
+
+
+def _build_joins(paths: Iterable[Tuple[Tuple[str, ...], str]]) -> Tuple[Join, ...]:
+    """Merge join paths that share a common prefix into a tree of joins."""
+    fields: Dict[str, Set[str]] = {}
+    nested: Dict[str, List[Tuple[Tuple[str, ...], str]]] = {}
+    for hops, remaining in paths:
+        fields.setdefault(hops[0], set())
+        nested.setdefault(hops[0], [])
+        if len(hops) > 1:
+            nested[hops[0]].append((hops[1:], remaining))
+        else:
+            fields[hops[0]].add(remaining)
+    return tuple(
+        Join(
+            field=field,
+            collection=get_collection_name(field),
+            fields=frozenset(fields[field]),
+            children=_build_joins(nested[field]),
+        )
+        for field in sorted(fields)
+    )
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def plan_joins(fields: FrozenSet[str], embedded: bool = False) -> Tuple[Join, ...]:
+    """
+    Plan the minimal set of joins that is needed to resolve the given fields,
+    where each ``has_*`` reference is joined once no matter how many fields
+    are read from it. Plans are cached per set of fields.
+
+    Args:
+        fields: The filter and facet fields referenced by a query
+        embedded: Whether the queried collection is pre-embedded
+
+    Returns:
+        A tuple of joins on the top level of the queried collection
+
+    """
+    if embedded:
+        return ()
+    paths = set()
+    for field in fields:
+        hops, remaining = split_join_path(field)
+        if hops:
+            paths.add((hops, remaining))
+    return _build_joins(paths)
+
+
+def get_query_fields(
     filters: Optional[List] = None, facet_fields: Optional[Set] = None
+) -> FrozenSet[str]:
+    """
+    Get all fields that are referenced by the filters and facets of a query.
+
+    Args:
+        filters: A list of filters to use in the match query
+        facet_fields: A set of fields to use for faceting
+
+    Returns:
+        A set of field names
+
+    """
+    fields: Set[str] = set()
+    if filters:
+        fields.update(x.key for x in filters)
+    if facet_fields:
+        fields.update(facet_fields)
+    return frozenset(fields)
+
+
+def build_join_projection(join: Join) -> Dict:
+    """
+    Build a projection for the documents fetched by a given join, that
+    only keeps the fields read by the query and the nested references.
+
+    Args:
+        join: The join to build the projection for
+
+    Returns:
+        A dictionary that represents the projection query
+
+    """
+    projection: Dict = {"_id": 0, "id": 1}
+    for field in sorted(join.fields):
+        projection[field] = 1
+    for child in join.children:
+        projection[child.field] = 1
+    # Drop paths that are already covered by a parent path (path collision)
+    return {
+        field: value
+        for field, value in projection.items()
+        if not any(field.startswith(f"{other}.") for other in projection)
+    }
+
+
+def build_join_lookup(join: Join) -> Dict:
+    """
+    Build a lookup query for a given join, including the lookups
+    of all nested joins. The joined documents are projected to the
+    fields that are actually read by the query.
+
+    Args:
+        join: The join to build the lookup query for
+
+    Returns:
+        A dictionary that represents the lookup query
+
+    """
+    pipeline: List = [{"$project": build_join_projection(join)}]
+    for child in join.children:
+        pipeline.append({"$lookup": build_join_lookup(child)})
+    # the concise correlated form can use the index on the referenced ids
+    return {
+        "from": join.collection,
+        "localField": join.field,
+        "foreignField": "id",
+        "pipeline": pipeline,
+        "as": join.field,
+    }
+
+
+def build_lookup_query(
+    filters: Optional[List] = None,
+    facet_fields: Optional[Set] = None,
+    embedded: bool = False,
 ) -> List:
     """
     Build a lookup query for the MongoDB aggregation pipeline.
@@ -93,34 +277,14 @@ def build_lookup_query(
     Args:
         filters: A list of filters to use in the match query
         facet_fields: A list of fields to use for faceting
+        embedded: Whether the queried collection is pre-embedded
 
     Returns:
         A list that represents one or more lookup queries
 
     """
-    subpipelines: List = []
-    nested_fields = set()
-    if filters:
-        filter_fields = [x.key for x in filters]
-        nested_fields.update(get_nested_fields(filter_fields))
-
-    if facet_fields:
-        nested_fields.update(get_nested_fields(list(facet_fields)))
-
-    seen = set()
-    for top_level_field, _ in nested_fields:
-        lookup_pipeline = {}
-        c_name = stringcase.pascalcase(top_level_field.split("has_", 1)[1])
-        if c_name not in seen:
-            seen.add(c_name)
-            lookup_pipeline["from"] = c_name
-            if top_level_field == "has_study":
-                top_level_field = "study"
-            lookup_pipeline["localField"] = top_level_field
-            lookup_pipeline["foreignField"] = "id"
-            lookup_pipeline["as"] = top_level_field
-            subpipelines.append(lookup_pipeline)
-    return subpipelines
+    fields = get_query_fields(filters=filters, facet_fields=facet_fields)
+    return [build_join_lookup(join) for join in plan_joins(fields, embedded)]
 
 
 def build_facet_query(facet_fields: Set) -> Dict:
@@ -184,27 +348,89 @@ def build_projection_query(
     return subpipelines
 
 
-def build_aggregation_query(
+def build_count_query(count_limit: Optional[int] = None) -> List:
+    """
+    Build a query that counts the total number of hits
+    for the MongoDB aggregation pipeline.
+
+    Args:
+        count_limit: The number of hits after which counting stops
+
+    Returns:
+        A list that represents the count query
+
+    """
+    count_query: List = [{"$count": "total"}]
+    if count_limit is not None:
+        count_query.insert(0, {"$limit": count_limit})
+    return count_query
+
+
+def build_pagination_query(skip: int = 0, limit: int = 10) -> List:
+    """
+    Build a query that sorts and paginates the hits
+    for the MongoDB aggregation pipeline.
+
+    Args:
+        skip: The number of documents to skip
+        limit: The total number of documents to retrieve
+            (if limit = 0, use no pagination)
+
+    Returns:
+        A list that represents the pagination query
+
+    """
+    if limit != 0:
+        # Sort by _id, apply skip and limit
+        return [
+            {"$sort": {"_id": 1}},
+            {"$project": {"id": "$id"}},
+            {"$skip": skip},
+            {"$limit": limit},
+        ]
+    # Sort by _id and only keep the ids, since all hits end up
+    # in a single document that must not exceed the BSON size limit
+    return [{"$sort": {"_id": 1}}, {"$project": {"_id": 0, "id": 1}}]
+
+
+def build_projection(fields: Optional[Iterable[str]] = None) -> Dict:
+    """
+    Build the projection used to retrieve the content of search hits.
+
+    Args:
+        fields: The (normalized) fields to include,
+            or None to include the whole documents
+
+    Returns:
+        A dict that represents the projection
+    """
+    projection: Dict[str, int] = {"_id": 0}
+    for field in fields or []:
+        projection[field] = 1
+    return projection
+
+
+def build_match_stages(
     search_query: str = "*",
     filters: Optional[List] = None,
     facet_fields: Optional[Set] = None,
-    skip: int = 0,
-    limit: int = 10,
+    embedded: bool = False,
+    reference_match: Optional[Dict] = None,
 ) -> List:
     """
-    Build an aggregation query for the MongoDB aggregation pipeline,
-    by generating the appropriate pipelines (and sub-pipelines) that
-    can be used to query the underlying MongoDB store.
+    Build the stages of the MongoDB aggregation pipeline that select the hits
+    of a search, i.e. the text search, lookups and filters.
 
     Args:
         search_query: The search query string to use for text serach
         filters: A list of filters to use in the query
-        facet_fields: A set of fields to use for faceting
-        skip: The number of documents to skip
-        limit: The total number of documents to retrieve
+        facet_fields: A set of fields to use for faceting, which are looked up
+        embedded: Whether the queried collection is pre-embedded
+        reference_match: A match query on the ids of referenced documents,
+            that replaces filters on nested fields
 
     Returns:
-        A list that represents the projection query
+        A list of stages of the aggregation pipeline
 
     """
     pipelines: List = []
@@ -214,9 +440,15 @@ def build_aggregation_query(
         match_pipeline = {"$match": text_search_query}
         pipelines.append(match_pipeline)
 
+    if reference_match:
+        # Apply filters that have been resolved to referenced ids
+        pipelines.append({"$match": reference_match})
+
     if filters or facet_fields:
         # Perform lookup
-        lookup_query = build_lookup_query(filters=filters, facet_fields=facet_fields)
+        lookup_query = build_lookup_query(
+            filters=filters, facet_fields=facet_fields, embedded=embedded
+        )
         if lookup_query:
             for query in lookup_query:
                 lookup_pipeline = {"$lookup": query}
@@ -227,26 +459,184 @@ def build_aggregation_query(
         match_query = build_match_query(filters=filters)
         match_pipeline = {"$match": match_query}
         pipelines.append(match_pipeline)
+    return pipelines
+
+
+def build_ids_query(
+    search_query: str = "*",
+    filters: Optional[List] = None,
+    embedded: bool = False,
+    reference_match: Optional[Dict] = None,
+    limit: Optional[int] = None,
+) -> List:
+    """
+    Build an aggregation query that yields the ids of all hits of a search,
+    one document per hit, in the same order as the paginated hits.
+
+    Args:
+        search_query: The search query string to use for text serach
+        filters: A list of filters to use in the query
+        embedded: Whether the queried collection is pre-embedded
+        reference_match: A match query on the ids of referenced documents,
+            that replaces filters on nested fields
+        limit: The maximum number of ids to retrieve
+
+    Returns:
+        A list that represents the aggregation query
+
+    """
+    pipelines = build_match_stages(
+        search_query=search_query,
+        filters=filters,
+        embedded=embedded,
+        reference_match=reference_match,
+    )
+    pipelines.extend([{"$sort": {"_id": 1}}, {"$project": {"_id": 0, "id": 1}}])
+    if limit is not None:
+        pipelines.append({"$limit": limit})
+    return pipelines
+
+
+def build_capped_count_query(
+    count_limit: int,
+    search_query: str = "*",
+    filters: Optional[List] = None,
+    embedded: bool = False,
+    reference_match: Optional[Dict] = None,
+) -> List:
+    """
+    Build an aggregation query that counts the hits of a search up to a
+    given limit. Unlike a count in a $facet stage, which receives all hits,
+    the limit stops the preceding stages once it is reached.
+
+    Args:
+        count_limit: The number of hits after which counting stops
+        search_query: The search query string to use for text serach
+        filters: A list of filters to use in the query
+        embedded: Whether the queried collection is pre-embedded
+        reference_match: A match query on the ids of referenced documents,
+            that replaces filters on nested fields
+
+    Returns:
+        A list that represents the aggregation query, yielding no document
+        if there are no hits
+
+    """
+    pipelines = build_match_stages(
+        search_query=search_query,
+        filters=filters,
+        embedded=embedded,
+        reference_match=reference_match,
+    )
+    pipelines.extend(build_count_query(count_limit=count_limit))
+    return pipelines
+
+
+def build_facet_value_query(
+    field: str,
+    values: List[str],
+    search_query: str = "*",
+    filters: Optional[List] = None,
+    embedded: bool = False,
+    reference_match: Optional[Dict] = None,
+) -> List:
+    """
+    Build an aggregation query that counts the hits of a search per value of
+    a facet field, restricted to the given values. Unlike the facets of a
+    search, each value in an array is counted on its own, i.e. the result is
+    the number of hits having a value.
+
+    Args:
+        field: The facet field
+        values: The values of the facet field to count
+        search_query: The search query string to use for text serach
+        filters: A list of filters to use in the query
+        embedded: Whether the queried collection is pre-embedded
+        reference_match: A match query on the ids of referenced documents,
+            that replaces filters on nested fields
+
+    Returns:
+        A list that represents the aggregation query, yielding one document
+        with the values and their counts
+
+    """
+    pipelines = build_match_stages(
+        search_query=search_query,
+        filters=filters,
+        facet_fields={field},
+        embedded=embedded,
+        reference_match=reference_match,
+    )
+    pipelines.extend(
+        [
+            {"$project": {"value": f"${field}"}},
+            # values of nested fields of arrays of documents are nested arrays
+            {"$unwind": "$value"},
+            {"$unwind": "$value"},
+            {"$match": {"value": {"$in": values}}},
+            {
+                "$facet": {
+                    "values": [
+                        # count each document only once per value
+                        {"$group": {"_id": {"document": "$_id", "value": "$value"}}},
+                        {"$group": {"_id": "$_id.value", "count": {"$sum": 1}}},
+                    ]
+                }
+            },
+        ]
+    )
+    return pipelines
+
+
+def build_aggregation_query(
+    search_query: str = "*",
+    filters: Optional[List] = None,
+    facet_fields: Optional[Set] = None,
+    skip: int = 0,
+    limit: int = 10,
+    embedded: bool = False,
+    reference_match: Optional[Dict] = None,
+    count: bool = True,
+) -> List:
+    """
+    Build an aggregation query for the MongoDB aggregation pipeline,
+    by generating the appropriate pipelines (and sub-pipelines) that
+    can be used to query the underlying MongoDB store.
+
+    Args:
+        search_query: The search query string to use for text serach
+        filters: A list of filters to use in the query
+        facet_fields: A set of fields to use for faceting
+        skip: The number of documents to skip
+        limit: The total number of documents to retrieve
+        embedded: Whether the queried collection is pre-embedded
+        reference_match: A match query on the ids of referenced documents,
+            that replaces filters on nested fields
+        count: Whether or not to count the total number of hits
+
+    Returns:
+        A list that represents the projection query
+
+    """
+    pipelines = build_match_stages(
+        search_query=search_query,
+        filters=filters,
+        facet_fields=facet_fields,
+        embedded=embedded,
+        reference_match=reference_match,
+    )
 
     facet_query = {}
     if facet_fields:
         # Faceting
         facet_query = build_facet_query(facet_fields=facet_fields)
 
-    # Pagination (if limit = 0, use no pagination)
-    facet_query["metadata"] = [{"$count": "total"}]
+    if count:
+        # Count hits
+        facet_query["metadata"] = build_count_query()
 
-    if limit != 0:
-        # Sort by _id, apply skip and limit
-        facet_query["data"] = [
-            {"$sort": {"_id": 1}},
-            {"$project": {"id": "$id"}},
-            {"$skip": skip},
-            {"$limit": limit},
-        ]
-    else:
-        # Sort by _id
-        facet_query["data"] = [{"$sort": {"_id": 1}}]
+    # Pagination
+    facet_query["data"] = build_pagination_query(skip=skip, limit=limit)
 
     facet_pipeline = {"$facet": facet_query}
     pipelines.append(facet_pipeline)
@@ -258,3 +648,202 @@ def build_aggregation_query(
     projection_pipeline = {"$project": projection_query}
     pipelines.append(projection_pipeline)
     return pipelines
+
+
+def build_batch_aggregation_query(
+    search_query: str = "*",
+    branches: Optional[List[Tuple[Optional[List], Optional[Dict]]]] = None,
+    skip: int = 0,
+    limit: int = 10,
+    embedded: bool = False,
+    count_limit: Optional[int] = None,
+) -> List:
+    """
+    Build an aggregation query that counts and paginates the hits of several
+    searches, which share the same search query string but differ in their
+    filters. The text search and all lookups are only performed once,
+    and each set of filters is applied in a separate branch.
+
+    Args:
+        search_query: The search query string to use for text serach
+        branches: The filters and the match query on the ids of referenced
+            documents per search
+        skip: The number of documents to skip
+        limit: The total number of documents to retrieve
+        embedded: Whether the queried collection is pre-embedded
+        count_limit: The number of hits at which the counts are capped; since
+            all branches receive all hits, this does not save any work
+
+    Returns:
+        A list that represents the aggregation query, yielding one document
+        with the count (``metadata_<index>``) and the ids of the hits
+        (``data_<index>``) per branch
+    """
+    pipelines: List = []
+    if search_query and search_query not in {"*"}:
+        pipelines.append({"$match": build_text_search_query(search_query)})
+
+    all_filters = [x for filters, _ in branches or [] for x in filters or []]
+    for query in build_lookup_query(filters=all_filters, embedded=embedded):
+        pipelines.append({"$lookup": query})
+
+    pagination_query: List = [
+        {"$sort": {"_id": 1}},
+        {"$project": {"_id": 0, "id": 1}},
+    ]
+    if limit != 0:
+        pagination_query.extend([{"$skip": skip}, {"$limit": limit}])
+    facet_query = {}
+    for index, (filters, reference_match) in enumerate(branches or []):
+        conditions = []
+        if reference_match:
+            conditions.append(reference_match)
+        if filters:
+            conditions.append(build_match_query(filters=filters))
+        branch_query = []
+        if conditions:
+            branch_query.append(
+                {
+                    "$match": conditions[0]
+                    if len(conditions) == 1
+                    else {"$and": conditions}
+                }
+            )
+        facet_query[f"metadata_{index}"] = branch_query + build_count_query(
+            count_limit=count_limit
+        )
+        facet_query[f"data_{index}"] = branch_query + pagination_query
+    pipelines.append({"$facet": facet_query})
+    return pipelines
+
+
+class CompiledFilter(NamedTuple):
+    """A hashable representation of a filter"""
+
+    key: str
+    value: str
+
+
+@dataclass(frozen=True)
+class PipelineTemplate:
+    """
+    A compiled aggregation pipeline with slots for skip and limit, and for the
+    match on the ids of the hits and of referenced documents (if any). These
+    ids are not part of the cached template, since there may be many of them
+    (e.g. for fuzzy queries) and they hardly ever repeat.
+    The stages are shared between requests and must not be modified.
+    """
+
+    stages: Tuple[Dict, ...]
+    match_stage: Optional[int] = None
+    match: Optional[Dict] = None
+
+    def render(self, skip: int = 0, limit: int = 10) -> List:
+        """
+        Render the aggregation pipeline for a given page.
+
+        Args:
+            skip: The number of documents to skip
+            limit: The total number of documents to retrieve
+
+        Returns:
+            A list that represents the aggregation pipeline
+        """
+        pipelines = list(self.stages)
+        if self.match_stage is not None:
+            pipelines[self.match_stage] = {"$match": self.match}
+        for index, stage in enumerate(pipelines):
+            if "$facet" in stage and "data" in stage["$facet"]:
+                facet_query = dict(stage["$facet"])
+                facet_query["data"] = [
+                    {"$skip": skip}
+                    if "$skip" in step
+                    else {"$limit": limit}
+                    if "$limit" in step
+                    else step
+                    for step in facet_query["data"]
+                ]
+                pipelines[index] = {"$facet": facet_query}
+        return pipelines
+
+
+@lru_cache(maxsize=PIPELINE_CACHE_SIZE)
+def _compile_aggregation_query(
+    search_query: str,
+    filters: Tuple[CompiledFilter, ...],
+    facet_fields: FrozenSet[str],
+    paginate: bool,
+    embedded: bool,
+    match: bool,
+    count: bool,
+) -> PipelineTemplate:
+    """Build and cache a pipeline template from hashable parameters."""
+    # placeholder for the match on ids, which is only known when rendering
+    match_query: Dict = {"id": {"$in": []}}
+    pipelines = build_aggregation_query(
+        search_query=search_query,
+        filters=list(filters),
+        facet_fields=set(facet_fields),
+        limit=1 if paginate else 0,
+        embedded=embedded,
+        reference_match=match_query if match else None,
+        count=count,
+    )
+    match_stage = next(
+        (
+            index
+            for index, stage in enumerate(pipelines)
+            if stage.get("$match") is match_query
+        ),
+        None,
+    )
+    return PipelineTemplate(stages=tuple(pipelines), match_stage=match_stage)
+
+
+def compile_aggregation_query(
+    search_query: str = "*",
+    filters: Optional[List] = None,
+    facet_fields: Optional[Set] = None,
+    paginate: bool = True,
+    embedded: bool = False,
+    reference_match: Optional[Dict] = None,
+    count: bool = True,
+) -> PipelineTemplate:
+    """
+    Compile an aggregation query into a pipeline template, which can be
+    rendered for any page. Templates are cached, so the pipeline is only
+    built once for queries that are equal except for skip and limit, and
+    for the ids they filter on or that replace filters on nested fields.
+    Filters are expected to be normalized (sorted and deduplicated).
+
+    Args:
+        search_query: The search query string to use for text serach
+        filters: A list of filters to use in the query
+        facet_fields: A set of fields to use for faceting
+        paginate: Whether or not skip and limit are applied
+        embedded: Whether the queried collection is pre-embedded
+        reference_match: A match query on the ids of referenced documents,
+            that replaces filters on nested fields
+        count: Whether or not to count the total number of hits
+
+    Returns:
+        The pipeline template
+
+    """
+    match = dict(reference_match or {})
+    document_ids = [x.value for x in filters or [] if x.key == "id"]
+    if document_ids:
+        # the keys of the reference match are references, so they never clash
+        match["id"] = {"$in": document_ids}
+    template = _compile_aggregation_query(
+        search_query,
+        tuple(CompiledFilter(x.key, x.value) for x in filters or [] if x.key != "id"),
+        frozenset(facet_fields or ()),
+        paginate,
+        embedded,
+        bool(match),
+        count,
+    )
+    if not match:
+        return template
+    return replace(template, match=match)
@@ -0,0 +1,159 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tracking of the version of the data in the metadata store"""
+
+import asyncio
+import hashlib
+import time
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import ConnectionFailure
+
+from metadata_search_service.config import CONFIG, Config
+from metadata_search_service.dao.circuit_breaker import DatabaseUnavailableError
+from metadata_search_service.dao.db import get_db_client
+
+
+async def _get_collection_state(
+    client: AsyncIOMotorClient,
+    db_name: str,
+    name: str,
+    update_field: Optional[str] = None,
+):
+    """
+    Get the number of documents, the most recent _id and, if an update field
+    is given, the most recent value of that field of a collection.
+    """
+    collection = client[db_name][name]
+    count = await collection.estimated_document_count()
+    latest = await collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    state = [name, count, str(latest["_id"]) if latest else None]
+    if update_field:
+        updated = await collection.find_one(
+            {update_field: {"$exists": True}},
+            {"_id": 0, update_field: 1},
+            sort=[(update_field, -1)],
+        )
+        state.append(str(updated[update_field]) if updated else None)
+    return tuple(state)
+
+
+async def compute_data_version(
+    client: AsyncIOMotorClient, db_name: str, update_field: Optional[str] = None
+) -> str:
+    """
+    Compute a fingerprint of the data in the metadata store, that changes
+    whenever documents are added to or removed from any collection.
+
+    Documents that are updated in place are only detected if the update
+    field, which ingestion must set on every write, is given. Otherwise
+    ingestion needs to invalidate the data version (DATA_VERSION.invalidate)
+    after such updates.
+
+    Args:
+        client: The database client
+        db_name: The name of the database
+        update_field: The name of a field holding the time of the last change
+
+    Returns:
+        The data version
+    """
+    names = await client[db_name].list_collection_names()
+    states = await asyncio.gather(
+        *(
+            _get_collection_state(client, db_name, name, update_field)
+            for name in sorted(names)
+        )
+    )
+    return hashlib.sha256(repr(states).encode("utf8")).hexdigest()[:16]
+
+
+class DataVersionTracker:
+    """
+    Keeps track of the data version, which is recomputed at most
+    once per data_version_refresh_interval. Concurrent requests share
+    a single recomputation.
+    """
+
+    def __init__(self):
+        self._version: Optional[str] = None
+        self._checked_at = float("-inf")
+        self._refresh: Optional["asyncio.Task[str]"] = None
+
+    async def _refresh_version(self, config: Config) -> str:
+        """Recompute the data version, falling back to the last known one."""
+        client = await get_db_client(config)
+        try:
+            version = await compute_data_version(
+                client, config.db_name, config.data_version_update_field
+            )
+        except ConnectionFailure as error:
+            if self._version is None:
+                raise DatabaseUnavailableError(
+                    f"The metadata store is currently unavailable: {error}"
+                ) from error
+            version = self._version
+        self._version, self._checked_at = version, time.monotonic()
+        return version
+
+    def _on_refresh_done(self, task: "asyncio.Task[str]") -> None:
+        """Forget a finished recomputation."""
+        self._refresh = None
+        if not task.cancelled():
+            # retrieve the exception, the waiting requests have seen it
+            task.exception()
+
+    async def get(self, config: Config = CONFIG) -> str:
+        """
+        Get the current data version. If it cannot be recomputed because the
+        metadata store is not available, the last known version is used.
+
+        Raises:
+            DatabaseUnavailableError: If the metadata store is not available
+                and no version is known yet
+        """
+        version = self._version
+        if (
+            version is None
+            or time.monotonic() - self._checked_at
+            >= config.data_version_refresh_interval
+        ):
+            if self._refresh is None:
+                self._refresh = asyncio.ensure_future(self._refresh_version(config))
+                self._refresh.add_done_callback(self._on_refresh_done)
+            version = await asyncio.shield(self._refresh)
+        return version
+
+    def invalidate(self) -> None:
+        """Force the data version to be recomputed on next access."""
+        self._checked_at = float("-inf")
+
+
+DATA_VERSION = DataVersionTracker()
+
+
+async def get_data_version(config: Config = CONFIG) -> str:
+    """
+    Get the current version of the data in the metadata store.
+
+    Args:
+        config: The config
+
+    Returns:
+        The data version
+    """
+    return await DATA_VERSION.get(config)
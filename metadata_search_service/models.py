@@ -37,6 +37,34 @@ class DocumentType(str, Enum):
     FILE = "File"
 
 
+class CountMode(str, Enum):
+    """
+    Enum for the mode used to determine the total number of hits.
+    """
+
+    EXACT = "exact"
+    CAPPED = "capped"
+    ESTIMATED = "estimated"
+
+
+class ContentView(str, Enum):
+    """
+    Enum for the named sets of fields to include in the content of search hits.
+    """
+
+    SUMMARY = "summary"
+    FULL = "full"
+
+
+class FacetValueMatch(str, Enum):
+    """
+    Enum for how the values of a facet are matched against a text.
+    """
+
+    PREFIX = "prefix"
+    SUBSTRING = "substring"
+
+
 class FacetOption(BaseModel):
     """
     Represent values and their corresponding count for a facet.
@@ -89,10 +117,18 @@ class SearchHit(BaseModel):
     document_type: DocumentType = Field(description="The type of document")
     id: str = Field(description="The unique identifier of the document")
     context: Optional[str] = Field(
-        None, description="The context where this search hit was found"
+        None,
+        description=(
+            "The context where this search hit was found: snippets of the document"
+            + " as HTML, with the terms of the query string marked as <em>"
+            + " elements (only if requested)"
+        ),
     )
     content: Optional[Dict] = Field(
-        None, description="The full document of the search hit"
+        None,
+        description=(
+            "The document of the search hit, restricted to the requested fields"
+        ),
     )
 
 
@@ -104,5 +140,96 @@ class SearchResult(BaseModel):
     facets: List[Facet] = Field(
         description="One or more facets that summarizes the hits"
     )
+    facets_complete: bool = Field(
+        True,
+        description="Whether or not the facets could be computed within the time budget",
+    )
     count: int = Field(description="Number of hits")
+    count_mode: CountMode = Field(
+        CountMode.EXACT,
+        description=(
+            "The mode used to determine the number of hits: 'exact', 'capped' (there"
+            + " are at least as many hits as reported) or 'estimated'"
+        ),
+    )
+    count_complete: bool = Field(
+        True,
+        description="Whether or not the count could be computed within the time budget",
+    )
+    stale: bool = Field(
+        False,
+        description=(
+            "Whether or not this is a previously cached result, served because"
+            + " the metadata store is currently unavailable"
+        ),
+    )
     hits: List[SearchHit] = Field(description="One or more search hits")
+    session_id: Optional[str] = Field(
+        None,
+        description=(
+            "The id of the search session, if one was requested and created,"
+            + " from which further pages can be retrieved"
+        ),
+    )
+
+
+class DocumentTypeSearchResult(SearchResult):
+    """
+    Represents the Search Result for one type of document within a search
+    across all types of documents, or for one query within a batch search.
+    """
+
+    document_type: DocumentType = Field(description="The type of document")
+    error: Optional[str] = Field(
+        None,
+        description=(
+            "Why the search failed for this type of document or query, in which case"
+            + " there are no hits and neither facets nor count are complete"
+        ),
+    )
+
+
+class FederatedSearchResult(BaseModel):
+    """
+    Represents the Search Result across all types of documents.
+    """
+
+    results: List[DocumentTypeSearchResult] = Field(
+        description=(
+            "The results per type of document, omitting types to which"
+            + " the filters do not apply"
+        )
+    )
+
+
+class BatchSearchResult(BaseModel):
+    """
+    Represents the Search Results of a batch of queries.
+    """
+
+    results: List[DocumentTypeSearchResult] = Field(
+        description="The results in the order of the queries"
+    )
+
+
+class Suggestion(BaseModel):
+    """
+    Represents a suggested search term.
+    """
+
+    text: str = Field(description="The suggested term")
+    field: str = Field(description="The field having the term as value")
+    document_type: DocumentType = Field(
+        description="The type of document having the term"
+    )
+    count: int = Field(description="Number of documents having the term")
+
+
+class SuggestResult(BaseModel):
+    """
+    Represents the suggestions for a prefix.
+    """
+
+    suggestions: List[Suggestion] = Field(
+        description="The suggested terms, the most frequent ones first"
+    )
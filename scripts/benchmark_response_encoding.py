@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares the CPU time needed to encode search responses with and without
+validation of the response model (i.e. the trusted output mode).
+"""
+
+import json
+import time
+from typing import Callable, Dict
+
+import typer
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from metadata_search_service.api.responses import dump_json
+from metadata_search_service.models import SearchResult
+
+
+def make_result(hits: int, files_per_hit: int) -> Dict:
+    """Make a search result with hits that resemble embedded datasets"""
+    return {
+        "facets": [
+            {
+                "key": "type",
+                "name": "Dataset Type",
+                "options": [{"option": f"type {i}", "count": i} for i in range(10)],
+            }
+        ],
+        "facets_complete": True,
+        "count": hits,
+        "count_mode": "exact",
+        "count_complete": True,
+        "stale": False,
+        "hits": [
+            {
+                "document_type": "Dataset",
+                "id": f"DS{i}",
+                "context": None,
+                "content": {
+                    "_id": ObjectId(),
+                    "id": f"DS{i}",
+                    "title": f"Dataset {i} for head and neck cancer RNA",
+                    "description": "Lorem ipsum dolor sit amet " * 20,
+                    "has_study": {
+                        "id": f"S{i}",
+                        "title": "Comprehensive Genomic Analysis of Rare Cancers",
+                        "has_project": {"id": "P1", "alias": "NCT_MASTER"},
+                    },
+                    "has_file": [
+                        {
+                            "id": f"F{i}-{j}",
+                            "name": f"file_{j}.bam",
+                            "format": "bam",
+                            "checksum": "0" * 64,
+                            "size": 1024 * j,
+                        }
+                        for j in range(files_per_hit)
+                    ],
+                },
+            }
+            for i in range(hits)
+        ],
+    }
+
+
+def validated(result: Dict) -> bytes:
+    """Encode a result like FastAPI does for a response model"""
+    content = jsonable_encoder(
+        SearchResult.parse_obj(result), custom_encoder={ObjectId: str}
+    )
+    return json.dumps(content).encode("utf8")
+
+
+def measure(encode: Callable[[Dict], bytes], result: Dict, repeat: int) -> float:
+    """Return the average CPU time (in milliseconds) to encode a result"""
+    start = time.process_time()
+    for _ in range(repeat):
+        encode(result)
+    return (time.process_time() - start) / repeat * 1000
+
+
+def main(hits: int = 100, files_per_hit: int = 20, repeat: int = 20):
+    """Compare encoding search results with and without validation"""
+    result = make_result(hits, files_per_hit)
+    typer.echo(f"Encoding {hits} hits ({len(dump_json(result))} bytes):")
+    validated_time = measure(validated, result, repeat)
+    trusted_time = measure(dump_json, result, repeat)
+    typer.echo(f"  - validated (pydantic + json): {validated_time:.2f} ms")
+    typer.echo(f"  - trusted (orjson):            {trusted_time:.2f} ms")
+    typer.echo(
+        f"  - CPU time saved per response: {validated_time - trusted_time:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    typer.run(main)
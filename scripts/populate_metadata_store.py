@@ -25,6 +25,9 @@ from pathlib import Path
 import motor.motor_asyncio
 import typer
 
+from metadata_search_service.core.utils import DEFAULT_FILTER_FIELDS
+from metadata_search_service.dao.utils import EMBEDDED_COLLECTIONS, split_join_path
+
 # pylint: disable=too-many-arguments
 
 HERE: Path = Path(__file__).parent.resolve()
@@ -76,6 +79,25 @@ async def create_text_index(db_url: str, db_name: str, collection_name: str):
     await collection.create_index([("$**", "text")])
 
 
+async def create_filter_indexes(db_url: str, db_name: str, collection_name: str):
+    """Create indexes on all fields that can be filtered on"""
+    client = motor.motor_asyncio.AsyncIOMotorClient(db_url)
+    collection = client[db_name][collection_name]
+    embedded = collection_name in EMBEDDED_COLLECTIONS.values()
+    document_type = next(
+        (
+            document_type
+            for document_type, name in EMBEDDED_COLLECTIONS.items()
+            if name == collection_name
+        ),
+        collection_name,
+    )
+    for field in DEFAULT_FILTER_FIELDS.get(document_type, ()):
+        hops, _ = split_join_path(field)
+        # nested filters on non-embedded collections match on the references
+        await collection.create_index(field if embedded or not hops else hops[0])
+
+
 async def insert_records(db_url, db_name, collection_name, records):
     """Insert a set of records to the database"""
     client = motor.motor_asyncio.AsyncIOMotorClient(db_url)
@@ -115,6 +137,7 @@ def main(
             populate_record(example_dir, record_type, db_url, db_name, collection_name)
         )
         loop.run_until_complete(create_text_index(db_url, db_name, collection_name))
+        loop.run_until_complete(create_filter_indexes(db_url, db_name, collection_name))
     typer.echo("Done.")
 
 
@@ -222,3 +222,221 @@ def test_search(  # noqa: C901
                     assert (
                         key in facets[facet_name] and facets[facet_name][key] == value
                     )
+
+
+def test_search_invalid_filter_key(mongo_app_fixture: MongoAppFixture):  # noqa: F811
+    """Test that unknown filter keys are rejected before querying"""
+    client = mongo_app_fixture.app_client
+    response = client.post(
+        "/rpc/search?document_type=Dataset",
+        json={"query": "*", "filters": [{"key": "tpye", "value": "x"}]},
+    )
+    assert response.status_code == 422
+    detail = response.json()["detail"]
+    assert detail["invalid_keys"] == ["tpye"]
+    assert "type" in detail["allowed_keys"]
+
+
+@pytest.mark.parametrize(
+    "query,count_mode,expected_mode",
+    [
+        ({"query": "*"}, "estimated", "estimated"),
+        ({"query": "metastasis"}, "estimated", "exact"),
+        ({"query": "*"}, "capped", "exact"),
+    ],
+)
+def test_search_count_mode(
+    mongo_app_fixture: MongoAppFixture,  # noqa: F811
+    query,
+    count_mode,
+    expected_mode,
+):
+    """Test that the count mode used is reported"""
+    client = mongo_app_fixture.app_client
+    response = client.post(
+        f"/rpc/search?document_type=Dataset&count_mode={count_mode}", json=query
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["count_mode"] == expected_mode
+    assert data["count"] == 3
+
+
+def test_search_cacheable(mongo_app_fixture: MongoAppFixture):  # noqa: F811
+    """Test that the GET variant of search can be revalidated via ETag"""
+    client = mongo_app_fixture.app_client
+    url = "/search?document_type=Dataset&query=*&filter=type:Exome%20sequencing"
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.json()["count"] == 1
+    etag = response.headers["ETag"]
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+def test_search_fields(mongo_app_fixture: MongoAppFixture):  # noqa: F811
+    """Test restricting the content of hits to a view or to given fields"""
+    client = mongo_app_fixture.app_client
+    response = client.post(
+        "/rpc/search?document_type=Dataset&view=summary", json={"query": "*"}
+    )
+    assert response.status_code == 200
+    for hit in response.json()["hits"]:
+        assert hit["content"]["id"] == hit["id"]
+        assert "title" in hit["content"]
+        assert "has_file" not in hit["content"]
+
+    response = client.get("/search?document_type=Dataset&fields=type")
+    assert response.status_code == 200
+    for hit in response.json()["hits"]:
+        assert set(hit["content"]) <= {"id", "type"}
+
+    response = client.get("/search?document_type=Dataset&fields=$where")
+    assert response.status_code == 400
+
+
+def test_search_streamed(mongo_app_fixture: MongoAppFixture):  # noqa: F811
+    """Test that large result pages are streamed with the same content"""
+    client = mongo_app_fixture.app_client
+    url = "/rpc/search?document_type=Dataset&return_facets=true"
+    paged = client.post(url + "&limit=10", json={"query": "*"}).json()
+    streamed = client.post(url + "&limit=0", json={"query": "*"}).json()
+    assert streamed == paged
+
+
+def test_search_all(mongo_app_fixture: MongoAppFixture):  # noqa: F811
+    """Test searching all types of documents in one request"""
+    client = mongo_app_fixture.app_client
+    response = client.post("/rpc/search/all?limit=1", json={"query": "*"})
+    assert response.status_code == 200
+    results = {x["document_type"]: x for x in response.json()["results"]}
+    assert results["Dataset"]["count"] == 3
+    assert len(results["Dataset"]["hits"]) == 1
+    assert all(x["error"] is None for x in results.values())
+
+
+def test_search_batch(mongo_app_fixture: MongoAppFixture):  # noqa: F811
+    """Test that a batch of queries yields the same results as single queries"""
+    client = mongo_app_fixture.app_client
+    queries = [
+        {"query": "*", "filters": [{"key": "type", "value": "Exome sequencing"}]},
+        {"query": "*"},
+    ]
+    url = "/rpc/search?document_type=Dataset"
+    expected = [client.post(url, json=query).json() for query in queries]
+    response = client.post("/rpc/search/batch?document_type=Dataset", json=queries)
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [x["count"] for x in results] == [x["count"] for x in expected]
+    assert [x["hits"] for x in results] == [x["hits"] for x in expected]
+
+
+def test_search_session(mongo_app_fixture: MongoAppFixture):  # noqa: F811
+    """Test paging through the hits of a search session"""
+    client = mongo_app_fixture.app_client
+    response = client.post(
+        "/rpc/search?document_type=Dataset&limit=1&session=true", json={"query": "*"}
+    )
+    assert response.status_code == 200
+    first_page = response.json()
+    session_id = first_page["session_id"]
+    assert session_id
+
+    response = client.get(f"/search/sessions/{session_id}?skip=1&limit=2")
+    assert response.status_code == 200
+    second_page = response.json()
+    assert second_page["count"] == first_page["count"] == 3
+    assert len(second_page["hits"]) == 2
+    assert first_page["hits"][0]["id"] not in [x["id"] for x in second_page["hits"]]
+
+    response = client.get(f"/search/sessions/{session_id}?skip=1&limit=0")
+    assert response.status_code == 200
+    assert response.json()["hits"] == second_page["hits"]
+
+    response = client.get("/search/sessions/unknown")
+    assert response.status_code == 404
+
+
+def test_suggest(mongo_app_fixture: MongoAppFixture):  # noqa: F811
+    """Test suggesting search terms for a prefix"""
+    client = mongo_app_fixture.app_client
+    response = client.post(
+        "/rpc/search?document_type=Dataset&limit=1", json={"query": "*"}
+    )
+    assert response.status_code == 200
+    title = response.json()["hits"][0]["content"]["title"]
+
+    response = client.get(f"/rpc/suggest?prefix={title[:4]}&document_type=Dataset")
+    assert response.status_code == 200
+    suggestions = response.json()["suggestions"]
+    assert (title, "title") in [(x["text"], x["field"]) for x in suggestions]
+    assert all(x["document_type"] == "Dataset" for x in suggestions)
+
+    response = client.get("/rpc/suggest?prefix=a&limit=0")
+    assert response.status_code == 400
+
+
+def test_facet_values(mongo_app_fixture: MongoAppFixture):  # noqa: F811
+    """Test searching within the values of a facet"""
+    client = mongo_app_fixture.app_client
+    response = client.post(
+        "/rpc/search/facet_values?document_type=Dataset&facet=type&limit=100",
+        json={"query": "*"},
+    )
+    assert response.status_code == 200
+    options = response.json()["options"]
+    assert options
+    value = options[0]["option"]
+
+    response = client.post(
+        "/rpc/search/facet_values?document_type=Dataset&facet=type"
+        + f"&text={value[1:3]}&match=substring",
+        json={"query": "*", "filters": [{"key": "type", "value": value}]},
+    )
+    assert response.status_code == 200
+    assert value in [x["option"] for x in response.json()["options"]]
+
+    response = client.post(
+        "/rpc/search/facet_values?document_type=Dataset&facet=title",
+        json={"query": "*"},
+    )
+    assert response.status_code == 400
+
+
+def test_search_fuzzy(mongo_app_fixture: MongoAppFixture):  # noqa: F811
+    """Test that fuzzy searches tolerate typos"""
+    client = mongo_app_fixture.app_client
+    response = client.post(
+        "/rpc/search?document_type=Dataset&limit=1", json={"query": "*"}
+    )
+    assert response.status_code == 200
+    hit = response.json()["hits"][0]
+    word = max(hit["content"]["title"].split(), key=len)
+    typo = word[:-2] + word[-1] + word[-2]
+
+    response = client.post(
+        "/rpc/search?document_type=Dataset&fuzzy=true", json={"query": typo}
+    )
+    assert response.status_code == 200
+    assert hit["id"] in [x["id"] for x in response.json()["hits"]]
+
+
+def test_search_highlight(mongo_app_fixture: MongoAppFixture):  # noqa: F811
+    """Test that hits get a context highlighting the terms of the query"""
+    client = mongo_app_fixture.app_client
+    response = client.post(
+        "/rpc/search?document_type=Dataset&limit=1", json={"query": "*"}
+    )
+    assert response.status_code == 200
+    word = max(response.json()["hits"][0]["content"]["title"].split(), key=len)
+
+    response = client.post(
+        "/rpc/search?document_type=Dataset&view=summary&highlight=true",
+        json={"query": word},
+    )
+    assert response.status_code == 200
+    hits = response.json()["hits"]
+    assert hits
+    assert any("<em>" in (hit["context"] or "") for hit in hits)
@@ -0,0 +1,101 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Minimal stand-ins for the motor client, collections and cursors"""
+
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Union
+
+
+def _project(document: Dict, projection: Optional[Dict]) -> Dict:
+    """Apply a simple inclusion or exclusion projection to a document"""
+    if not projection:
+        return document
+    include = any(value for key, value in projection.items() if key != "_id")
+    return {
+        key: value
+        for key, value in document.items()
+        if projection.get(key, not include)
+    }
+
+
+class FakeCursor:
+    """Minimal stand-in for a motor cursor"""
+
+    def __init__(self, result: Union[List[Dict], Exception]):
+        self.result = result
+
+    async def to_list(self, length: Optional[int]) -> List[Dict]:
+        """Return all documents or raise the result, if it is an exception"""
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+    async def __aiter__(self) -> AsyncIterator[Dict]:
+        for document in await self.to_list(None):
+            yield document
+
+
+class FakeCollection:
+    """
+    Minimal stand-in for a motor collection. Aggregations yield the result
+    registered under the "name" of their first stage.
+    """
+
+    def __init__(
+        self,
+        documents: Iterable[Dict] = (),
+        aggregations: Optional[Dict[str, Union[Dict, Exception]]] = None,
+    ):
+        self.documents = list(documents)
+        self.aggregations = aggregations or {}
+        self.options: List[Any] = []
+
+    async def estimated_document_count(self) -> int:
+        """Return the number of documents"""
+        return len(self.documents)
+
+    def find(
+        self, query: Optional[Dict] = None, projection: Optional[Dict] = None
+    ) -> FakeCursor:
+        """Return a cursor over the (projected) documents with the given ids"""
+        self.options.append(projection)
+        ids = (query or {}).get("id", {}).get("$in")
+        return FakeCursor(
+            [
+                _project(document, projection)
+                for document in self.documents
+                if ids is None or document["id"] in ids
+            ]
+        )
+
+    def aggregate(self, query: List[Dict], **options) -> FakeCursor:
+        """Return a cursor over the result registered for the query"""
+        self.options.append(options)
+        result = self.aggregations[query[0]["name"]]
+        return FakeCursor(result if isinstance(result, Exception) else [result])
+
+
+class FakeClient(dict):
+    """Minimal stand-in for a motor client with a single database"""
+
+    def __init__(self, collections: Dict[str, List[Dict]]):
+        super().__init__()
+        self.collections = collections
+
+    def __getitem__(self, db_name: str) -> Dict[str, FakeCollection]:
+        return {
+            name: FakeCollection(documents)
+            for name, documents in self.collections.items()
+        }
@@ -0,0 +1,95 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test admission control for searches"""
+
+import asyncio
+
+import pytest
+
+from metadata_search_service.api import main
+from metadata_search_service.config import Config
+from metadata_search_service.core.admission import (
+    AdmissionController,
+    ConcurrencyLimiter,
+    OverloadedError,
+)
+
+
+@pytest.mark.asyncio
+async def test_limiter_hands_over_slots():
+    """Test that waiting operations get a slot once one is released"""
+    limiter = ConcurrencyLimiter()
+    assert await limiter.acquire(max_concurrent=1, max_queued=1)
+    waiting = asyncio.ensure_future(limiter.acquire(max_concurrent=1, max_queued=1))
+    await asyncio.sleep(0)
+    assert limiter.queued == 1
+    assert not await limiter.acquire(max_concurrent=1, max_queued=1)
+    limiter.release()
+    assert await waiting
+    assert limiter.active == 1
+    limiter.release()
+    assert limiter.active == 0
+
+
+@pytest.mark.asyncio
+async def test_limiter_queue_timeout():
+    """Test that operations waiting too long are rejected"""
+    limiter = ConcurrencyLimiter()
+    assert await limiter.acquire(max_concurrent=1, max_queued=1)
+    assert not await limiter.acquire(max_concurrent=1, max_queued=1, timeout=0.01)
+    assert limiter.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_admission_controller_sheds_load():
+    """Test that expensive searches are limited separately from cheap ones"""
+    controller = AdmissionController()
+    config = Config(
+        expensive_search_max_concurrent=1,
+        expensive_search_max_queued=0,
+        overload_retry_after=3,
+    )
+    assert controller.is_expensive(return_facets=True, limit=10, config=config)
+    assert not controller.is_expensive(return_facets=False, limit=10, config=config)
+    async with controller.admit(expensive=True, config=config):
+        async with controller.admit(expensive=False, config=config):
+            pass
+        with pytest.raises(OverloadedError) as error:
+            async with controller.admit(expensive=True, config=config):
+                pass
+        assert error.value.retry_after == 3
+    assert controller.expensive.active == 0
+
+
+@pytest.mark.asyncio
+async def test_streamed_search_holds_admission(monkeypatch):
+    """Test that a streamed search keeps its slot until all hits are streamed"""
+    controller = AdmissionController()
+    monkeypatch.setattr(main, "SEARCH_ADMISSION", controller)
+
+    async def hit_batches():
+        assert controller.expensive.active == 1
+        yield [{"id": "1"}]
+
+    async def search():
+        return {"count": 1}, hit_batches()
+
+    chunks = await main._start_stream(
+        main._stream_search(search, expensive=True, config=Config())
+    )
+    assert controller.expensive.active == 1
+    assert b"".join([x async for x in chunks]) == b'{"count":1,"hits":[{"id":"1"}]}'
+    assert controller.expensive.active == 0
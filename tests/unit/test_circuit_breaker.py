@@ -0,0 +1,136 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the circuit breaker and serving stale results"""
+
+from typing import Any, Dict
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import ServerSelectionTimeoutError
+
+from metadata_search_service.config import Config
+from metadata_search_service.core import search
+from metadata_search_service.core.result_cache import ResultCache
+from metadata_search_service.dao.circuit_breaker import (
+    CircuitBreaker,
+    CircuitState,
+    DatabaseUnavailableError,
+)
+
+CONFIG = Config(circuit_breaker_failure_threshold=2, circuit_breaker_reset_timeout=0)
+
+
+def test_circuit_breaker_states():
+    """Test that the breaker opens after repeated failures and admits one trial"""
+    breaker = CircuitBreaker()
+    config = CONFIG.copy(update={"circuit_breaker_reset_timeout": 60})
+    breaker.record_failure(config)
+    assert breaker.get_state(config) == CircuitState.CLOSED
+    breaker.record_failure(config)
+    assert breaker.get_state(config) == CircuitState.OPEN
+    assert not breaker.allow_request(config)
+
+    assert breaker.get_state(CONFIG) == CircuitState.HALF_OPEN
+    assert breaker.allow_request(CONFIG)
+    assert not breaker.allow_request(CONFIG)
+    breaker.record_success()
+    assert breaker.get_state(CONFIG) == CircuitState.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_protect_translates_connection_failures():
+    """Test that connection failures count as failures of the database"""
+    breaker = CircuitBreaker()
+
+    @breaker.protect()
+    async def query(config):  # pylint: disable=unused-argument
+        raise ServerSelectionTimeoutError("no servers")
+
+    for _ in range(2):
+        with pytest.raises(DatabaseUnavailableError):
+            await query(config=CONFIG)
+    assert breaker.get_state(CONFIG) == CircuitState.HALF_OPEN
+
+
+@pytest.mark.asyncio
+async def test_stale_result_is_served(monkeypatch):
+    """Test that cached results are served while the breaker is not closed"""
+    breaker = CircuitBreaker()
+    monkeypatch.setattr(search, "DATABASE_BREAKER", breaker)
+    monkeypatch.setattr(search, "RESULT_CACHE", ResultCache())
+    calls = []
+
+    async def search_documents(**kwargs):
+        calls.append(kwargs)
+        if breaker.get_state(CONFIG) != CircuitState.CLOSED:
+            raise DatabaseUnavailableError()
+        return {
+            "facets": [],
+            "facets_complete": True,
+            "count": 1,
+            "count_mode": "exact",
+            "count_complete": True,
+            "stale": False,
+            "hits": [],
+        }
+
+    monkeypatch.setattr(search, "_search_documents", search_documents)
+    result = await search.perform_search("Dataset", "cancer", config=CONFIG)
+    assert not result["stale"]
+
+    breaker.record_failure(CONFIG)
+    breaker.record_failure(CONFIG)
+    result = await search.perform_search("Dataset", " cancer ", config=CONFIG)
+    assert result["stale"] and result["count"] == 1
+    with pytest.raises(DatabaseUnavailableError):
+        await search.perform_search("Dataset", "other", config=CONFIG)
+
+
+def test_result_cache_serializes_results():
+    """Test that cached results are kept apart from the results of the callers"""
+    cache = ResultCache()
+    result: Dict[str, Any] = {
+        "stale": False,
+        "hits": [{"id": "1", "content": {"title": "A"}}],
+    }
+    cache.put("key", result, max_entries=10)
+    result["hits"][0]["content"].pop("title")
+
+    cached_result = cache.get("key")
+    assert cached_result == {
+        "stale": False,
+        "hits": [{"id": "1", "content": {"title": "A"}}],
+    }
+    cached_result["stale"] = True
+    assert cache.get("key") == {
+        "stale": False,
+        "hits": [{"id": "1", "content": {"title": "A"}}],
+    }
+
+    cache.put("key", {"hits": [{"id": ObjectId("0" * 24)}]}, max_entries=10)
+    assert cache.get("key") == {"hits": [{"id": "0" * 24}]}
+
+
+@pytest.mark.asyncio
+async def test_large_results_are_not_cached(monkeypatch):
+    """Test that results with many hits are not cached"""
+    cache = ResultCache()
+    monkeypatch.setattr(search, "RESULT_CACHE", cache)
+    config = CONFIG.copy(update={"result_cache_max_hits": 1})
+    result = {"facets_complete": True, "count_complete": True, "hits": [{}]}
+    search._cache_result("small", result, config)
+    search._cache_result("large", {**result, "hits": [{}, {}]}, config)
+    assert len(cache) == 1 and cache.get("small") is not None
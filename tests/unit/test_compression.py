@@ -0,0 +1,146 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the negotiated compression of responses"""
+
+import gzip
+from typing import List, Optional
+
+import pytest
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from metadata_search_service.api.compression import (
+    CompressionMiddleware,
+    get_compressor_factories,
+    negotiate_encoding,
+)
+from metadata_search_service.config import Config
+
+BODY = {"hits": [{"id": f"DS{i}", "title": "Some dataset"} for i in range(200)]}
+
+
+def make_client(**config_values) -> TestClient:
+    """Make a test client for an app with some compressible responses."""
+    app = FastAPI()
+    app.add_middleware(
+        CompressionMiddleware,  # type: ignore[arg-type, call-arg]
+        config=Config(**config_values),
+    )
+
+    @app.get("/large")
+    def large():
+        return JSONResponse(BODY, headers={"ETag": '"abc"'})
+
+    @app.get("/unchanged")
+    def unchanged():
+        return Response(status_code=304, headers={"ETag": '"abc"'})
+
+    @app.get("/small")
+    def small():
+        return JSONResponse({"count": 0})
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(
+            (b"chunk %d\n" % i * 200 for i in range(3)), media_type="text/plain"
+        )
+
+    @app.get("/encoded")
+    def encoded():
+        return PlainTextResponse(
+            gzip.compress(b"x" * 2000), headers={"Content-Encoding": "gzip"}
+        )
+
+    return TestClient(app)
+
+
+@pytest.mark.parametrize(
+    "accept_encoding,supported,expected",
+    [
+        (None, ["zstd", "br", "gzip"], None),
+        ("gzip, deflate", ["zstd", "br", "gzip"], "gzip"),
+        ("gzip, br", ["zstd", "br", "gzip"], "br"),
+        ("gzip;q=1.0, br;q=0.5", ["zstd", "br", "gzip"], "gzip"),
+        ("*", ["zstd", "br", "gzip"], "zstd"),
+        ("*, zstd;q=0", ["zstd", "br", "gzip"], "br"),
+        ("gzip;q=0", ["gzip"], None),
+        ("identity", ["gzip"], None),
+    ],
+)
+def test_negotiate_encoding(
+    accept_encoding: Optional[str], supported: List[str], expected: Optional[str]
+):
+    """Test choosing an encoding based on the Accept-Encoding header"""
+    assert negotiate_encoding(accept_encoding, supported) == expected
+
+
+@pytest.mark.parametrize("offload_min_size", [0, 1 << 30])
+def test_compress_large_response(offload_min_size: int):
+    """Test that large responses are compressed (in a thread or inline)"""
+    client = make_client(
+        compression_encodings=["gzip"], compression_offload_min_size=offload_min_size
+    )
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.headers["ETag"] == 'W/"abc"'
+    assert int(response.headers["Content-Length"]) < len(response.content)
+    assert response.json() == BODY
+
+
+def test_do_not_compress():
+    """Test that responses are not compressed when it does not pay off"""
+    client = make_client(compression_encodings=["gzip"])
+
+    response = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.headers["ETag"] == '"abc"'
+
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.json() == {"count": 0}
+
+    response = client.get("/unchanged", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == 'W/"abc"'
+
+    response = client.get("/encoded", headers={"Accept-Encoding": "gzip"})
+    assert response.content == b"x" * 2000
+
+
+def test_compress_streaming_response():
+    """Test that streamed responses are compressed chunk by chunk"""
+    client = make_client(compression_encodings=["gzip"])
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert response.text == "".join("chunk %d\n" % i * 200 for i in range(3))
+
+
+@pytest.mark.parametrize("encoding,module", [("br", "brotli"), ("zstd", "zstandard")])
+def test_optional_encodings(encoding: str, module: str):
+    """Test the compressors of encodings that need optional libraries"""
+    library = pytest.importorskip(module)
+    compressor = get_compressor_factories(Config())[encoding]()
+    data = compressor.compress(b"chunk " * 100) + compressor.flush()
+    data += compressor.compress(b"end") + compressor.finish()
+    if module == "brotli":
+        decompressed = library.decompress(data)
+    else:
+        decompressed = library.ZstdDecompressor().decompressobj().decompress(data)
+    assert decompressed == b"chunk " * 100 + b"end"
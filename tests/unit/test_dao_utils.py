@@ -0,0 +1,176 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the DAO utilities for building aggregation pipelines"""
+
+import pytest
+
+from metadata_search_service.dao.utils import (
+    Join,
+    build_aggregation_query,
+    build_batch_aggregation_query,
+    build_capped_count_query,
+    build_facet_value_query,
+    build_join_projection,
+    build_lookup_query,
+    plan_joins,
+    split_join_path,
+)
+from metadata_search_service.models import FilterOption
+
+
+@pytest.mark.parametrize(
+    "field,expected",
+    [
+        ("type", ((), "type")),
+        ("has_attribute.key", ((), "has_attribute.key")),
+        ("has_study.type", (("has_study",), "type")),
+        (
+            "has_study.has_project.alias",
+            (("has_study", "has_project"), "alias"),
+        ),
+        (
+            "has_study.has_attribute.value",
+            (("has_study",), "has_attribute.value"),
+        ),
+    ],
+)
+def test_split_join_path(field, expected):
+    """Test splitting a field into its join hops"""
+    assert split_join_path(field) == expected
+
+
+def test_plan_joins_merges_common_prefixes():
+    """Test that joins sharing a prefix are only planned once"""
+    fields = frozenset(
+        {"type", "has_study.type", "has_study.has_project.alias", "has_file.format"}
+    )
+    plan = plan_joins(fields)
+    assert plan == (
+        Join(field="has_file", collection="File", fields=frozenset({"format"})),
+        Join(
+            field="has_study",
+            collection="Study",
+            fields=frozenset({"type"}),
+            children=(
+                Join(
+                    field="has_project",
+                    collection="Project",
+                    fields=frozenset({"alias"}),
+                ),
+            ),
+        ),
+    )
+    assert plan_joins(fields) is plan
+    assert plan_joins(fields, embedded=True) == ()
+
+
+def test_build_lookup_query_multi_hop():
+    """Test that nested references result in projected, pipelined lookups"""
+    filters = [FilterOption(key="has_study.has_project.alias", value="NCT_MASTER")]
+    [lookup] = build_lookup_query(filters=filters, facet_fields={"has_study.type"})
+    assert lookup["from"] == "Study"
+    assert lookup["localField"] == "has_study"
+    assert lookup["foreignField"] == "id"
+    assert lookup["as"] == "has_study"
+    study_projection, project_lookup = lookup["pipeline"]
+    assert study_projection == {
+        "$project": {"_id": 0, "id": 1, "type": 1, "has_project": 1}
+    }
+    nested_lookup = project_lookup["$lookup"]
+    assert nested_lookup["from"] == "Project"
+    assert nested_lookup["localField"] == "has_project"
+    assert nested_lookup["pipeline"][0] == {"$project": {"_id": 0, "id": 1, "alias": 1}}
+
+
+def test_build_join_projection_path_collision():
+    """Test that overlapping paths are not projected twice"""
+    join = Join(
+        field="has_study",
+        collection="Study",
+        fields=frozenset({"has_attribute", "has_attribute.key"}),
+    )
+    assert build_join_projection(join) == {"_id": 0, "id": 1, "has_attribute": 1}
+
+
+@pytest.mark.parametrize(
+    "count,expected",
+    [(True, [{"$count": "total"}]), (False, None)],
+)
+def test_build_aggregation_query_count(count, expected):
+    """Test that counting can be skipped"""
+    pipelines = build_aggregation_query(count=count)
+    facet_query = pipelines[-2]["$facet"]
+    assert facet_query.get("metadata") == expected
+
+
+def test_build_aggregation_query_unpaginated():
+    """Test that only the ids of the hits are retrieved without pagination"""
+    pipelines = build_aggregation_query(limit=0)
+    assert pipelines[-2]["$facet"]["data"] == [
+        {"$sort": {"_id": 1}},
+        {"$project": {"_id": 0, "id": 1}},
+    ]
+
+
+def test_build_capped_count_query():
+    """Test that a capped count limits the hits outside of a $facet stage"""
+    query = build_capped_count_query(
+        100, search_query="cancer", filters=[FilterOption(key="type", value="a")]
+    )
+    assert query == [
+        {"$match": {"$text": {"$search": "cancer"}}},
+        {"$match": {"type": {"$in": ["a"]}}},
+        {"$limit": 100},
+        {"$count": "total"},
+    ]
+
+
+def test_build_batch_aggregation_query():
+    """Test that searches with different filters share the text search"""
+    query = build_batch_aggregation_query(
+        search_query="cancer",
+        branches=[
+            ([FilterOption(key="type", value="a")], {}),
+            (None, {"has_study": {"$in": ["S1"]}}),
+        ],
+        skip=0,
+        limit=5,
+        count_limit=100,
+    )
+    assert query[0] == {"$match": {"$text": {"$search": "cancer"}}}
+    facet_query = query[-1]["$facet"]
+    assert sorted(facet_query) == ["data_0", "data_1", "metadata_0", "metadata_1"]
+    assert facet_query["metadata_0"] == [
+        {"$match": {"type": {"$in": ["a"]}}},
+        {"$limit": 100},
+        {"$count": "total"},
+    ]
+    assert facet_query["data_1"][0] == {"$match": {"has_study": {"$in": ["S1"]}}}
+    assert facet_query["data_1"][-1] == {"$limit": 5}
+
+
+def test_build_facet_value_query():
+    """Test that only the given values of a facet are counted"""
+    query = build_facet_value_query(
+        "has_phenotypic_feature.concept_name",
+        ["Cancer"],
+        filters=[FilterOption(key="sex", value="female")],
+    )
+    assert query[0]["$lookup"]["from"] == "PhenotypicFeature"
+    assert query[1] == {"$match": {"sex": {"$in": ["female"]}}}
+    assert query[2] == {"$project": {"value": "$has_phenotypic_feature.concept_name"}}
+    assert {"$match": {"value": {"$in": ["Cancer"]}}} in query
+    assert list(query[-1]["$facet"]) == ["values"]
@@ -0,0 +1,75 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test cancelling request handling when the client disconnects"""
+
+import asyncio
+from types import SimpleNamespace
+from typing import cast
+
+import pytest
+from fastapi import Request
+
+from metadata_search_service.api.disconnect import (
+    ClientDisconnectedError,
+    cancel_on_disconnect,
+)
+
+
+class FakeRequest:
+    """Minimal stand-in for a request whose client disconnects"""
+
+    method = "POST"
+    url = SimpleNamespace(path="/rpc/search")
+
+    def __init__(self, disconnected: bool):
+        self.disconnected = disconnected
+
+    async def is_disconnected(self):
+        """Return whether the client disconnected"""
+        return self.disconnected
+
+
+def make_request(disconnected: bool) -> Request:
+    """Make a request whose client is (or is not) disconnected"""
+    return cast(Request, FakeRequest(disconnected))
+
+
+@pytest.mark.asyncio
+async def test_cancel_on_disconnect():
+    """Test that work is cancelled when the client disconnects"""
+    started = asyncio.Event()
+
+    async def work():
+        started.set()
+        await asyncio.sleep(10)
+
+    work_task = asyncio.ensure_future(work())
+    with pytest.raises(ClientDisconnectedError):
+        await cancel_on_disconnect(make_request(True), work_task, poll_interval=0.01)
+    assert started.is_set()
+    assert work_task.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_result_when_connected():
+    """Test that the result is returned while the client stays connected"""
+
+    async def work():
+        await asyncio.sleep(0.03)
+        return 42
+
+    result = await cancel_on_disconnect(make_request(False), work(), poll_interval=0.01)
+    assert result == 42
@@ -0,0 +1,117 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the execution of search queries in the DAO"""
+
+import pytest
+from pymongo.errors import ExecutionTimeout
+
+from metadata_search_service.dao.document import (
+    QueryTimeoutError,
+    _aggregate_hits_and_summary,
+    _get_capped_count,
+    get_documents_by_id,
+)
+from metadata_search_service.dao.utils import build_projection
+
+from .fixtures.mongo import FakeCollection
+
+
+@pytest.mark.asyncio
+async def test_hits_and_summary_in_one_aggregation():
+    """Test that hits and summary are retrieved with a single aggregation"""
+    collection = FakeCollection(
+        aggregations={"all": {"data": [{"id": "1"}], "metadata": []}}
+    )
+    results, complete = await _aggregate_hits_and_summary(
+        collection,
+        query=[{"name": "all"}],
+        hits_query=[{"name": "hits"}],
+        max_time_ms=100,
+    )
+    assert results == {"data": [{"id": "1"}], "metadata": []}
+    assert complete
+    assert [x["maxTimeMS"] for x in collection.options] == [100]
+
+
+@pytest.mark.asyncio
+async def test_summary_timeout_keeps_hits():
+    """Test that hits are returned when facets and count run out of time"""
+    collection = FakeCollection(
+        aggregations={
+            "all": ExecutionTimeout("timeout"),
+            "hits": {"data": [{"id": "1"}]},
+        }
+    )
+    results, complete = await _aggregate_hits_and_summary(
+        collection,
+        query=[{"name": "all"}],
+        hits_query=[{"name": "hits"}],
+        max_time_ms=100,
+    )
+    assert results == {"data": [{"id": "1"}]}
+    assert not complete
+    assert [x["maxTimeMS"] for x in collection.options] == [100, 100]
+
+
+@pytest.mark.asyncio
+async def test_hits_timeout_raises():
+    """Test that a timeout when retrieving the hits is raised"""
+    collection = FakeCollection(
+        aggregations={
+            "all": ExecutionTimeout("timeout"),
+            "hits": ExecutionTimeout("timeout"),
+        }
+    )
+    with pytest.raises(QueryTimeoutError):
+        await _aggregate_hits_and_summary(
+            collection,
+            query=[{"name": "all"}],
+            hits_query=[{"name": "hits"}],
+            max_time_ms=100,
+        )
+    with pytest.raises(QueryTimeoutError):
+        await _aggregate_hits_and_summary(
+            collection, query=[{"name": "hits"}], hits_query=None, max_time_ms=100
+        )
+
+
+@pytest.mark.asyncio
+async def test_get_capped_count():
+    """Test that a capped count that runs out of time is dropped"""
+    collection = FakeCollection(
+        aggregations={"count": {"total": 5}, "slow": ExecutionTimeout("timeout")}
+    )
+    assert await _get_capped_count(collection, [{"name": "count"}], 100) == 5
+    assert await _get_capped_count(collection, [{"name": "slow"}], 100) is None
+
+
+@pytest.mark.asyncio
+async def test_get_documents_by_id():
+    """Test that hits are hydrated in order with a single projected query"""
+    collection = FakeCollection(
+        [
+            {"_id": 1, "id": "1", "title": "A", "description": "long"},
+            {"_id": 2, "id": "2", "title": "B", "description": "long"},
+        ]
+    )
+    documents = await get_documents_by_id(
+        collection, ["2", "3", "1"], projection=build_projection(["title"])
+    )
+    assert documents == [{"id": "2", "title": "B"}, {"id": "1", "title": "A"}]
+    assert collection.options == [{"_id": 0, "title": 1, "id": 1}]
+
+    documents = await get_documents_by_id(collection, ["1"])
+    assert documents == [{"id": "1", "title": "A", "description": "long"}]
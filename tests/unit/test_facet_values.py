@@ -0,0 +1,91 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the search within the values of a facet"""
+
+from typing import Any, Dict
+
+import pytest
+
+from metadata_search_service.config import Config
+from metadata_search_service.core import facet_values
+from metadata_search_service.core.facet_values import (
+    FacetValueDictionary,
+    FacetValueStore,
+)
+from metadata_search_service.core.query import InvalidParameterError
+from metadata_search_service.models import FacetValueMatch, FilterOption
+
+COUNTS = {"Head and neck cancer": 3, "Healthy": 10, "lung cancer": 5, "Cancer": 1}
+
+
+def test_facet_value_dictionary():
+    """Test matching values by prefix and substring, ranked by count"""
+    dictionary = FacetValueDictionary(COUNTS)
+    assert dictionary.find("HEA", FacetValueMatch.PREFIX, limit=10) == [
+        ("Healthy", 10),
+        ("Head and neck cancer", 3),
+    ]
+    assert dictionary.find("cancer", FacetValueMatch.SUBSTRING, limit=2) == [
+        ("lung cancer", 5),
+        ("Head and neck cancer", 3),
+    ]
+    assert dictionary.find("", FacetValueMatch.PREFIX, limit=1) == [("Healthy", 10)]
+    assert not dictionary.find("x", FacetValueMatch.SUBSTRING, limit=10)
+
+
+@pytest.mark.asyncio
+async def test_search_facet_values(monkeypatch):
+    """Test that values are only counted in the store if the search is filtered"""
+    calls = []
+
+    async def get(self, document_type, field, config, max_time_ms=None):
+        return FacetValueDictionary(COUNTS)
+
+    async def count_facet_values(collection_name, field, values, **kwargs):
+        calls.append((values, kwargs))
+        return {"lung cancer": 1, "Cancer": 2}
+
+    monkeypatch.setattr(FacetValueStore, "get", get)
+    monkeypatch.setattr(facet_values, "count_facet_values", count_facet_values)
+    parameters: Dict[str, Any] = {
+        "document_type": "Individual",
+        "facet": "has_phenotypic_feature.concept_name",
+        "text": "can",
+        "match": FacetValueMatch.SUBSTRING,
+        "config": Config(),
+    }
+    facet_filter = FilterOption(key=parameters["facet"], value="Healthy")
+    result = await facet_values.search_facet_values(
+        filters=[facet_filter], **parameters
+    )
+    assert not calls
+    assert [x["count"] for x in result["options"]] == [5, 3, 1]
+
+    result = await facet_values.search_facet_values(
+        filters=[facet_filter, FilterOption(key="sex", value="female")], **parameters
+    )
+    [(values, kwargs)] = calls
+    assert values == ["lung cancer", "Head and neck cancer", "Cancer"]
+    assert kwargs["filters"] == [FilterOption(key="sex", value="female")]
+    assert result["options"] == [
+        {"option": "Cancer", "count": 2},
+        {"option": "lung cancer", "count": 1},
+    ]
+
+    with pytest.raises(InvalidParameterError):
+        await facet_values.search_facet_values(
+            document_type="Individual", facet="alias", config=Config()
+        )
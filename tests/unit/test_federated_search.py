@@ -0,0 +1,134 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test searching all types of documents or a batch of queries at once"""
+
+import asyncio
+
+import pytest
+
+from metadata_search_service.config import Config
+from metadata_search_service.core import search
+from metadata_search_service.dao.circuit_breaker import DatabaseUnavailableError
+from metadata_search_service.dao.db import get_db_client
+from metadata_search_service.dao.document import DocumentResults, QueryTimeoutError
+from metadata_search_service.models import (
+    CountMode,
+    DocumentType,
+    FilterOption,
+    SearchQuery,
+)
+
+
+def fake_search(delays, errors=None):
+    """Make a fake search with a delay (in seconds) and an error per type"""
+
+    async def perform_search(document_type, **kwargs):
+        await asyncio.sleep(delays.get(document_type, 0))
+        if errors and document_type in errors:
+            raise errors[document_type]
+        return {"count": 1, "count_mode": kwargs["count_mode"], "hits": []}
+
+    return perform_search
+
+
+@pytest.mark.asyncio
+async def test_federated_search(monkeypatch):
+    """Test that failures of single types of documents are reported"""
+    monkeypatch.setattr(
+        search,
+        "perform_search",
+        fake_search(
+            {"Dataset": 10}, errors={"Study": DatabaseUnavailableError("down")}
+        ),
+    )
+    result = await search.perform_federated_search(max_time_ms=100)
+    results = {x["document_type"]: x for x in result["results"]}
+    assert set(results) == {x.value for x in DocumentType}
+    assert results["File"]["count"] == 1
+    assert results["File"]["error"] is None
+    assert results["Study"]["error"] == "down"
+    assert results["Dataset"]["count_complete"] is False
+    assert "time budget" in results["Dataset"]["error"]
+
+
+@pytest.mark.asyncio
+async def test_federated_search_filters(monkeypatch):
+    """Test that types of documents to which filters do not apply are skipped"""
+    monkeypatch.setattr(search, "perform_search", fake_search({}))
+    result = await search.perform_federated_search(
+        filters=[FilterOption(key="format", value="bam")]
+    )
+    assert [x["document_type"] for x in result["results"]] == ["File"]
+
+
+@pytest.mark.asyncio
+async def test_federated_search_fails(monkeypatch):
+    """Test that an error is raised if the search failed for all types"""
+    monkeypatch.setattr(
+        search,
+        "perform_search",
+        fake_search({}, errors={x.value: QueryTimeoutError() for x in DocumentType}),
+    )
+    with pytest.raises(QueryTimeoutError):
+        await search.perform_federated_search()
+
+
+@pytest.mark.asyncio
+async def test_shared_db_client():
+    """Test that the database client is shared on the same event loop"""
+    config = Config(db_url="mongodb://localhost:27017")
+    client = await get_db_client(config)
+    assert await get_db_client(config) is client
+    other_config = config.copy(update={"db_url": "mongodb://localhost:27018"})
+    assert await get_db_client(other_config) is not client
+
+
+@pytest.mark.asyncio
+async def test_batch_search(monkeypatch):
+    """Test that queries with the same query string are run together"""
+    calls = []
+
+    async def get_documents_for_filters(search_query, filter_sets, **kwargs):
+        calls.append((search_query, filter_sets))
+        return [
+            DocumentResults(
+                docs=[{"id": str(len(x or []))}],
+                facets=[],
+                count=len(x or []),
+                count_mode=CountMode.EXACT,
+            )
+            for x in filter_sets
+        ]
+
+    monkeypatch.setattr(search, "get_documents_for_filters", get_documents_for_filters)
+    monkeypatch.setattr(search, "perform_search", fake_search({}))
+    type_filter = FilterOption(key="type", value="a")
+    queries = [
+        SearchQuery(query="cancer", filters=[type_filter]),
+        SearchQuery(query="other"),
+        SearchQuery(query=" cancer "),
+        SearchQuery(query="cancer", filters=[type_filter, type_filter]),
+    ]
+    result = await search.perform_batch_search("Dataset", queries)
+    assert [x["count"] for x in result["results"]] == [1, 1, 0, 1]
+    assert result["results"][0]["hits"][0]["id"] == "1"
+    assert calls == [("cancer", [[type_filter], None])]
+    assert await search.perform_batch_search("Dataset", []) == {"results": []}
+
+    with pytest.raises(search.BatchTooLargeError):
+        await search.perform_batch_search(
+            "Dataset", queries, config=Config(batch_search_max_queries=2)
+        )
@@ -0,0 +1,109 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test typo-tolerant matching with the trigram index"""
+
+import pytest
+
+from metadata_search_service.config import Config
+from metadata_search_service.core import fuzzy
+from metadata_search_service.core.fuzzy import (
+    FuzzyIndex,
+    FuzzyQueryError,
+    edit_distance,
+)
+from metadata_search_service.models import FilterOption, SearchQuery
+
+TEXTS = {
+    "D1": ["Head and neck cancer", "Study of tumours"],
+    "D2": ["Colorectal cancer"],
+    "D3": ["Healthy controls", "Cancel"],
+}
+
+
+@pytest.mark.parametrize(
+    "first,second,max_distance,expected",
+    [
+        ("cancer", "cancer", 2, 0),
+        ("cancer", "cnacer", 2, 1),
+        ("cancer", "canser", 2, 1),
+        ("cancer", "cance", 2, 1),
+        ("cancer", "dancers", 2, 2),
+        ("cancer", "control", 2, 3),
+        ("cancer", "c", 2, 3),
+    ],
+)
+def test_edit_distance(first, second, max_distance, expected):
+    """Test the edit distance counting transpositions as a single edit"""
+    assert edit_distance(first, second, max_distance) == expected
+
+
+def test_fuzzy_index():
+    """Test matching misspelled words"""
+    index = FuzzyIndex(TEXTS)
+    # equally similar words are ranked by the number of documents having them
+    assert index.match_word("cancek", max_expansions=10) == ["cancer", "cancel"]
+    assert index.match_word("cancek", max_expansions=1) == ["cancer"]
+    assert index.match_word("cnacer", max_expansions=10) == ["cancer"]
+    assert index.match_word("tumors", max_expansions=10) == ["tumours"]
+    # short terms have to match exactly
+    assert index.match_word("of", max_expansions=10) == ["of"]
+    assert not index.match_word("fo", max_expansions=10)
+    assert index.search("colorectl", max_expansions=10) == {"D2"}
+    assert index.search("helthy nek", max_expansions=10) == {"D1", "D3"}
+
+
+@pytest.mark.asyncio
+async def test_resolve_fuzzy_query(monkeypatch):
+    """Test that fuzzy queries are resolved to filters on the matching ids"""
+
+    async def get(config):
+        return {"Dataset": FuzzyIndex(TEXTS)}
+
+    monkeypatch.setattr(fuzzy.FUZZY_INDEXES, "get", get)
+    config = Config()
+    resolved = await fuzzy.resolve_fuzzy_query(
+        "Dataset", SearchQuery(query="cancr"), config
+    )
+    assert resolved == SearchQuery(
+        query="*",
+        filters=[FilterOption(key="id", value=x) for x in ["D1", "D2"]],
+    )
+    resolved = await fuzzy.resolve_fuzzy_query(
+        "Dataset",
+        SearchQuery(
+            query="cancr",
+            filters=[
+                FilterOption(key="id", value="D2"),
+                FilterOption(key="id", value="D4"),
+                FilterOption(key="type", value="a"),
+            ],
+        ),
+        config,
+    )
+    assert resolved == SearchQuery(
+        query="*",
+        filters=[
+            FilterOption(key="id", value="D2"),
+            FilterOption(key="type", value="a"),
+        ],
+    )
+    assert not await fuzzy.resolve_fuzzy_query(
+        "Dataset", SearchQuery(query="xyz"), config
+    )
+    with pytest.raises(FuzzyQueryError):
+        await fuzzy.resolve_fuzzy_query(
+            "Dataset", SearchQuery(query="cancr"), Config(fuzzy_max_ids=1)
+        )
@@ -0,0 +1,110 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the context of search hits highlighting the terms of the query"""
+
+import pytest
+
+from metadata_search_service.config import Config
+from metadata_search_service.core import search
+from metadata_search_service.core.highlight import (
+    Highlighter,
+    compile_matcher,
+    get_query_terms,
+    make_snippets,
+)
+from metadata_search_service.core.negative_cache import NegativeResultCache
+from metadata_search_service.dao.document import DocumentResults
+from metadata_search_service.models import ContentView, CountMode
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        ("*", ()),
+        ("Tumour  cancer -benign", ("tumour", "cancer")),
+        ('"head and  neck" neck', ("head and neck", "neck")),
+    ],
+)
+def test_get_query_terms(query, expected):
+    """Test that negated words are left out and phrases are kept"""
+    assert get_query_terms(query) == expected
+
+
+def test_make_snippets():
+    """Test that snippets are cut at whitespace and matches are marked"""
+    matcher = compile_matcher(("tumour", "cells"))
+    assert matcher is not None
+    text = "A study of " + "very " * 20 + "rare tumours & <b> cells " + "x " * 40
+    [snippet] = make_snippets(text, matcher, max_snippets=3, length=40)
+    assert snippet == (
+        "… very very rare <em>tumours</em> &amp; &lt;b&gt; <em>cells</em> x x …"
+    )
+    assert len(make_snippets("tumour " * 100, matcher, max_snippets=2, length=20)) == 2
+    assert not make_snippets("no match", matcher, max_snippets=2, length=20)
+
+
+def test_highlighter():
+    """Test that text fields retrieved only for highlighting are removed"""
+    config = Config(highlight_max_snippets=2)
+    highlighter = Highlighter("cancer", ["id", "type"], config)
+    assert highlighter.fetch_fields == [
+        "alias",
+        "description",
+        "id",
+        "name",
+        "title",
+        "type",
+    ]
+    document = {
+        "id": "D1",
+        "title": "Cancer study",
+        "description": "On cancer. And cancer.",
+        "type": "cancer",
+    }
+    context = highlighter.highlight(document)
+    assert context == "<em>Cancer</em> study <em>cancer</em>"
+    assert document == {"id": "D1", "type": "cancer"}
+
+    highlighter = Highlighter("*", None, config)
+    assert highlighter.fetch_fields is None
+    assert highlighter.highlight(document) is None
+
+
+@pytest.mark.asyncio
+async def test_search_with_context(monkeypatch):
+    """Test that hits of a search with the summary view get a context"""
+    calls = []
+
+    async def get_documents(**kwargs):
+        calls.append(kwargs)
+        document = {"id": "S1", "type": "cancer", "description": "A cancer study"}
+        return DocumentResults(
+            docs=[document], facets=[], count=1, count_mode=CountMode.EXACT
+        )
+
+    async def get_data_version(config):
+        return "1"
+
+    monkeypatch.setattr(search, "NEGATIVE_CACHE", NegativeResultCache())
+    monkeypatch.setattr(search, "get_documents", get_documents)
+    monkeypatch.setattr(search, "get_data_version", get_data_version)
+    result = await search.perform_search(
+        "Study", "cancer", view=ContentView.SUMMARY, highlight=True, config=Config()
+    )
+    assert "description" in calls[0]["fields"]
+    [hit] = result["hits"]
+    assert hit["context"] == "<em>cancer</em> A <em>cancer</em> study"
+    assert hit["content"] == {"id": "S1", "type": "cancer"}
@@ -0,0 +1,75 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the cache of queries without hits"""
+
+from typing import Any, Dict
+
+import pytest
+
+from metadata_search_service.config import Config
+from metadata_search_service.core import search
+from metadata_search_service.core.negative_cache import NegativeResultCache
+from metadata_search_service.core.utils import DEFAULT_FACET_FIELDS
+from metadata_search_service.dao.document import DocumentResults
+from metadata_search_service.models import CountMode, SearchQuery
+
+
+def test_negative_cache_versions():
+    """Test that the cache is cleared when the data version changes"""
+    cache = NegativeResultCache()
+    assert not cache.contains("ab" * 32, "1")
+    cache.add("ab" * 32, "1", max_entries=1)
+    assert cache.contains("ab" * 32, "1")
+    cache.add("cd" * 32, "1", max_entries=1)
+    assert not cache.contains("ab" * 32, "1")
+    assert cache.contains("cd" * 32, "1")
+    assert not cache.contains("cd" * 32, "2")
+    # results of queries that ran on an older version are ignored
+    cache.add("ef" * 32, "1", max_entries=1)
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_zero_hit_queries_are_cached(monkeypatch):
+    """Test that repeated queries without hits do not query the metadata store"""
+    calls = []
+
+    async def get_documents(**kwargs):
+        calls.append(kwargs)
+        return DocumentResults(docs=[], facets=[], count=0, count_mode=CountMode.EXACT)
+
+    async def get_data_version(config):
+        return "1"
+
+    monkeypatch.setattr(search, "NEGATIVE_CACHE", NegativeResultCache())
+    monkeypatch.setattr(search, "get_documents", get_documents)
+    monkeypatch.setattr(search, "get_data_version", get_data_version)
+    parameters: Dict[str, Any] = {
+        "document_type": "Dataset",
+        "search_query": SearchQuery(query="typo"),
+        "skip": 0,
+        "limit": 10,
+        "count_mode": CountMode.EXACT,
+        "max_time_ms": None,
+        "fields": None,
+        "config": Config(),
+    }
+    first = await search._search_documents(return_facets=False, **parameters)
+    second = await search._search_documents(return_facets=True, **parameters)
+    assert len(calls) == 1
+    assert first["count"] == second["count"] == 0
+    assert {x["key"] for x in second["facets"]} == DEFAULT_FACET_FIELDS["Dataset"]
+    assert all(not x["options"] for x in second["facets"])
@@ -0,0 +1,177 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the normalization and compilation of search queries"""
+
+import pytest
+
+from metadata_search_service.core.query import (
+    InvalidFieldError,
+    InvalidFilterError,
+    InvalidParameterError,
+    encode_search_parameters,
+    get_query_fingerprint,
+    get_search_etag,
+    normalize_fields,
+    normalize_search_query,
+    parse_fields_parameter,
+    parse_filter_parameter,
+    resolve_content_fields,
+    validate_filters,
+)
+from metadata_search_service.dao.utils import (
+    build_aggregation_query,
+    compile_aggregation_query,
+)
+from metadata_search_service.models import ContentView, FilterOption, SearchQuery
+
+
+def test_normalize_search_query():
+    """Test that logically equal queries are normalized identically"""
+    first = SearchQuery(
+        query="  head   and neck ",
+        filters=[
+            FilterOption(key="type", value="b"),
+            FilterOption(key="has_study.type", value="a"),
+            FilterOption(key="type", value="b"),
+        ],
+    )
+    second = SearchQuery(
+        query="head and neck",
+        filters=[
+            FilterOption(key="has_study.type", value="a"),
+            FilterOption(key="type", value="b"),
+        ],
+    )
+    assert normalize_search_query(first) == normalize_search_query(second)
+    assert normalize_search_query(first).filters == second.filters
+    assert normalize_search_query(SearchQuery(query=" ")).query == "*"
+    assert get_query_fingerprint(
+        "Dataset", normalize_search_query(first), skip=0
+    ) == get_query_fingerprint("Dataset", normalize_search_query(second), skip=0)
+    assert get_query_fingerprint(
+        "Dataset", normalize_search_query(first), skip=0
+    ) != get_query_fingerprint("Study", normalize_search_query(first), skip=0)
+
+
+def test_compile_aggregation_query():
+    """Test that compiled templates are reused and render any page"""
+    filters = [FilterOption(key="type", value="Exome sequencing")]
+    template = compile_aggregation_query(
+        search_query="cancer", filters=filters, facet_fields={"type"}
+    )
+    assert (
+        compile_aggregation_query(
+            search_query="cancer", filters=list(filters), facet_fields={"type"}
+        )
+        is template
+    )
+    assert template.render(skip=20, limit=5) == build_aggregation_query(
+        search_query="cancer",
+        filters=filters,
+        facet_fields={"type"},
+        skip=20,
+        limit=5,
+    )
+    template.render(skip=20, limit=5)[-2]["$facet"]["data"].clear()
+    assert template.render(skip=0, limit=10)[-2]["$facet"]["data"]
+
+
+def test_compile_aggregation_query_ids():
+    """Test that templates are shared by queries that differ in the ids only"""
+    type_filter = FilterOption(key="type", value="a")
+    first = compile_aggregation_query(
+        filters=[FilterOption(key="id", value="1"), type_filter],
+        reference_match={"has_study": {"$in": ["s1"]}},
+    )
+    second = compile_aggregation_query(
+        filters=[FilterOption(key="id", value="2"), type_filter],
+        reference_match={"has_study": {"$in": ["s2"]}},
+    )
+    assert first.stages is second.stages
+    assert first.render()[0] == {
+        "$match": {"has_study": {"$in": ["s1"]}, "id": {"$in": ["1"]}}
+    }
+    assert second.render()[0] == {
+        "$match": {"has_study": {"$in": ["s2"]}, "id": {"$in": ["2"]}}
+    }
+    assert second.render()[-3] == {"$match": {"type": {"$in": ["a"]}}}
+
+
+def test_validate_filters():
+    """Test that unknown filter keys are rejected with the allowed keys"""
+    validate_filters("Dataset", [FilterOption(key="has_study.type", value="a")])
+    with pytest.raises(InvalidFilterError) as error:
+        validate_filters(
+            "Dataset",
+            [
+                FilterOption(key="type", value="a"),
+                FilterOption(key="has_stuyd.type", value="a"),
+            ],
+        )
+    assert error.value.invalid_keys == ["has_stuyd.type"]
+    assert "has_study.type" in error.value.allowed_keys
+
+
+def test_filter_parameters():
+    """Test encoding filters as canonical query parameters"""
+    assert parse_filter_parameter("has_study.type:a:b") == FilterOption(
+        key="has_study.type", value="a:b"
+    )
+    with pytest.raises(InvalidParameterError):
+        parse_filter_parameter("type")
+    search_query = normalize_search_query(
+        SearchQuery(
+            query="cancer",
+            filters=[
+                parse_filter_parameter("type:b"),
+                parse_filter_parameter("has_study.type:a"),
+            ],
+        )
+    )
+    assert encode_search_parameters(search_query, skip=0, return_facets=True) == (
+        "return_facets=true&skip=0&query=cancer"
+        + "&filter=has_study.type%3Aa&filter=type%3Ab"
+    )
+
+
+def test_search_etag():
+    """Test that entity tags change with the data version"""
+    etag = get_search_etag("fingerprint", "1")
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == get_search_etag("fingerprint", "1")
+    assert etag != get_search_etag("fingerprint", "2")
+
+
+def test_content_fields():
+    """Test resolving the fields to include in the content of hits"""
+    assert normalize_fields([" title", "has_study.title", "has_study", "title"]) == [
+        "has_study",
+        "id",
+        "title",
+    ]
+    with pytest.raises(InvalidFieldError):
+        normalize_fields(["has_study..title"])
+    with pytest.raises(InvalidFieldError):
+        normalize_fields(["$where"])
+    assert parse_fields_parameter("title,,type") == ["title", "type"]
+    assert parse_fields_parameter(None) is None
+    assert resolve_content_fields("Dataset", ContentView.FULL) is None
+    summary_fields = resolve_content_fields("Dataset", ContentView.SUMMARY)
+    assert summary_fields is not None and "title" in summary_fields
+    assert resolve_content_fields("Dataset", ContentView.SUMMARY, ["type"]) == [
+        "id",
+        "type",
+    ]
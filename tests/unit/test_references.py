@@ -0,0 +1,90 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test resolving nested filters via the reference cache"""
+
+from typing import Dict, List
+
+import pytest
+
+from metadata_search_service.config import Config
+from metadata_search_service.dao.references import (
+    ReferenceCache,
+    get_field_values,
+    resolve_reference_filters,
+)
+from metadata_search_service.models import FilterOption
+
+from .fixtures.mongo import FakeClient
+
+COLLECTIONS: Dict[str, List[Dict]] = {
+    "Study": [
+        {"id": "S1", "type": "cancer_genomics", "has_project": "P1"},
+        {"id": "S2", "type": "cancer_genomics", "has_project": "P2"},
+        {"id": "S3", "type": "metagenomics", "has_project": ["P1", "P2"]},
+    ],
+    "Project": [
+        {"id": "P1", "alias": "NCT_MASTER"},
+        {"id": "P2", "alias": "OTHER"},
+    ],
+}
+
+
+def test_get_field_values():
+    """Test extracting values from nested documents and arrays"""
+    document = {
+        "has_attribute": [{"key": "a", "value": "1"}, {"key": "b", "value": ["2"]}]
+    }
+    assert get_field_values(document, "has_attribute.value") == ["1", "2"]
+    assert not get_field_values(document, "missing.value")
+
+
+@pytest.mark.asyncio
+async def test_resolve_reference_filters(monkeypatch):
+    """Test that nested filters are replaced by matches on referenced ids"""
+    monkeypatch.setattr(
+        "metadata_search_service.dao.references.REFERENCE_CACHE", ReferenceCache()
+    )
+    filters = [
+        FilterOption(key="type", value="Exome sequencing"),
+        FilterOption(key="has_study.type", value="cancer_genomics"),
+        FilterOption(key="has_study.has_project.alias", value="NCT_MASTER"),
+    ]
+    remaining, match_query = await resolve_reference_filters(
+        FakeClient(COLLECTIONS),
+        filters=filters,
+        version="1",
+        config=Config(db_name="test"),
+    )
+    assert remaining == filters[:1]
+    assert match_query == {
+        "$and": [
+            {"has_study": {"$in": ["S1", "S2"]}},
+            {"has_study": {"$in": ["S1", "S3"]}},
+        ]
+    }
+
+
+@pytest.mark.asyncio
+async def test_reference_cache_is_bounded():
+    """Test that collections exceeding the cache size are not cached"""
+    cache = ReferenceCache()
+    config = Config(db_name="test", reference_cache_max_entries=2)
+    assert await cache.get_table(FakeClient(COLLECTIONS), "Study", "1", config) is None
+    assert (
+        await cache.get_table(FakeClient(COLLECTIONS), "Project", "1", config)
+        is not None
+    )
+    assert cache.size == 2
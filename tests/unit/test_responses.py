@@ -0,0 +1,147 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the fast serialization of trusted responses"""
+
+import json
+from decimal import Decimal
+from typing import Any, Dict
+
+import pytest
+from bson import Decimal128, ObjectId
+
+from metadata_search_service.api.responses import (
+    ARROW_STREAM_MEDIA_TYPE,
+    JSON_MEDIA_TYPE,
+    MSGPACK_MEDIA_TYPE,
+    ArrowStreamResponse,
+    MessagePackResponse,
+    TrustedJSONResponse,
+    dump_json,
+    flatten_document,
+    negotiate_media_type,
+    stream_json_result,
+)
+
+RESULT: Dict[str, Any] = {
+    "facets": [],
+    "count": 2,
+    "hits": [
+        {
+            "document_type": "Dataset",
+            "id": "DS1",
+            "context": None,
+            "content": {"id": "DS1", "title": "A", "has_study": {"type": "x"}},
+        },
+        {
+            "document_type": "Dataset",
+            "id": "DS2",
+            "context": None,
+            "content": {"id": "DS2", "title": 2},
+        },
+    ],
+}
+
+
+def test_dump_json_encodes_bson_types():
+    """Test that BSON types in raw documents are serialized"""
+    object_id = ObjectId()
+    content = {
+        "_id": object_id,
+        "size": Decimal128(Decimal("1.5")),
+        "tags": {"a"},
+        1: "non-string key",
+    }
+    assert json.loads(dump_json(content)) == {
+        "_id": str(object_id),
+        "size": "1.5",
+        "tags": ["a"],
+        "1": "non-string key",
+    }
+
+
+def test_dump_json_rejects_unknown_types():
+    """Test that unsupported types are not silently serialized"""
+    with pytest.raises(TypeError):
+        dump_json({"value": object()})
+
+
+def test_trusted_response():
+    """Test that a trusted response renders JSON with the correct headers"""
+    response = TrustedJSONResponse({"count": 1, "hits": []})
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == {"count": 1, "hits": []}
+
+
+@pytest.mark.parametrize(
+    "accept,expected",
+    [
+        (None, JSON_MEDIA_TYPE),
+        ("*/*", JSON_MEDIA_TYPE),
+        ("application/msgpack", MSGPACK_MEDIA_TYPE),
+        ("application/json;q=0.5, application/msgpack", MSGPACK_MEDIA_TYPE),
+        ("application/*;q=0.1, application/json;q=0", MSGPACK_MEDIA_TYPE),
+        ("text/html", JSON_MEDIA_TYPE),
+    ],
+)
+def test_negotiate_media_type(accept, expected):
+    """Test choosing the format of a response based on the Accept header"""
+    supported = [JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, ARROW_STREAM_MEDIA_TYPE]
+    assert negotiate_media_type(accept, supported) == expected
+
+
+def test_flatten_document():
+    """Test flattening nested documents for columnar formats"""
+    assert flatten_document({"a": 1, "b": {"c": {"d": 2}, "e": [{"f": 3}]}}) == {
+        "a": 1,
+        "b.c.d": 2,
+        "b.e": [{"f": 3}],
+    }
+
+
+def test_message_pack_response():
+    """Test rendering a search result as MessagePack"""
+    msgpack = pytest.importorskip("msgpack")
+    response = MessagePackResponse(RESULT)
+    assert msgpack.unpackb(response.body) == RESULT
+
+
+def test_arrow_stream_response():
+    """Test rendering a search result as Arrow IPC stream"""
+    pyarrow = pytest.importorskip("pyarrow")
+    response = ArrowStreamResponse(RESULT)
+    table = pyarrow.ipc.open_stream(response.body).read_all()
+    assert table.column_names == ["document_type", "id", "title", "has_study.type"]
+    assert table.column("title").to_pylist() == ["A", "2"]
+    assert table.column("has_study.type").to_pylist() == ["x", None]
+    assert json.loads(table.schema.metadata[b"count"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_stream_json_result():
+    """Test that streamed results are valid JSON, with the hits last"""
+
+    async def hit_batches():
+        yield RESULT["hits"][:1]
+        yield []
+        yield RESULT["hits"][1:]
+
+    summary = {key: value for key, value in RESULT.items() if key != "hits"}
+    chunks = [x async for x in stream_json_result(summary, hit_batches())]
+    assert chunks[0].startswith(b'{"facets":[],"count":2,"hits":[')
+    assert json.loads(b"".join(chunks)) == RESULT
+
+    chunks = [x async for x in stream_json_result({}, hit_batches())]
+    assert json.loads(b"".join(chunks)) == {"hits": RESULT["hits"]}
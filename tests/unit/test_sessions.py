@@ -0,0 +1,141 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test search sessions for cheap and consistent paging"""
+
+import pytest
+
+from metadata_search_service.config import Config
+from metadata_search_service.core import search
+from metadata_search_service.core.sessions import SessionNotFoundError, SessionStore
+
+
+def test_session_store_expiry():
+    """Test that sessions expire after their time to live"""
+    store = SessionStore()
+    session_id = store.create("Dataset", ["1"], {}, None, ttl=0, max_ids=10)
+    assert session_id is not None
+    with pytest.raises(SessionNotFoundError):
+        store.get(session_id, ttl=0)
+    assert len(store) == 0
+
+
+def test_session_store_memory_cap():
+    """Test that the least recently used sessions are evicted first"""
+    store = SessionStore()
+    first = store.create("Dataset", ["1", "2"], {}, None, ttl=60, max_ids=4)
+    second = store.create("Dataset", ["3", "4"], {}, None, ttl=60, max_ids=4)
+    assert first is not None and second is not None
+    store.get(first, ttl=60)
+    third = store.create("Dataset", ["5"], {}, None, ttl=60, max_ids=4)
+    assert third is not None
+    assert store.size == 3
+    assert store.get(first, ttl=60).document_ids == ["1", "2"]
+    assert store.get(third, ttl=60).document_ids == ["5"]
+    with pytest.raises(SessionNotFoundError):
+        store.get(second, ttl=60)
+    assert store.create("Dataset", ["1"] * 5, {}, None, ttl=60, max_ids=4) is None
+
+
+@pytest.mark.asyncio
+async def test_session_paging(monkeypatch):
+    """Test that pages are sliced from the session and only they are hydrated"""
+    hydrated = []
+
+    async def perform_search(document_type, **kwargs):
+        return {"facets": [], "count": 5, "stale": False, "hits": []}
+
+    async def get_document_ids(document_type, **kwargs):
+        return ["1", "2", "3", "4", "5"]
+
+    async def get_documents_by_ids(document_type, document_ids, fields, config):
+        hydrated.append(document_ids)
+        return [{"id": x} for x in document_ids]
+
+    monkeypatch.setattr(search, "perform_search", perform_search)
+    monkeypatch.setattr(search, "get_document_ids", get_document_ids)
+    monkeypatch.setattr(search, "get_documents_by_ids", get_documents_by_ids)
+    config = Config()
+    result = await search.create_search_session("Dataset", config=config)
+    assert result["session_id"] is not None
+
+    page = await search.get_session_page(
+        result["session_id"], skip=2, limit=2, config=config
+    )
+    assert [x["id"] for x in page["hits"]] == ["3", "4"]
+    assert page["count"] == 5
+    assert hydrated == [["3", "4"]]
+
+
+@pytest.mark.asyncio
+async def test_session_paging_highlight(monkeypatch):
+    """Test that all pages of a highlighted session are highlighted"""
+    fetched = []
+
+    async def perform_search(document_type, **kwargs):
+        return {"facets": [], "count": 2, "stale": False, "hits": []}
+
+    async def get_document_ids(document_type, **kwargs):
+        return ["1", "2"]
+
+    async def get_documents_by_ids(document_type, document_ids, fields, config):
+        fetched.append(fields)
+        return [{"id": x, "title": f"Tumour study {x}"} for x in document_ids]
+
+    monkeypatch.setattr(search, "perform_search", perform_search)
+    monkeypatch.setattr(search, "get_document_ids", get_document_ids)
+    monkeypatch.setattr(search, "get_documents_by_ids", get_documents_by_ids)
+    config = Config()
+    result = await search.create_search_session(
+        "Dataset", "tumour", fields=["id"], highlight=True, config=config
+    )
+
+    page = await search.get_session_page(
+        result["session_id"], skip=1, limit=1, config=config
+    )
+    [hit] = page["hits"]
+    assert hit["context"] == "<em>Tumour</em> study 2"
+    assert hit["content"] == {"id": "2"}
+    assert "title" in fetched[0]
+
+
+@pytest.mark.asyncio
+async def test_session_streaming(monkeypatch):
+    """Test that the hits of a streamed page are retrieved in batches"""
+
+    async def perform_search(document_type, **kwargs):
+        return {"facets": [], "count": 5, "stale": False, "hits": []}
+
+    async def get_document_ids(document_type, **kwargs):
+        return ["1", "2", "3", "4", "5"]
+
+    async def iter_documents_by_id(document_type, document_ids, batch_size, **kwargs):
+        for index in range(0, len(document_ids), batch_size):
+            yield [{"id": x} for x in document_ids[index : index + batch_size]]
+
+    monkeypatch.setattr(search, "perform_search", perform_search)
+    monkeypatch.setattr(search, "get_document_ids", get_document_ids)
+    monkeypatch.setattr(search, "iter_documents_by_id", iter_documents_by_id)
+    config = Config(hydration_batch_size=2)
+    result = await search.create_search_session("Dataset", config=config)
+
+    summary, hit_batches = await search.stream_session_page(
+        result["session_id"], skip=1, limit=0, config=config
+    )
+    assert summary["count"] == 5 and summary["session_id"] == result["session_id"]
+    assert [[x["id"] for x in batch] async for batch in hit_batches] == [
+        ["2", "3"],
+        ["4", "5"],
+    ]
@@ -0,0 +1,119 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test suggestions from the in-memory prefix index"""
+
+import asyncio
+
+import pytest
+
+from metadata_search_service.config import Config
+from metadata_search_service.core import versioned
+from metadata_search_service.core.suggest import SuggestIndex, Term
+from metadata_search_service.core.versioned import VersionedIndex
+from metadata_search_service.dao.document import QueryTimeoutError
+
+TERMS = [
+    Term(
+        "Head and Neck Cancer", "has_phenotypic_feature.concept_name", "Individual", 7
+    ),
+    Term("Healthy", "has_phenotypic_feature.concept_name", "Individual", 20),
+    Term("EGAS00001000001", "ega_accession", "Study", 1),
+    Term("EGAS00001000002", "has_study.ega_accession", "Dataset", 3),
+    Term("Study of  head tissue", "title", "Study", 1),
+]
+
+
+def test_suggest_index():
+    """Test prefix matching, ranking and filtering of suggestions"""
+    index = SuggestIndex(TERMS)
+    assert [x.text for x in index.suggest("HEA", limit=10)] == [
+        "Healthy",
+        "Head and Neck Cancer",
+        "Study of  head tissue",
+    ]
+    assert [x.text for x in index.suggest("head", limit=1)] == ["Head and Neck Cancer"]
+    assert [x.text for x in index.suggest("neck c", limit=10)] == [
+        "Head and Neck Cancer"
+    ]
+    # identifiers are only matched from their start
+    assert not index.suggest("00001", limit=10)
+    assert [
+        x.document_type for x in index.suggest("egas", limit=10, document_type="Study")
+    ] == ["Study"]
+    assert not index.suggest("  ", limit=10)
+    assert len(index.suggest("e", limit=10, max_scan=2)) == 2
+
+
+def test_suggest_frequent_prefix():
+    """Test that frequent terms are found for prefixes matching many entries"""
+    terms = [Term(f"Sample {number:03}", "title", "Sample", 1) for number in range(50)]
+    terms.append(Term("Study of samples", "title", "Study", 9))
+    terms.append(Term("Sanger sequencing", "type", "Experiment", 5))
+    index = SuggestIndex(terms)
+    expected = ["Study of samples", "Sanger sequencing"]
+    for _ in range(2):
+        assert [x.text for x in index.suggest("s", limit=2, max_scan=10)] == expected
+    assert [
+        x.text
+        for x in index.suggest("sa", limit=2, document_type="Experiment", max_scan=10)
+    ] == ["Sanger sequencing"]
+
+
+@pytest.mark.asyncio
+async def test_suggest_index_rebuilt_on_data_change(monkeypatch):
+    """Test that the index is rebuilt when the data version changes"""
+    versions = ["1"]
+    builds = []
+
+    async def get_data_version(config):
+        return versions[-1]
+
+    async def build_suggest_index(config):
+        builds.append(versions[-1])
+        return SuggestIndex(TERMS[: len(builds)])
+
+    monkeypatch.setattr(versioned, "get_data_version", get_data_version)
+    manager = VersionedIndex(build_suggest_index, name="suggest index")
+    config = Config()
+    assert len(await manager.get(config)) == 1
+    assert len(await manager.get(config)) == 1
+    versions.append("2")
+    # the previous index is served while the new one is built
+    assert len(await manager.get(config)) == 1
+    await asyncio.sleep(0)
+    assert len(await manager.get(config)) == 2
+    assert builds == ["1", "2"]
+
+
+@pytest.mark.asyncio
+async def test_suggest_index_build_time_budget(monkeypatch):
+    """Test that a slow first build times out but continues in the background"""
+    built = asyncio.Event()
+
+    async def get_data_version(config):
+        return "1"
+
+    async def build_suggest_index(config):
+        await built.wait()
+        return SuggestIndex(TERMS)
+
+    monkeypatch.setattr(versioned, "get_data_version", get_data_version)
+    manager = VersionedIndex(build_suggest_index, name="suggest index")
+    config = Config()
+    with pytest.raises(QueryTimeoutError):
+        await manager.get(config, max_time_ms=10)
+    built.set()
+    assert len(await manager.get(config, max_time_ms=1000)) == len(TERMS)
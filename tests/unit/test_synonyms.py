@@ -0,0 +1,103 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the expansion of queries with synonyms"""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from metadata_search_service.api import main
+from metadata_search_service.api.deps import get_config
+from metadata_search_service.config import Config
+from metadata_search_service.core.query import normalize_search_query
+from metadata_search_service.core.synonyms import SYNONYMS, SynonymTable, load_synonyms
+from metadata_search_service.models import FilterOption, SearchQuery
+
+GROUPS = [
+    ["Head and neck cancer", "HNC", "Head and neck squamous cell carcinoma"],
+    ["neck", "cervix"],
+    ["tumour", "tumor"],
+]
+CONCEPT_NAME = "has_phenotypic_feature.concept_name"
+
+
+def test_expand_query():
+    """Test that the longest terms are expanded, only once"""
+    table = SynonymTable(GROUPS)
+    expanded = table.expand_query("head and neck cancer tumour")
+    assert expanded == (
+        "head and neck cancer tumour HNC Head and neck squamous cell carcinoma tumor"
+    )
+    assert table.expand_query(expanded) == expanded
+    assert table.expand_query("stiff neck") == "stiff neck cervix"
+    assert table.expand_query('"stiff neck"') == '"stiff neck"'
+    assert table.expand_query("*") == "*"
+
+
+def test_expand_filters():
+    """Test that only filters on concept names are expanded"""
+    table = SynonymTable(GROUPS)
+    expanded = table.expand_filters(
+        [
+            FilterOption(key=CONCEPT_NAME, value="hnc"),
+            FilterOption(key="type", value="tumour"),
+        ]
+    )
+    assert [x.value for x in expanded] == [
+        "hnc",
+        "Head and neck cancer",
+        "HNC",
+        "Head and neck squamous cell carcinoma",
+        "tumour",
+    ]
+
+
+def test_load_synonyms(tmp_path):
+    """Test that the loaded synonyms are used when normalizing queries"""
+    synonyms_file = tmp_path / "synonyms.json"
+    synonyms_file.write_text(json.dumps(GROUPS), encoding="utf8")
+    try:
+        load_synonyms(Config(synonyms_file=str(synonyms_file)))
+        assert len(SYNONYMS) == 3
+        query = normalize_search_query(
+            SearchQuery(
+                query=" Tumor ", filters=[FilterOption(key=CONCEPT_NAME, value="neck")]
+            )
+        )
+        assert query.query == "Tumor tumour"
+        assert [x.value for x in query.filters or []] == ["cervix", "neck"]
+
+        synonyms_file.write_text(json.dumps({"neck": "cervix"}), encoding="utf8")
+        with pytest.raises(ValueError):
+            load_synonyms(Config(synonyms_file=str(synonyms_file)))
+    finally:
+        load_synonyms(Config())
+    assert not SYNONYMS
+
+
+def test_synonyms_are_loaded_on_startup(tmp_path):
+    """Test that the app loads the synonyms file of the effective config"""
+    synonyms_file = tmp_path / "synonyms.json"
+    synonyms_file.write_text(json.dumps(GROUPS), encoding="utf8")
+    config = Config(synonyms_file=str(synonyms_file))
+    main.app.dependency_overrides[get_config] = lambda: config
+    try:
+        with TestClient(main.app):
+            assert len(SYNONYMS) == 3
+    finally:
+        del main.app.dependency_overrides[get_config]
+        load_synonyms(Config())
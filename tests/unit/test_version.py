@@ -0,0 +1,80 @@
+# Copyright 2021 - 2023 Universität Tübingen, DKFZ, EMBL, and Universität zu Köln
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test tracking of the data version"""
+
+import asyncio
+
+import pytest
+from pymongo.errors import ConnectionFailure
+
+from metadata_search_service.config import Config
+from metadata_search_service.dao import version
+from metadata_search_service.dao.circuit_breaker import DatabaseUnavailableError
+from metadata_search_service.dao.version import DataVersionTracker
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_recomputation(monkeypatch):
+    """Test that the data version is computed once for concurrent requests"""
+    calls = []
+
+    async def compute_data_version(client, db_name, update_field=None):
+        calls.append(update_field)
+        await asyncio.sleep(0.01)
+        return f"v{len(calls)}"
+
+    async def get_db_client(config):
+        return None
+
+    monkeypatch.setattr(version, "compute_data_version", compute_data_version)
+    monkeypatch.setattr(version, "get_db_client", get_db_client)
+    config = Config(data_version_update_field="updated_at")
+    tracker = DataVersionTracker()
+
+    versions = await asyncio.gather(*(tracker.get(config) for _ in range(10)))
+    assert versions == ["v1"] * 10
+    assert calls == ["updated_at"]
+
+    assert await tracker.get(config) == "v1"
+    tracker.invalidate()
+    assert await tracker.get(config) == "v2"
+
+
+@pytest.mark.asyncio
+async def test_last_known_version_is_kept(monkeypatch):
+    """Test that the last known version is used if the store is unavailable"""
+    available = True
+
+    async def compute_data_version(client, db_name, update_field=None):
+        if not available:
+            raise ConnectionFailure("down")
+        return "v1"
+
+    async def get_db_client(config):
+        return None
+
+    monkeypatch.setattr(version, "compute_data_version", compute_data_version)
+    monkeypatch.setattr(version, "get_db_client", get_db_client)
+    config = Config(data_version_refresh_interval=0)
+
+    tracker = DataVersionTracker()
+    available = False
+    with pytest.raises(DatabaseUnavailableError):
+        await tracker.get(config)
+    available = True
+    assert await tracker.get(config) == "v1"
+    available = False
+    assert await tracker.get(config) == "v1"